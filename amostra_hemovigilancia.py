@@ -0,0 +1,128 @@
+"""
+Respostas aproximadas a partir de uma amostra estratificada do snapshot.
+
+Os estratos são UF x ano. De cada estrato com N linhas entram
+n = min(N, max(MINIMO_POR_ESTRATO, ceil(FRACAO_AMOSTRA * N))) linhas,
+sorteadas sem reposição com semente fixa. Uma contagem de qualquer seleção
+é estimada somando N/n por linha da amostra que casa com ela
+(Horvitz-Thompson), com a variância da amostragem estratificada:
+
+    Var = soma_h N_h² (1 - n_h/N_h) p_h (1 - p_h) / (n_h - 1)
+
+onde p_h é a fração da amostra do estrato h dentro da seleção. Razões
+(percentual de anomalias) usam linearização. As margens são de Z_CONFIANCA
+desvios (95%). Seleções que só cortam UF e ano pegam estratos inteiros e
+saem com margem zero.
+"""
+
+import numpy as np
+import pandas as pd
+
+COLUNAS_ESTRATO = ('UF_NOTIFICACAO', 'ANO')
+FRACAO_AMOSTRA = 0.05
+MINIMO_POR_ESTRATO = 30
+SEMENTE_AMOSTRA = 42
+CONFIANCA = 0.95
+Z_CONFIANCA = 1.96
+
+
+def construir_amostra(df, fracao=FRACAO_AMOSTRA, minimo=MINIMO_POR_ESTRATO, semente=SEMENTE_AMOSTRA):
+    """Amostra estratificada por UF x ano; None sem as colunas dos estratos.
+
+    Devolve as posições sorteadas em `df`, as linhas (`df`), o estrato de cada
+    linha da amostra e os tamanhos N (população) e n (amostra) por estrato.
+    """
+    if not set(COLUNAS_ESTRATO) <= set(df.columns) or df.empty:
+        return None
+    codigo = np.zeros(len(df), dtype=np.int64)
+    for coluna in COLUNAS_ESTRATO:
+        codigos, unicos = pd.factorize(df[coluna], use_na_sentinel=False)
+        codigo = codigo * len(unicos) + codigos
+    estrato, _ = pd.factorize(codigo)
+    populacao = np.bincount(estrato)
+    tamanho = np.minimum(populacao, np.maximum(minimo, np.ceil(fracao * populacao))).astype(np.int64)
+
+    # Ordena por estrato e, dentro dele, por uma chave aleatória: as n primeiras de cada estrato entram.
+    ordem = np.lexsort((np.random.default_rng(semente).random(len(df)), estrato))
+    inicio = np.concatenate(([0], np.cumsum(populacao)[:-1]))
+    posicao_no_estrato = np.arange(len(df)) - inicio[estrato[ordem]]
+    posicoes = np.sort(ordem[posicao_no_estrato < tamanho[estrato[ordem]]])
+    return {
+        'posicoes': posicoes,
+        'df': df.iloc[posicoes],
+        'estrato': estrato[posicoes],
+        'populacao': populacao,
+        'tamanho': tamanho,
+    }
+
+
+def estimar_contagens(amostra, mascara, grupos=None, n_grupos=1):
+    """Contagem estimada das linhas da seleção (`mascara` sobre a amostra) e margem de erro, por grupo.
+
+    `grupos` é o código do grupo (0..n_grupos-1) de cada linha da amostra.
+    """
+    populacao, tamanho = amostra['populacao'], amostra['tamanho']
+    n_estratos = len(populacao)
+    grupos = np.zeros(len(mascara), dtype=np.int64) if grupos is None else np.asarray(grupos, dtype=np.int64)
+    casadas = np.bincount(grupos[mascara] * n_estratos + amostra['estrato'][mascara],
+                          minlength=n_grupos * n_estratos).reshape(n_grupos, n_estratos)
+    estimativa = (casadas * (populacao / tamanho)).sum(axis=1)
+    p = casadas / tamanho
+    variancia = populacao ** 2 * (1 - tamanho / populacao) * p * (1 - p) / np.maximum(tamanho - 1, 1)
+    return estimativa, Z_CONFIANCA * np.sqrt(variancia.sum(axis=1))
+
+
+def estimar_razao(amostra, mascara, numerador):
+    """Fração estimada das linhas da seleção que atendem `numerador`, com margem de erro."""
+    total = estimar_contagens(amostra, mascara)[0][0]
+    if total <= 0:
+        return 0.0, 0.0
+    razao = estimar_contagens(amostra, mascara & numerador)[0][0] / total
+    # Variável linearizada da razão, zero fora da seleção.
+    d = np.where(mascara, numerador.astype(float) - razao, 0.0)
+    n_estratos = len(amostra['populacao'])
+    soma = np.bincount(amostra['estrato'], d, minlength=n_estratos)
+    soma_quadrados = np.bincount(amostra['estrato'], d ** 2, minlength=n_estratos)
+    populacao, tamanho = amostra['populacao'], amostra['tamanho']
+    s2 = (soma_quadrados - soma ** 2 / tamanho) / np.maximum(tamanho - 1, 1)
+    variancia = (populacao ** 2 * (1 - tamanho / populacao) * s2 / tamanho).sum() / total ** 2
+    return float(razao), float(Z_CONFIANCA * np.sqrt(variancia))
+
+
+def _intervalo(valor, margem, casas=0):
+    return [round(max(valor - margem, 0), casas), round(valor + margem, casas)]
+
+
+def metricas_estimadas(amostra, mascara, anomalia, limiar=None):
+    """Métricas do painel estimadas da amostra, com intervalos de confiança.
+
+    `anomalia` marca as linhas da amostra contadas como anômalas.
+    """
+    total, margem_total = (v[0] for v in estimar_contagens(amostra, mascara))
+    anomalias, margem_anomalias = (v[0] for v in estimar_contagens(amostra, mascara & anomalia))
+    razao, margem_razao = estimar_razao(amostra, mascara, anomalia)
+    return {
+        'total_notificacoes': int(round(total)),
+        'total_anomalias': int(round(anomalias)),
+        'perc_anomalias': round(razao * 100, 2),
+        'limiar': limiar,
+        'aproximado': True,
+        'confianca': CONFIANCA,
+        'amostra': int(mascara.sum()),
+        'intervalos': {
+            'total_notificacoes': _intervalo(total, margem_total),
+            'total_anomalias': _intervalo(anomalias, margem_anomalias),
+            'perc_anomalias': _intervalo(razao * 100, margem_razao * 100, 2),
+        },
+    }
+
+
+def contagens_estimadas(amostra, mascara, coluna):
+    """Contagem estimada por valor da coluna na seleção: DataFrame [coluna, estimativa, erro]."""
+    if coluna not in amostra['df'].columns:
+        return None
+    codigos, valores = pd.factorize(amostra['df'][coluna])
+    validas = mascara & (codigos >= 0)
+    estimativa, erro = estimar_contagens(amostra, validas, np.where(codigos >= 0, codigos, 0), len(valores))
+    resultado = pd.DataFrame({coluna: np.asarray(valores), 'estimativa': estimativa.round(), 'erro': erro.round(1)})
+    return resultado[resultado['estimativa'] > 0]
@@ -1,14 +1,17 @@
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier, IsolationForest
-from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
+from sklearn.ensemble import IsolationForest
+
+from modelo_risco_hemovigilancia import montar_conjunto_risco, treinar_modelo_risco, salvar_modelo_risco
+from esquema_hemovigilancia import ESQUEMA_COLUNAS, ler_csv
+from anonimato_hemovigilancia import analisar_k_anonimato, imprimir_k_anonimato
+from graficos_hemovigilancia import figura_ausentes, figura_barras, figura_contagens, figura_histograma, renderizar_figuras
+from qualidade_hemovigilancia import avaliar_bloco, montar_relatorio, imprimir_relatorio, salvar_relatorio_qualidade
+
 def carregar_dados(file_path):
     
     try:
-        df = pd.read_csv(file_path, sep=';', encoding='ISO-8859-1')
+        df = ler_csv(file_path, colunas=list(ESQUEMA_COLUNAS))
         print("Dados carregados com sucesso!")
         print(f"Número de linhas: {df.shape[0]}")
         print(f"Número de colunas: {df.shape[1]}")
@@ -19,7 +22,14 @@ def carregar_dados(file_path):
     except Exception as e:
         print(f"Ocorreu um erro ao carregar o arquivo: {e}")
         return None
-def analise_exploratoria(df):
+def _renderizar_ou_acumular(novas, figuras):
+    """Acumula as figuras em `figuras` para renderização conjunta, ou renderiza já se for None."""
+    if figuras is None:
+        renderizar_figuras(novas)
+    else:
+        figuras.extend(novas)
+
+def analise_exploratoria(df, figuras=None):
     print("\n--- Análise Exploratória dos Dados ---")
     print("\nPrimeiras 5 linhas do DataFrame:")
     print(df.head())
@@ -32,177 +42,97 @@ def analise_exploratoria(df):
     missing_data = df.isnull().sum()
     print(missing_data[missing_data > 0])
 
-    plt.figure(figsize=(12, 6))
-    sns.heatmap(df.isnull(), cbar=False, cmap='viridis')
-    plt.title('Mapa de Calor de Valores Ausentes')
-    plt.savefig('reports/heatmap_missing_data.png')
-    plt.close()
-
     print("\nNúmero de linhas duplicadas:", df.duplicated().sum())
 
     print("\nDistribuição de STATUS_ANALISE:")
     print(df["STATUS_ANALISE"].value_counts())
-    sns.countplot(y='STATUS_ANALISE', data=df, palette='viridis')
-    plt.title('Distribuição de Status de Análise')
-    plt.savefig('reports/distribuicao_status_analise.png')
-    plt.close()
 
     print("\nDistribuição de GRAU_RISCO:")
     print(df["GRAU_RISCO"].value_counts())
-    sns.countplot(y='GRAU_RISCO', data=df, palette='magma')
-    plt.title('Distribuição de Grau de Risco')
-    plt.savefig('reports/distribuicao_grau_risco.png')
-    plt.close()
 
     print("\nDistribuição de TIPO_REACAO_TRANSFUSIONAL (Top 10):")
     print(df['TIPO_REACAO_TRANSFUSIONAL'].value_counts().head(10))
-    plt.figure(figsize=(10, 7))
-    sns.countplot(y='TIPO_REACAO_TRANSFUSIONAL', data=df, order=df['TIPO_REACAO_TRANSFUSIONAL'].value_counts().head(10).index, palette='cividis')
-    plt.title('Top 10 Tipos de Reação Transfusional')
-    plt.savefig('reports/top10_reacao_transfusional.png')
-    plt.close()
 
     print("\nDistribuição de UF_NOTIFICACAO (Top 10):")
     print(df['UF_NOTIFICACAO'].value_counts().head(10))
-    plt.figure(figsize=(10, 7))
-    sns.countplot(y='UF_NOTIFICACAO', data=df, order=df['UF_NOTIFICACAO'].value_counts().head(10).index, palette='plasma')
-    plt.title('Top 10 Estados com Mais Notificações')
-    plt.savefig('reports/top10_uf_notificacao.png')
-    plt.close()
-
-    df["DATA_OCORRENCIA_EVENTO"] = pd.to_datetime(df["DATA_OCORRENCIA_EVENTO"], format="%m/%d/%Y %H:%M:%S", errors="coerce")
-    df["DATA_NOTIFICACAO_EVENTO"] = pd.to_datetime(df["DATA_NOTIFICACAO_EVENTO"], format="%m/%d/%Y %H:%M:%S", errors="coerce")
-    df['ANO_OCORRENCIA'] = df['DATA_OCORRENCIA_EVENTO'].dt.year
 
-    plt.figure(figsize=(12, 6))
-    sns.countplot(x='ANO_OCORRENCIA', data=df.dropna(subset=['ANO_OCORRENCIA']), palette='viridis')
-    plt.title('Número de Notificações por Ano de Ocorrência')
-    plt.xticks(rotation=45)
-    plt.savefig('reports/notificacoes_por_ano.png')
-    plt.close()
+    df['ANO_OCORRENCIA'] = df['DATA_OCORRENCIA_EVENTO'].dt.year
 
-def identificar_vulnerabilidades(df):
+    _renderizar_ou_acumular([
+        figura_ausentes(df, 'reports/heatmap_missing_data.png'),
+        figura_contagens(df['STATUS_ANALISE'], 'reports/distribuicao_status_analise.png',
+                         'Distribuição de Status de Análise', paleta='viridis'),
+        figura_contagens(df['GRAU_RISCO'], 'reports/distribuicao_grau_risco.png',
+                         'Distribuição de Grau de Risco', paleta='magma'),
+        figura_contagens(df['TIPO_REACAO_TRANSFUSIONAL'], 'reports/top10_reacao_transfusional.png',
+                         'Top 10 Tipos de Reação Transfusional', paleta='cividis', top=10),
+        figura_contagens(df['UF_NOTIFICACAO'], 'reports/top10_uf_notificacao.png',
+                         'Top 10 Estados com Mais Notificações', paleta='plasma', top=10),
+        figura_contagens(df['ANO_OCORRENCIA'].dropna().astype(int), 'reports/notificacoes_por_ano.png',
+                         'Número de Notificações por Ano de Ocorrência', ordenar_indice=True, vertical=True),
+    ], figuras)
+
+def identificar_vulnerabilidades(df, figuras=None):
     """Identifica vulnerabilidades e problemas de proteção de dados."""
     print("\n--- Identificação de Vulnerabilidades e Problemas de Proteção de Dados ---")
 
-    print("\nVerificação de valores inesperados em colunas chave:")
-    valores_esperados_grau_risco = ['Grau I   - Leve', 'Grau II  - Moderado', 'Grau III - Grave', 'Grau IV  - Óbito']
-    valores_atuais_grau_risco = df['GRAU_RISCO'].unique()
-    for valor in valores_atuais_grau_risco:
-        if valor not in valores_esperados_grau_risco and pd.notna(valor):
-            print(f"  -> Alerta: Valor inesperado em GRAU_RISCO: {valor}")
-
-    inconsistencias_datas = df[df['DATA_NOTIFICACAO_EVENTO'] < df['DATA_OCORRENCIA_EVENTO']]
-    print(f"\nNúmero de registros com data de notificação anterior à de ocorrência: {len(inconsistencias_datas)}")
+    relatorio = montar_relatorio(avaliar_bloco(df))
+    imprimir_relatorio(relatorio)
+    salvar_relatorio_qualidade(relatorio)
 
     df['TEMPO_NOTIFICACAO_DIAS'] = (df['DATA_NOTIFICACAO_EVENTO'] - df['DATA_OCORRENCIA_EVENTO']).dt.days
-    atrasos_excessivos = df[df['TEMPO_NOTIFICACAO_DIAS'] > 365]
-    print(f"\nNúmero de registros com atraso de notificação superior a 365 dias: {len(atrasos_excessivos)}")
-
-    plt.figure(figsize=(10, 6))
-    sns.histplot(df['TEMPO_NOTIFICACAO_DIAS'].dropna(), bins=50, kde=True)
-    plt.title('Distribuição do Tempo entre Ocorrência e Notificação (em dias)')
-    plt.xlabel('Tempo (dias)')
-    plt.ylabel('Frequência')
-    plt.xlim(0, df["TEMPO_NOTIFICACAO_DIAS"].quantile(0.99))
-    plt.savefig("reports/distribuicao_tempo_notificacao.png")
-    plt.close()
-
-    combinacao_faixa_cidade = df.groupby(['FAIXA_ETARIA_PACIENTE', 'CIDADE_NOTIFICACAO']).size().reset_index(name='Contagem')
-    combinacao_faixa_cidade_baixa_contagem = combinacao_faixa_cidade[combinacao_faixa_cidade['Contagem'] <= 5]
-    print("\nCombinações de Faixa Etária e Cidade com baixa contagem:")
-    print(combinacao_faixa_cidade_baixa_contagem.sort_values(by='Contagem').head())
-
-def engenharia_features(df):
-    """Realiza a engenharia de features para os modelos de IA."""
-    print("\n--- Engenharia de Features para Modelos de IA ---")
-    df['TEMPO_NOTIFICACAO_DIAS'] = (df['DATA_NOTIFICACAO_EVENTO'] - df['DATA_OCORRENCIA_EVENTO']).dt.days
-    df['ANO_OCORRENCIA'] = df['DATA_OCORRENCIA_EVENTO'].dt.year
-    df['MES_OCORRENCIA'] = df['DATA_OCORRENCIA_EVENTO'].dt.month
-    df['DIA_SEMANA_OCORRENCIA'] = df['DATA_OCORRENCIA_EVENTO'].dt.dayofweek
-    df['HORA_OCORRENCIA'] = df['DATA_OCORRENCIA_EVENTO'].dt.hour
-
-    mapeamento_risco = {
-        'Grau I   - Leve': 1,
-        'Grau II  - Moderado': 2,
-        'Grau III - Grave': 3,
-        'Grau IV  - Óbito': 4
-    }
-    df["GRAU_RISCO_NUM"] = df["GRAU_RISCO"].map(mapeamento_risco)
-
-    categorical_cols = [
-        'PRODUTO_MOTIVO',
-        'TIPO_REACAO_TRANSFUSIONAL',
-        'CATEGORIA_NOTIFICADOR',
-        'TIPO_HEMOCOMPONENTE',
-        'FAIXA_ETARIA_PACIENTE',
-        'UF_NOTIFICACAO',
-        'DS_TEMPORALIDADE_REACAO',
-        'TIPO_EVENTO_ADVERSO',
-        'ETAPA_CICLO_SANGUE'
-    ]
-
-    for col in categorical_cols:
-        if col in df.columns:
-            df[col] = df[col].fillna('NA_CATEGORY')
-
-    df_encoded = pd.get_dummies(df, columns=categorical_cols, prefix=categorical_cols)
-
-    df_model = df_encoded.drop(columns=[
-        'NU_NOTIFICACAO', 'DATA_OCORRENCIA_EVENTO', 'DATA_NOTIFICACAO_EVENTO',
-        'GRAU_RISCO', 'CIDADE_NOTIFICACAO', 'DS_ESPECIFICACAO_EVENTO'
-    ], errors='ignore')
-
-    for col in df_model.select_dtypes(include=np.number).columns:
-        df_model[col] = df_model[col].fillna(df_model[col].median())
-    for col in df_model.columns:
-        if df_model[col].dtype == 'object':
-            df_model = df_model.drop(columns=[col])
-
-    return df_model
-
-def aplicar_ia(df_model):
-    """Aplica modelos de IA para análise e solução de problemas."""
-    print("\n--- Aplicação de IA para Análise e Solução de Problemas ---")
 
-    X = df_model.drop(columns=["GRAU_RISCO_NUM"], errors='ignore')
-    y = df_model["GRAU_RISCO_NUM"]
-    X = X.replace([np.inf, -np.inf], np.nan)
-    X = X.dropna(axis=1)
+    _renderizar_ou_acumular([
+        figura_histograma(df['TEMPO_NOTIFICACAO_DIAS'], 'reports/distribuicao_tempo_notificacao.png',
+                          'Distribuição do Tempo entre Ocorrência e Notificação (em dias)', rotulo_x='Tempo (dias)'),
+    ], figuras)
+
+    imprimir_k_anonimato(analisar_k_anonimato(df))
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42, stratify=y)
+def engenharia_features(df, motor='hgb'):
+    """Realiza a engenharia de features para os modelos de IA.
 
-    model = RandomForestClassifier(n_estimators=100, random_state=42, class_weight='balanced')
-    model.fit(X_train, y_train)
+    Retorna o conjunto de `montar_conjunto_risco`: matriz esparsa `X`, matriz
+    ordinal (motor 'hgb'), alvo `y` (GRAU_RISCO_NUM), nomes e codificador.
+    """
+    print("\n--- Engenharia de Features para Modelos de IA ---")
+    dados_modelo = montar_conjunto_risco(df, motor)
+    X = dados_modelo['X']
+    print(f"Matriz de features: {X.shape[0]} linhas x {X.shape[1]} colunas ({X.nnz} valores não nulos)")
+    return dados_modelo
+
+def aplicar_ia(dados_modelo, amostra=None, n_jobs=-1, figuras=None):
+    """Aplica modelos de IA para análise e solução de problemas."""
+    print("\n--- Aplicação de IA para Análise e Solução de Problemas ---")
 
-    y_pred = model.predict(X_test)
+    artefato = treinar_modelo_risco(dados_modelo, amostra=amostra, n_jobs=n_jobs)
+    salvar_modelo_risco(artefato)
 
-    print("\nRelatório de Classificação do Modelo Random Forest:")
-    print(classification_report(y_test, y_pred))
+    print(f"\nRelatório de Classificação do Modelo ({artefato['motor']}, treino em {artefato['tempo_treino_s']:.1f} s):")
+    print(artefato['relatorio'])
     print("\nMatriz de Confusão:")
-    print(confusion_matrix(y_test, y_pred))
-    print(f"\nAcurácia do Modelo: {accuracy_score(y_test, y_pred):.4f}")
+    print(artefato['matriz_confusao'])
+    print(f"\nAcurácia do Modelo: {artefato['acuracia']:.4f}")
 
-    feature_importances = pd.Series(model.feature_importances_, index=X.columns)
+    feature_importances = artefato['importancias']
     print("\nTop 10 Features Mais Importantes para Prever o Grau de Risco:")
     print(feature_importances.nlargest(10))
 
-    plt.figure(figsize=(12, 7))
-    sns.barplot(x=feature_importances.nlargest(10).values, y=feature_importances.nlargest(10).index, palette='viridis')
-    plt.title('Importância das Features na Previsão do Grau de Risco')
-    plt.xlabel('Importância')
-    plt.ylabel('Feature')
-    plt.savefig('reports/feature_importance.png')
-    plt.close()
-    iso_forest = IsolationForest(random_state=42, contamination=0.01)
+    _renderizar_ou_acumular([
+        figura_barras(feature_importances.nlargest(10), 'reports/feature_importance.png',
+                      'Importância das Features na Previsão do Grau de Risco',
+                      rotulo_valor='Importância', rotulo_categoria='Feature'),
+    ], figuras)
+    X = dados_modelo['X']
+    iso_forest = IsolationForest(random_state=42, contamination=0.01, n_jobs=n_jobs)
     iso_forest.fit(X)
-    df_model["ANOMALIA_ISO_FOREST"] = iso_forest.predict(X)
+    anomalia_iso_forest = pd.Series(iso_forest.predict(X), index=dados_modelo['ids'], name="ANOMALIA_ISO_FOREST")
 
     print("\nNúmero de Anomalias Detectadas pelo Isolation Forest:")
-    print(df_model["ANOMALIA_ISO_FOREST"].value_counts())
+    print(anomalia_iso_forest.value_counts())
 
     print("\nPrimeiras 10 Notificações Classificadas como Anomalias:")
-    print(df_model[df_model["ANOMALIA_ISO_FOREST"] == -1].head(10))
+    print(anomalia_iso_forest[anomalia_iso_forest == -1].head(10))
 
 
 if __name__ == "__main__":
@@ -215,9 +145,12 @@ if __name__ == "__main__":
     df = carregar_dados(file_path)
 
     if df is not None:
-        analise_exploratoria(df)
-        identificar_vulnerabilidades(df)
-        df_model = engenharia_features(df.copy())
-        aplicar_ia(df_model)
+        figuras = []
+        analise_exploratoria(df, figuras)
+        identificar_vulnerabilidades(df, figuras)
+        dados_modelo = engenharia_features(df.copy())
+        aplicar_ia(dados_modelo, figuras=figuras)
+        renderizar_figuras(figuras, n_jobs=-1)
+        print(f"\n{len(figuras)} gráficos salvos em reports/")
 
 
@@ -3,21 +3,17 @@ import sys
 import logging
 
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 
-import importlib
-
-try:
-    ydata_profiling = importlib.import_module("ydata_profiling")
-    ProfileReport = getattr(ydata_profiling, "ProfileReport", None)
-    HAS_PROFILE = ProfileReport is not None
-except Exception:
-    ProfileReport = None
-    HAS_PROFILE = False
+from data_processor import ajustar_modelos_particionados, pontuar_em_paralelo
+from features_hemovigilancia import imputar_numericos
+from esquema_hemovigilancia import ESQUEMA_COLUNAS, ler_csv, converter_datas
+from anonimizacao_hemovigilancia import anonimizar_dataframe, detectar_pii_dataframe, salvar_auditoria
+from relatorios_hemovigilancia import FORMATOS_RELATORIO_PADRAO, gerar_relatorios
+from perfil_hemovigilancia import HAS_PROFILE, AMOSTRA_PERFIL, gerar_perfil
+from graficos_hemovigilancia import figura_ausentes, figura_contagens, figura_serie, renderizar_figuras
 
 ROOT = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(ROOT, "data")
@@ -37,30 +33,21 @@ def carregar_dados(nome_arquivo="DADOS_ABERTOS_HEMOVIGILANCIA_UTF8.csv", encodin
     if not os.path.exists(caminho):
         logger.error("Arquivo de dados não encontrado. Verifique o caminho.")
         raise FileNotFoundError(caminho)
-    df = pd.read_csv(caminho, encoding=encoding, low_memory=False, sep=";")
+    # Só as colunas do dicionário de dados; sobras de exportação ficam de fora.
+    df = ler_csv(caminho, colunas=list(ESQUEMA_COLUNAS), datas=False, encoding=encoding)
     logger.info(f"Dados carregados: {df.shape[0]} linhas, {df.shape[1]} colunas")
     return df
 
-def detectar_campos_sensiveis(df):
-    possíveis = []
-    for col in df.columns:
-        nome = col.lower()
-        if any(k in nome for k in ["cpf", "nome", "endereco", "email", "telefone", "celular", "rg"]):
-            possíveis.append(col)
-    
-    for col in df.select_dtypes(include=["object"]).columns:
-        sample = df[col].dropna().astype(str).head(200)
-        if sample.str.match(r"^\d{3}\.?\d{3}\.?\d{3}\-?\d{2}$").any():
-            if col not in possíveis:
-                possíveis.append(col)
-    return possíveis
-
-def anonimizar(df, cols):
-    df = df.copy()
-    for col in cols:
-        if col in df.columns:
-            df[col] = df[col].astype(str).apply(lambda x: "<ANONIMIZADO>" if pd.notna(x) and x.strip()!="" else x)
-    return df
+def detectar_campos_sensiveis(df, n_jobs=None):
+    """Colunas com indício de dado pessoal, pelo nome ou pelo conteúdo (varredura completa, sem reescrever)."""
+    return list(detectar_pii_dataframe(df, n_jobs=n_jobs)['colunas'])
+
+def anonimizar(df, cols, modo='mascara', n_jobs=None):
+    """Anonimiza os trechos de CPF, telefone e e-mail de `cols` e salva a auditoria."""
+    df_anon, auditoria = anonimizar_dataframe(df, colunas=cols, modo=modo, n_jobs=n_jobs)
+    salvar_auditoria(auditoria, os.path.join(REPORTS_DIR, "auditoria_anonimizacao.json"))
+    logger.info(f"Anonimização: {auditoria['celulas_anonimizadas']} células em {auditoria['duracao_s']:.1f} s")
+    return df_anon
 
 def resumo_geral(df):
     info = {
@@ -72,92 +59,101 @@ def resumo_geral(df):
     }
     return info
 
-def salvar_figura(fig, nome):
-    caminho = os.path.join(REPORTS_DIR, nome)
-    fig.savefig(caminho, bbox_inches="tight", dpi=150)
-    plt.close(fig)
-    logger.info(f"Gráfico salvo: {caminho}")
+def salvar_figuras(figuras, n_jobs=None):
+    """Renderiza as figuras acumuladas (em paralelo com `n_jobs`) e registra os arquivos."""
+    for figura in figuras:
+        figura.setdefault("dpi", 150)
+    for caminho in renderizar_figuras(figuras, n_jobs=n_jobs):
+        logger.info(f"Gráfico salvo: {caminho}")
 
 def plot_heatmap_missing(df):
-    fig, ax = plt.subplots(figsize=(12,6))
-    sns.heatmap(df.isna(), cbar=False, yticklabels=False, ax=ax)
-    ax.set_title("Heatmap - Dados ausentes (True = ausente)")
-    salvar_figura(fig, "heatmap_missing_data_avancado.png")
+    return figura_ausentes(df, os.path.join(REPORTS_DIR, "heatmap_missing_data_avancado.png"),
+                           "Heatmap - Fração de dados ausentes por faixa de linhas")
 
 def plot_distribuicao_categorica(df, coluna, topn=10):
     if coluna not in df.columns:
-        return
-    serie = df[coluna].fillna("NA")
-    top = serie.value_counts().head(topn)
-    fig, ax = plt.subplots(figsize=(8,5))
-    sns.barplot(x=top.values, y=top.index, ax=ax)
-    ax.set_xlabel("Contagem")
-    ax.set_title(f"Top {topn} - {coluna}")
-    salvar_figura(fig, f"top_{coluna}.png")
+        return None
+    serie = df[coluna].astype(object).fillna("NA")
+    return figura_contagens(serie, os.path.join(REPORTS_DIR, f"top_{coluna}.png"), f"Top {topn} - {coluna}", top=topn)
 
 def plot_timeseries_count(df, data_col, freq='Y'):
     if data_col not in df.columns:
-        return
+        return None
     try:
-        s = pd.to_datetime(df[data_col], errors="coerce", dayfirst=True)
+        s = df[data_col]
+        if not pd.api.types.is_datetime64_any_dtype(s):
+            s = pd.to_datetime(s, errors="coerce", dayfirst=True)
         counts = s.dt.to_period(freq).value_counts().sort_index()
-        fig, ax = plt.subplots(figsize=(10,4))
-        counts.plot(ax=ax)
-        ax.set_title(f"Contagem por período ({data_col})")
-        salvar_figura(fig, f"timeseries_{data_col}.png")
+        return figura_serie(counts, os.path.join(REPORTS_DIR, f"timeseries_{data_col}.png"),
+                            f"Contagem por período ({data_col})")
     except Exception as e:
         logger.warning(f"Falha ao plotar série temporal: {e}")
+        return None
 
 def limpeza_basica(df):
+    """Converte as colunas de data declaradas no esquema; os demais tipos já vêm da leitura."""
     df = df.copy()
-    
     df.columns = [c.strip() for c in df.columns]
-    
-    for c in df.columns:
-        if "data" in c.lower() or "dt_" in c.lower() or "ano" in c.lower():
-            try:
-                df[c] = pd.to_datetime(df[c], errors="coerce")
-            except Exception:
-                pass
-    
-    return df
+    return converter_datas(df)
 
 def preparar_numericos(df):
-    num = df.select_dtypes(include=["int64","float64"]).copy()
-    num = num.fillna(0)
+    colunas = df.select_dtypes(include="number").columns
+    num, _ = imputar_numericos(df, colunas, estrategia="zero")
     return num
 
-def detectar_anomalias(df, n_estimators=100, contamination=0.03, random_state=42):
+def detectar_anomalias(df, n_estimators=100, contamination=0.03, random_state=42, n_jobs=None, particionar_por=None):
+    """Marca anomalias com IsolationForest sobre as colunas numéricas padronizadas.
+
+    `n_jobs` distribui treino e pontuação entre núcleos (-1 = todos). Com
+    `particionar_por` (ex.: "UF_NOTIFICACAO"), cada valor da coluna recebe seu
+    próprio modelo, ajustado num pool de processos; partições pequenas usam o
+    modelo global.
+    """
     num = preparar_numericos(df)
     if num.shape[1] == 0:
         logger.warning("Nenhuma coluna numérica disponível para detecção de anomalias.")
         return pd.Series(index=df.index, data=0, name="anomaly_label")
     scaler = StandardScaler()
     X = scaler.fit_transform(num)
-    modelo = IsolationForest(n_estimators=n_estimators, contamination=contamination, random_state=random_state)
+    parametros = {"n_estimators": n_estimators, "contamination": contamination, "random_state": random_state}
+    modelo = IsolationForest(n_jobs=n_jobs, **parametros)
     modelo.fit(X)
-    labels = modelo.predict(X)
-    labels = pd.Series(labels, index=df.index).map({1: 0, -1: 1}).astype(int)
+
+    chaves, modelos_particao = None, None
+    if particionar_por is not None and particionar_por in df.columns:
+        chaves = df[particionar_por].astype(object).fillna("NA").astype(str).to_numpy()
+        modelos_particao = ajustar_modelos_particionados(X, chaves, parametros, n_jobs=n_jobs)
+        logger.info(f"Modelos por {particionar_por}: {len(modelos_particao)} partições")
+
+    scores, limiares = pontuar_em_paralelo(modelo, X, chaves, modelos_particao, n_jobs)
+    labels = pd.Series((scores > limiares).astype(int), index=df.index)
     df["anomaly_label"] = labels
     logger.info(f"Anomalias detectadas: {int(labels.sum())} registros ({labels.mean():.2%})")
     return df["anomaly_label"]
 
-def gerar_relatorio_excel(df, nome_arquivo="relatorio_analise.xlsx"):
-    caminho = os.path.join(REPORTS_DIR, nome_arquivo)
+def gerar_relatorio(df, nome_base="relatorio_analise", formatos=FORMATOS_RELATORIO_PADRAO):
+    """Grava o relatório em Parquet e CSV gzip; inclua 'xlsx' em `formatos` para a planilha."""
+    caminho_base = os.path.join(REPORTS_DIR, nome_base)
     try:
-        df.to_excel(caminho, index=False)
-        logger.info(f"Relatório Excel gerado: {caminho}")
+        for formato, caminho in gerar_relatorios(df, caminho_base, formatos).items():
+            logger.info(f"Relatório {formato} gerado: {caminho}")
     except Exception as e:
-        logger.error(f"Erro ao gerar Excel: {e}")
+        logger.error(f"Erro ao gerar relatório: {e}")
 
-def gerar_relatorio_profiler(df, nome_arquivo="relatorio_profile.html"):
+def gerar_relatorio_profiler(df, nome_arquivo="relatorio_profile.html", amostra=AMOSTRA_PERFIL):
+    """Perfil sobre amostra estratificada por UF e ano, com contagens exatas em JSON e cache por hash."""
     if not HAS_PROFILE:
-        logger.warning("ydata_profiling (pandas-profiling) não disponível. Ignorando relatório automático.")
-        return
+        logger.warning("ydata_profiling (pandas-profiling) não disponível. Gerando apenas as contagens exatas.")
     caminho = os.path.join(REPORTS_DIR, nome_arquivo)
-    profile = ProfileReport(df, title="Relatório de Perfil - Hemovigilância", minimal=True)
-    profile.to_file(caminho)
-    logger.info(f"Relatório profile gerado: {caminho}")
+    resultado = gerar_perfil(df, caminho, os.path.join(REPORTS_DIR, "cache_perfil"), amostra=amostra)
+    if resultado["do_cache"]:
+        origem = "reaproveitado do cache"
+    elif resultado["linhas_amostra"] is not None:
+        origem = f"amostra de {resultado['linhas_amostra']} linhas"
+    else:
+        origem = "dados completos"
+    for arquivo in resultado["arquivos"]:
+        logger.info(f"Relatório profile gerado ({origem}): {arquivo}")
 
 def main():
     logger.info("Iniciando análise avançada de Hemovigilância")
@@ -170,24 +166,26 @@ def main():
 
     sensiveis = info["colunas_sensiveis"]
     if sensiveis:
-        logger.info("Anonimizando campos sensíveis (substituição por <ANONIMIZADO>)")
-        df_anon = anonimizar(df_clean, sensiveis)
+        logger.info("Anonimizando campos sensíveis (CPF, telefone e e-mail)")
+        df_anon = anonimizar(df_clean, sensiveis, n_jobs=-1)
     else:
         df_anon = df_clean
 
-    plot_heatmap_missing(df_anon)
+    figuras = [plot_heatmap_missing(df_anon)]
     
     if "UF_NOTIFICACAO" in df_anon.columns:
-        plot_distribuicao_categorica(df_anon, "UF_NOTIFICACAO", topn=15)
+        figuras.append(plot_distribuicao_categorica(df_anon, "UF_NOTIFICACAO", topn=15))
     
     candidates = [c for c in df_anon.columns if "data" in c.lower() or "ano" in c.lower()]
     if candidates:
-        plot_timeseries_count(df_anon, candidates[0], freq='Y')
+        figuras.append(plot_timeseries_count(df_anon, candidates[0], freq='Y'))
+
+    salvar_figuras([f for f in figuras if f is not None], n_jobs=-1)
 
-    anom = detectar_anomalias(df_anon, contamination=0.03)
+    anom = detectar_anomalias(df_anon, contamination=0.03, n_jobs=-1)
     df_anon["anomaly_label"] = anom
 
-    gerar_relatorio_excel(df_anon, nome_arquivo="resultado_com_anomalias.xlsx")
+    gerar_relatorio(df_anon, nome_base="resultado_com_anomalias")
 
     gerar_relatorio_profiler(df_anon, nome_arquivo="relatorio_profile.html")
 
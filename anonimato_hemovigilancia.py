@@ -0,0 +1,214 @@
+"""
+Análise de k-anonimato sobre combinações de quase-identificadores.
+
+Cada quase-identificador tem uma hierarquia de generalização (do mais grosso
+para o mais fino), por exemplo UF -> cidade e ano -> mês. Um nó do reticulado
+escolhe um nível por hierarquia (0 = atributo suprimido); para cada nó é
+calculado o tamanho do menor grupo de linhas indistinguíveis.
+
+As linhas são contadas uma única vez, no nível mais fino de todas as
+hierarquias; os demais nós são agregações dessa tabela de contagens, que é
+muito menor que o conjunto original. Como refinar um nó só pode diminuir os
+grupos, os nós mais finos que um nó inseguro são inseguros e não precisam ser
+calculados.
+"""
+
+import argparse
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+
+from esquema_hemovigilancia import resolver_formato_data
+
+K_ANONIMATO_PADRAO = 5
+
+# Níveis de cada hierarquia, do mais grosso para o mais fino.
+HIERARQUIAS_QUASE_IDENTIFICADORES = {
+    'FAIXA_ETARIA': ['FAIXA_ETARIA_PACIENTE'],
+    'LOCAL': ['UF_NOTIFICACAO', 'CIDADE_NOTIFICACAO'],
+    'HEMOCOMPONENTE': ['TIPO_HEMOCOMPONENTE'],
+    'DATA': ['ANO_OCORRENCIA', 'MES_OCORRENCIA'],
+}
+
+def _colunas_de_data(df):
+    """Generaliza DATA_OCORRENCIA_EVENTO em ano e ano-mês (AAAAMM).
+
+    Só os valores distintos são convertidos; o texto bruto repete poucas datas.
+    """
+    codigos, unicos = pd.factorize(df['DATA_OCORRENCIA_EVENTO'])
+    datas = pd.Series(unicos)
+    if not pd.api.types.is_datetime64_any_dtype(datas):
+        formato = resolver_formato_data(datas)
+        datas = pd.to_datetime(datas, errors='coerce', format=formato) if formato \
+            else pd.to_datetime(datas, errors='coerce', dayfirst=True)
+    ano = datas.dt.year.to_numpy()
+    mes = (datas.dt.year * 100 + datas.dt.month).to_numpy()
+    ausente = codigos < 0
+    return pd.DataFrame({
+        'ANO_OCORRENCIA': np.where(ausente, np.nan, ano[codigos]),
+        'MES_OCORRENCIA': np.where(ausente, np.nan, mes[codigos]),
+    }, index=df.index)
+
+
+def _combinar_codigos(codigos, cardinalidades):
+    """Fatoriza a combinação de vários vetores de códigos (chave em base mista)."""
+    chave = np.zeros(len(codigos[0]), dtype=np.int64)
+    base = 1
+    for codigo, cardinalidade in zip(codigos, cardinalidades):
+        if base * cardinalidade >= 2 ** 62:
+            # Recompacta a chave para não estourar o int64.
+            chave, unicos = pd.factorize(chave)
+            base = len(unicos)
+        chave = chave * cardinalidade + codigo
+        base *= cardinalidade
+    combinados, unicos = pd.factorize(chave)
+    return combinados, len(unicos)
+
+
+def _primeira_posicao(codigos, n_codigos):
+    """Posição da primeira linha de cada código."""
+    posicoes = np.empty(n_codigos, dtype=np.int64)
+    posicoes[codigos[::-1]] = np.arange(len(codigos) - 1, -1, -1)
+    return posicoes
+
+
+def _codificar_hierarquia(df, niveis):
+    """Códigos do nível mais fino por linha e, para cada nível, o mapa código fino -> código do nível."""
+    por_coluna = [pd.factorize(df[c], use_na_sentinel=False) for c in niveis]
+    codigos = [c for c, _ in por_coluna]
+    cardinalidades = [len(u) for _, u in por_coluna]
+
+    codigos_finos, n_finos = _combinar_codigos(codigos, cardinalidades)
+    primeira = _primeira_posicao(codigos_finos, n_finos)
+    mapas = []
+    for i in range(1, len(niveis) + 1):
+        prefixo = [c[primeira] for c in codigos[:i]]
+        mapas.append(_combinar_codigos(prefixo, cardinalidades[:i]))
+    return codigos_finos, n_finos, mapas
+
+
+def _nome_no(no, hierarquias):
+    partes = [niveis[nivel - 1] for (nome, niveis), nivel in zip(hierarquias.items(), no) if nivel]
+    return ' + '.join(partes)
+
+
+def analisar_k_anonimato(df, k=K_ANONIMATO_PADRAO, hierarquias=None, podar=True):
+    """Calcula o menor grupo de cada nó do reticulado de generalização.
+
+    Retorna um DataFrame com uma linha por nó: `combinacao`, `niveis` (tupla
+    com o nível de cada hierarquia), a coluna usada em cada hierarquia,
+    `menor_grupo`, `grupos_abaixo_k`, `linhas_em_risco`, `seguro` e
+    `calculado`. Nós não calculados (podados) herdam de um pai inseguro o
+    limite superior do menor grupo.
+    """
+    hierarquias = dict(HIERARQUIAS_QUASE_IDENTIFICADORES if hierarquias is None else hierarquias)
+
+    base = df
+    if any('ANO_OCORRENCIA' in n or 'MES_OCORRENCIA' in n for n in hierarquias.values()) \
+            and 'DATA_OCORRENCIA_EVENTO' in df.columns:
+        base = pd.concat([df.drop(columns=['ANO_OCORRENCIA', 'MES_OCORRENCIA'], errors='ignore'),
+                          _colunas_de_data(df)], axis=1)
+    hierarquias = {nome: niveis for nome, niveis in hierarquias.items() if all(c in base.columns for c in niveis)}
+    if not hierarquias:
+        raise ValueError("Nenhum quase-identificador encontrado nos dados.")
+
+    # Contagem única das linhas no nível mais fino de todas as hierarquias.
+    codificadas = [_codificar_hierarquia(base, niveis) for niveis in hierarquias.values()]
+    grupos_base, n_base = _combinar_codigos([c for c, _, _ in codificadas], [n for _, n, _ in codificadas])
+    pesos = np.bincount(grupos_base, minlength=n_base)
+    primeira = _primeira_posicao(grupos_base, n_base)
+    codigos_base = [c[primeira] for c, _, _ in codificadas]
+
+    alturas = [len(niveis) for niveis in hierarquias.values()]
+    nos = [no for no in itertools.product(*(range(a + 1) for a in alturas)) if any(no)]
+    nos.sort(key=sum)
+
+    resultados = {}
+    for no in nos:
+        pais = [no[:i] + (no[i] - 1,) + no[i + 1:] for i in range(len(no)) if no[i]]
+        pais = [p for p in pais if p in resultados]
+        pais_inseguros = [resultados[p] for p in pais if not resultados[p]['seguro']]
+
+        if podar and pais_inseguros:
+            resultados[no] = {
+                'menor_grupo': min(p['menor_grupo'] for p in pais_inseguros),
+                'grupos_abaixo_k': None,
+                'linhas_em_risco': None,
+                'seguro': False,
+                'calculado': False,
+            }
+            continue
+
+        codigos, cardinalidades = [], []
+        for (_, _, mapas), nivel, cod_base in zip(codificadas, no, codigos_base):
+            if nivel:
+                mapa, cardinalidade = mapas[nivel - 1]
+                codigos.append(mapa[cod_base])
+                cardinalidades.append(cardinalidade)
+        grupos, n_grupos = _combinar_codigos(codigos, cardinalidades)
+        tamanhos = np.bincount(grupos, weights=pesos, minlength=n_grupos).astype(np.int64)
+        abaixo = tamanhos < k
+        resultados[no] = {
+            'menor_grupo': int(tamanhos.min()),
+            'grupos_abaixo_k': int(abaixo.sum()),
+            'linhas_em_risco': int(tamanhos[abaixo].sum()),
+            'seguro': not abaixo.any(),
+            'calculado': True,
+        }
+
+    linhas = []
+    for no in nos:
+        linha = {'combinacao': _nome_no(no, hierarquias), 'niveis': no}
+        linha.update({nome: (niveis[nivel - 1] if nivel else None)
+                      for (nome, niveis), nivel in zip(hierarquias.items(), no)})
+        linha.update(resultados[no])
+        linhas.append(linha)
+    resultado = pd.DataFrame(linhas)
+    return resultado.astype({'grupos_abaixo_k': 'Int64', 'linhas_em_risco': 'Int64'})
+
+
+def combinacoes_inseguras_minimas(resultado):
+    """Nós inseguros sem nenhum nó inseguro mais grosso: as combinações que causam o risco."""
+    inseguros = resultado[~resultado['seguro']]
+    if inseguros.empty:
+        return inseguros
+    niveis = np.array(inseguros['niveis'].tolist()).reshape(len(inseguros), -1)
+    minimos = [
+        not np.any(np.all(niveis <= nivel, axis=1) & np.any(niveis < nivel, axis=1))
+        for nivel in niveis
+    ]
+    return inseguros[np.array(minimos, dtype=bool)]
+
+
+def imprimir_k_anonimato(resultado, k=K_ANONIMATO_PADRAO):
+    calculados = int(resultado['calculado'].sum())
+    print(f"\nk-anonimato (k={k}): {len(resultado)} combinações, {calculados} calculadas, "
+          f"{int((~resultado['seguro']).sum())} inseguras")
+    minimas = combinacoes_inseguras_minimas(resultado)
+    if minimas.empty:
+        print("  Todas as combinações de quase-identificadores são seguras.")
+        return
+    print("  Combinações mínimas inseguras:")
+    for _, linha in minimas.sort_values('menor_grupo').iterrows():
+        print(f"  -> {linha['combinacao']}: menor grupo {linha['menor_grupo']}, "
+              f"{linha['grupos_abaixo_k']} grupos e {linha['linhas_em_risco']} linhas abaixo de k")
+
+
+if __name__ == "__main__":
+    from data_processor import CAMINHO_DADOS
+    from esquema_hemovigilancia import ler_csv
+
+    parser = argparse.ArgumentParser(description="Analisa k-anonimato das combinações de quase-identificadores.")
+    parser.add_argument('--k', type=int, default=K_ANONIMATO_PADRAO)
+    parser.add_argument('--sem-poda', action='store_true', help="Calcula todos os nós do reticulado.")
+    args = parser.parse_args()
+
+    colunas = [c for niveis in HIERARQUIAS_QUASE_IDENTIFICADORES.values() for c in niveis] + ['DATA_OCORRENCIA_EVENTO']
+    df = ler_csv(CAMINHO_DADOS, colunas=colunas, datas=False)
+
+    inicio = time.perf_counter()
+    resultado = analisar_k_anonimato(df, args.k, podar=not args.sem_poda)
+    imprimir_k_anonimato(resultado, args.k)
+    print(f"⏱️ {len(df)} linhas analisadas em {time.perf_counter() - inicio:.2f} s")
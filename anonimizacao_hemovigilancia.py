@@ -0,0 +1,228 @@
+"""
+Detecção e anonimização de dados pessoais (CPF, telefone, e-mail).
+
+As colunas de texto são varridas por completo, com expressões regulares
+aplicadas apenas aos valores distintos de cada coluna (texto repetido é
+verificado uma vez) e o resultado é propagado às linhas pelos códigos do
+`factorize`. Os trechos encontrados são substituídos por marcadores
+(modo 'mascara') ou a célula inteira por um hash com chave (modo 'hash'),
+que preserva a ligação entre registros sem expor o valor.
+
+Arquivos grandes são processados em blocos distribuídos num pool de
+processos; cada execução gera um resumo de auditoria, apenas com contagens.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from blocos_hemovigilancia import TAMANHO_BLOCO_PADRAO, resolver_n_jobs
+from esquema_hemovigilancia import ler_csv_em_blocos
+
+CAMINHO_AUDITORIA_ANONIMIZACAO = 'reports/auditoria_anonimizacao.json'
+MODOS_ANONIMIZACAO = ('mascara', 'hash')
+# Chave do hash; defina em produção para que os hashes não sejam reproduzíveis por terceiros.
+VARIAVEL_CHAVE_ANONIMIZACAO = 'CHAVE_ANONIMIZACAO'
+
+PADROES_PII = {
+    'CPF': r'\b\d{3}\.?\d{3}\.?\d{3}-?\d{2}\b',
+    # Celular (9XXXX-XXXX, DDD opcional) ou fixo ([2-5]XXX-XXXX, só com DDD: sem ele
+    # é indistinguível de intervalos de anos como 2019-2020).
+    'TELEFONE': r'(?:(?:\([1-9]{2}\)\s?|\b[1-9]{2}\s)?\b9\d{4}-\d{4}|(?:\([1-9]{2}\)\s?|\b[1-9]{2}\s)\b[2-5]\d{3}-\d{4})\b',
+    'EMAIL': r'\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b',
+}
+
+# Colunas cujo nome já indica dado pessoal são anonimizadas por inteiro.
+PALAVRAS_COLUNA_PII = ['cpf', 'nome', 'endereco', 'email', 'telefone', 'celular', 'rg']
+# Identificadores e datas não são texto livre e gerariam falsos positivos.
+COLUNAS_SEM_PII = ['ID_NOTIFICACAO', 'NU_NOTIFICACAO', 'DATA_OCORRENCIA_EVENTO', 'DATA_NOTIFICACAO_EVENTO']
+
+
+def chave_hash_anonimizacao(segredo=None):
+    """Deriva a chave de 16 caracteres usada por `hash_pandas_object`."""
+    segredo = segredo or os.environ.get(VARIAVEL_CHAVE_ANONIMIZACAO, 'hemovigilancia')
+    return hashlib.blake2b(segredo.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def colunas_pii_por_nome(colunas):
+    return [c for c in colunas
+            if any(token.startswith(p) for token in str(c).lower().split('_') for p in PALAVRAS_COLUNA_PII)]
+
+
+def colunas_texto(df):
+    """Colunas de texto livre candidatas à varredura."""
+    return [c for c in df.select_dtypes(include=['object', 'string', 'category']).columns
+            if str(c).upper().strip() not in COLUNAS_SEM_PII]
+
+
+def _hash_valores(valores, chave):
+    hashes = pd.util.hash_pandas_object(pd.Series(valores, dtype=object), index=False, hash_key=chave)
+    return '<HASH:' + pd.Series(hashes.to_numpy()).map('{:016x}'.format) + '>'
+
+
+def anonimizar_bloco(df, colunas=None, modo='mascara', chave=None, somente_detectar=False):
+    """Detecta e anonimiza PII num bloco; retorna (bloco, auditoria parcial).
+
+    A auditoria parcial é {'linhas', 'colunas': {coluna: {tipo: células}}}.
+    Com `somente_detectar`, os valores não são reescritos e o bloco devolvido
+    é None (nada volta do pool além das contagens).
+    """
+    if modo not in MODOS_ANONIMIZACAO:
+        raise ValueError(f"Modo inválido: {modo}. Use um de {MODOS_ANONIMIZACAO}.")
+    chave = chave or chave_hash_anonimizacao()
+    colunas = colunas_texto(df) if colunas is None else [c for c in colunas if c in df.columns]
+    por_nome = set(colunas_pii_por_nome(df.columns))
+
+    if not somente_detectar:
+        df = df.copy()
+    auditoria = {'linhas': len(df), 'colunas': {}}
+    for col in list(por_nome) + [c for c in colunas if c not in por_nome]:
+        codigos, unicos = pd.factorize(df[col])
+        if not len(unicos):
+            continue
+        frequencias = np.bincount(codigos[codigos >= 0], minlength=len(unicos))
+        texto = pd.Series(unicos, dtype=object).astype(str)
+
+        if col in por_nome:
+            encontrados = {'COLUNA': np.ones(len(unicos), dtype=bool)}
+        else:
+            encontrados = {tipo: texto.str.contains(padrao, regex=True).to_numpy()
+                           for tipo, padrao in PADROES_PII.items()}
+        contagens = {tipo: int(frequencias[achados].sum()) for tipo, achados in encontrados.items() if achados.any()}
+        if not contagens:
+            continue
+        auditoria['colunas'][col] = contagens
+        if somente_detectar:
+            continue
+
+        alguma = np.logical_or.reduce(list(encontrados.values()))
+        if modo == 'hash' or col in por_nome:
+            substitutos = _hash_valores(unicos, chave) if modo == 'hash' else pd.Series('<ANONIMIZADO>', index=texto.index)
+            novos = texto.where(~alguma, substitutos)
+        else:
+            novos = texto.copy()
+            trechos = texto[alguma]
+            for tipo, achados in encontrados.items():
+                if achados.any():
+                    trechos = trechos.str.replace(PADROES_PII[tipo], f'<{tipo}>', regex=True)
+            novos[alguma] = trechos
+
+        valores = novos.to_numpy(dtype=object)[codigos]
+        valores[codigos < 0] = None
+        df[col] = valores
+    return (None if somente_detectar else df), auditoria
+
+
+def combinar_auditorias(parciais):
+    total = {'linhas': 0, 'colunas': {}}
+    for parcial in parciais:
+        total['linhas'] += parcial['linhas']
+        for col, contagens in parcial['colunas'].items():
+            acumulado = total['colunas'].setdefault(col, {})
+            for tipo, n in contagens.items():
+                acumulado[tipo] = acumulado.get(tipo, 0) + n
+    return total
+
+
+def resumo_auditoria(total, modo, duracao_s):
+    return {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'modo': modo,
+        'linhas': total['linhas'],
+        'celulas_anonimizadas': sum(sum(c.values()) for c in total['colunas'].values()),
+        'colunas': total['colunas'],
+        'duracao_s': round(duracao_s, 3),
+    }
+
+
+def salvar_auditoria(auditoria, caminho=CAMINHO_AUDITORIA_ANONIMIZACAO):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(auditoria, f, ensure_ascii=False, indent=2)
+
+
+def _anonimizar_bloco_args(args):
+    return anonimizar_bloco(*args)
+
+
+def _mapear_em_ordem(blocos, args_extra, n_processos):
+    """Processa os blocos no pool e devolve os resultados na ordem de entrada.
+
+    No máximo 2 blocos por processo ficam em memória ao mesmo tempo.
+    """
+    if n_processos == 1:
+        for bloco in blocos:
+            yield anonimizar_bloco(bloco, *args_extra)
+        return
+    with ProcessPoolExecutor(max_workers=n_processos) as executor:
+        pendentes = deque()
+        for bloco in blocos:
+            if len(pendentes) >= 2 * n_processos:
+                yield pendentes.popleft().result()
+            pendentes.append(executor.submit(_anonimizar_bloco_args, (bloco, *args_extra)))
+        while pendentes:
+            yield pendentes.popleft().result()
+
+
+def anonimizar_dataframe(df, colunas=None, modo='mascara', n_jobs=None, tamanho_bloco=None, chave=None):
+    """Anonimiza um DataFrame inteiro, em blocos paralelos; retorna (df, auditoria)."""
+    inicio = time.perf_counter()
+    tamanho_bloco = tamanho_bloco or TAMANHO_BLOCO_PADRAO
+    n_processos = resolver_n_jobs(n_jobs) if len(df) > tamanho_bloco else 1
+    blocos = (df.iloc[i:i + tamanho_bloco] for i in range(0, len(df), tamanho_bloco))
+    resultados = list(_mapear_em_ordem(blocos, (colunas, modo, chave or chave_hash_anonimizacao()), n_processos))
+    if not resultados:
+        return df.copy(), resumo_auditoria(combinar_auditorias([]), modo, 0.0)
+    saida = pd.concat([bloco for bloco, _ in resultados])
+    total = combinar_auditorias(parcial for _, parcial in resultados)
+    return saida, resumo_auditoria(total, modo, time.perf_counter() - inicio)
+
+
+def detectar_pii_dataframe(df, colunas=None, n_jobs=None, tamanho_bloco=None):
+    """Só a detecção de PII (sem reescrever valores), em blocos paralelos; retorna a auditoria."""
+    inicio = time.perf_counter()
+    tamanho_bloco = tamanho_bloco or TAMANHO_BLOCO_PADRAO
+    n_processos = resolver_n_jobs(n_jobs) if len(df) > tamanho_bloco else 1
+    blocos = (df.iloc[i:i + tamanho_bloco] for i in range(0, len(df), tamanho_bloco))
+    parciais = [parcial for _, parcial in _mapear_em_ordem(blocos, (colunas, 'mascara', None, True), n_processos)]
+    return resumo_auditoria(combinar_auditorias(parciais), 'deteccao', time.perf_counter() - inicio)
+
+
+def anonimizar_arquivo(caminho_entrada, caminho_saida, modo='mascara', n_jobs=None, tamanho_bloco=None):
+    """Etapa de anonimização sobre o CSV: lê em blocos, anonimiza no pool e grava na ordem original."""
+    inicio = time.perf_counter()
+    blocos = ler_csv_em_blocos(caminho_entrada, tamanho_bloco or TAMANHO_BLOCO_PADRAO)
+    caminho_temporario = caminho_saida + '.tmp'
+    parciais = []
+    primeiro_bloco = True
+    for bloco, parcial in _mapear_em_ordem(blocos, (None, modo, chave_hash_anonimizacao()), resolver_n_jobs(n_jobs)):
+        bloco.to_csv(caminho_temporario, sep=';', encoding='ISO-8859-1', index=False,
+                     mode='w' if primeiro_bloco else 'a', header=primeiro_bloco)
+        primeiro_bloco = False
+        parciais.append(parcial)
+    os.replace(caminho_temporario, caminho_saida)
+    return resumo_auditoria(combinar_auditorias(parciais), modo, time.perf_counter() - inicio)
+
+
+if __name__ == "__main__":
+    from data_processor import CAMINHO_DADOS
+
+    parser = argparse.ArgumentParser(description="Anonimiza CPF, telefone e e-mail do CSV de hemovigilância.")
+    parser.add_argument('saida', help="Caminho do CSV anonimizado.")
+    parser.add_argument('--modo', choices=MODOS_ANONIMIZACAO, default='mascara')
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--tamanho-bloco', type=int, default=None)
+    args = parser.parse_args()
+
+    auditoria = anonimizar_arquivo(CAMINHO_DADOS, args.saida, args.modo, args.n_jobs, args.tamanho_bloco)
+    salvar_auditoria(auditoria)
+    print(f"✅ {auditoria['linhas']} linhas, {auditoria['celulas_anonimizadas']} células anonimizadas "
+          f"em {auditoria['duracao_s']:.1f} s. Auditoria em {CAMINHO_AUDITORIA_ANONIMIZACAO}")
@@ -1,163 +1,269 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, stream_with_context
 import pandas as pd
 import numpy as np
 import json
 import os
-from datetime import datetime
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 import warnings
+import click
 from crawler_hemovigilancia import HemovigilanciaCrawler
+from previsao_hemovigilancia import obter_previsoes, prever_selecao, HORIZONTE_PREVISAO
+from atrasos_hemovigilancia import COLUNAS_PARTICAO, quantis_atraso, quantis_atraso_por, quantis_exatos
+from vigilancia_hemovigilancia import obter_vigilancia, filtrar_alertas, resumo_series, rotulo_mes_aberto
+from dataset_hemovigilancia import (
+    COLUNAS_FILTRO, FILTROS_SUPORTADOS, obter_snapshot, invalidar_snapshot, filtrar, selecionar, opcoes_filtro, definir_carregador,
+    cubo_filtros, facetas, mascara_amostra,
+)
+from amostra_hemovigilancia import metricas_estimadas, contagens_estimadas
+import banco_hemovigilancia as banco
+from coalescencia_hemovigilancia import coalescer_requisicao
+from aquecimento_hemovigilancia import cachear_requisicao, iniciar_aquecimento, estado_aquecimento
+from exportacao_hemovigilancia import DESTINO_EXPORTACAO, exportar_site
 
 warnings.filterwarnings('ignore')
 
 app = Flask(__name__)
 app.secret_key = 'hemovigilancia_secret_key_2025'
 
-CAMINHO_DADOS_ORIGINAL = 'data/DADOS_ABERTOS_HEMOVIGILANCIA_UTF8.csv'
-CAMINHO_DADOS = 'data/DADOS_HEMOVIGILANCIA_PROCESSADO.csv' # Novo arquivo com anomalias
-CAMINHO_DADOS_BACKUP = 'data/old.DADOS_ABERTOS_HEMOVIGILANCIA_UTF8.csv'
 CAMINHO_GEOJSON = 'data/br_states.json'
 
-dados_cache = {
-    'df': None,
-    'timestamp': None,
-    'ultima_atualizacao': None
-}
+TOP_K_PADRAO = 10
+TOP_K_MAXIMO = 500
+
+# Threads que montam os gráficos do painel em paralelo.
+PAINEL_THREADS = 4
+# Gráficos que têm versão aproximada (estimada da amostra estratificada) com `aproximado=1`.
+GRAFICOS_APROXIMADOS = ('timeline', 'uf', 'tipo')
+
+# Parâmetros lidos pelas views; os demais não mudam a resposta e ficam fora das chaves.
+PARAMETROS_VIEWS = FILTROS_SUPORTADOS + (
+    'limiar', 'aproximado', 'graficos', 'top_k', 'horizonte', 'limite', 'dimensoes', 'series', 'metricas',
+)
+
+# Requisições GET idênticas e simultâneas (mesma versão dos dados) compartilham uma execução.
+coalescer = coalescer_requisicao(lambda: dados_do_snapshot('versao'), PARAMETROS_VIEWS)
+# Respostas GET em cache por versão dos dados; a popularidade guia o pré-aquecimento após cada atualização.
+cachear = cachear_requisicao(lambda: dados_do_snapshot('versao'), PARAMETROS_VIEWS)
+
+_executor_painel = ThreadPoolExecutor(max_workers=PAINEL_THREADS, thread_name_prefix='painel')
+
+if banco.usar_banco():
+    # Só as colunas de filtro e métricas ficam em memória; linhas completas vêm do SQLite.
+    definir_carregador(banco.carregar_snapshot_banco)
 
 
 def carregar_dados():
-    """Carrega os dados de hemovigilância com cache."""
-    global dados_cache
-    
-    if dados_cache['df'] is not None and dados_cache['timestamp'] is not None:
-        return dados_cache['df'].copy()
-    
+    """Retorna o DataFrame do snapshot compartilhado (somente leitura; copie antes de alterar)."""
     try:
-        if os.path.exists(CAMINHO_DADOS):
-            df = pd.read_csv(CAMINHO_DADOS, sep=';', encoding='ISO-8859-1', on_bad_lines='skip')
-        elif os.path.exists(CAMINHO_DADOS_BACKUP):
-            df = pd.read_csv(CAMINHO_DADOS_BACKUP, sep=';', encoding='ISO-8859-1', on_bad_lines='skip')
-        else:
-            if os.path.exists(CAMINHO_DADOS_ORIGINAL):
-                df = pd.read_csv(CAMINHO_DADOS_ORIGINAL, sep=';', encoding='ISO-8859-1', on_bad_lines='skip')
-            else:
-                return pd.DataFrame()
-        
-        df.columns = df.columns.str.upper().str.strip()
-        
-        if "DATA_OCORRENCIA_EVENTO" in df.columns:
-            df["DATA_OCORRENCIA_EVENTO"] = pd.to_datetime(df["DATA_OCORRENCIA_EVENTO"], errors="coerce", dayfirst=True)
-            df["ANO"] = df["DATA_OCORRENCIA_EVENTO"].dt.year
-            df["MES"] = df["DATA_OCORRENCIA_EVENTO"].dt.month
-        elif "DATA_NOTIFICACAO_EVENTO" in df.columns:
-            df["DATA_NOTIFICACAO_EVENTO"] = pd.to_datetime(df["DATA_NOTIFICACAO_EVENTO"], errors="coerce", dayfirst=True)
-            df["ANO"] = df["DATA_NOTIFICACAO_EVENTO"].dt.year
-            df["MES"] = df["DATA_NOTIFICACAO_EVENTO"].dt.month
-        
-        if "ANOMALIAS" in df.columns:
-            df["anomalias"] = pd.to_numeric(df["ANOMALIAS"], errors="coerce").fillna(0).astype(int)
-        else:
-            df["anomalias"] = 0
-        
-        dados_cache['df'] = df.copy()
-        dados_cache['timestamp'] = datetime.now()
-        
-        try:
-            dados_cache['ultima_atualizacao'] = datetime.fromtimestamp(os.path.getmtime(CAMINHO_DADOS)).strftime('%d/%m/%Y %H:%M:%S')
-        except FileNotFoundError:
-            dados_cache['ultima_atualizacao'] = "N/A (Arquivo principal não encontrado)"
-        
-        return df
-    
+        snapshot = obter_snapshot()
     except Exception as e:
         print(f"Erro ao carregar dados: {e}")
         return pd.DataFrame()
+    return snapshot['df'] if snapshot is not None else pd.DataFrame()
+
+def dados_do_snapshot(chave, padrao=None):
+    """Valor derivado do snapshot atual (ex.: 'ultima_atualizacao', 'ordem_score')."""
+    snapshot = obter_snapshot()
+    return snapshot[chave] if snapshot is not None else padrao
 
 def aplicar_filtros(df, filtros):
-    """Aplica filtros ao DataFrame."""
-    df_filtrado = df.copy()
-    
-    if 'ufs' in filtros and filtros['ufs']:
-        df_filtrado = df_filtrado[df_filtrado['UF_NOTIFICACAO'].isin(filtros['ufs'])]
-    
-    if 'tipos_evento' in filtros and filtros['tipos_evento']:
-        df_filtrado = df_filtrado[df_filtrado['TIPO_REACAO_TRANSFUSIONAL'].isin(filtros['tipos_evento'])]
-    
-    if 'anos' in filtros and filtros['anos']:
-        df_filtrado = df_filtrado[df_filtrado['ANO'].isin(filtros['anos'])]
-    
-    if 'data_inicio' in filtros and filtros['data_inicio']:
-        df_filtrado = df_filtrado[df_filtrado['DATA_OCORRENCIA_EVENTO'] >= pd.to_datetime(filtros['data_inicio'])]
-    
-    if 'data_fim' in filtros and filtros['data_fim']:
-        df_filtrado = df_filtrado[df_filtrado['DATA_OCORRENCIA_EVENTO'] <= pd.to_datetime(filtros['data_fim'])]
-    
-    return df_filtrado
+    """Aplica filtros ao DataFrame; sobre o snapshot, o recorte é memoizado por seleção.
+
+    O filtro `busca` (texto livre na descrição do evento) devolve as linhas
+    ordenadas por relevância.
+    """
+    snapshot = obter_snapshot()
+    if snapshot is not None and df is snapshot['df']:
+        if banco.usar_banco():
+            return filtrar(snapshot, filtros, lambda df, filtros: df.iloc[banco.posicoes(filtros)])
+        return filtrar(snapshot, filtros)
+    return selecionar(df, filtros)
+
+def linhas_completas(df_filtrado, limite):
+    """Primeiras `limite` linhas do recorte com todas as colunas (no modo SQLite, lidas do banco)."""
+    if banco.usar_banco():
+        return banco.linhas_por_posicao(df_filtrado.index[:limite])
+    return df_filtrado.head(limite)
 
 def obter_opcoes_filtro(df):
     """Obtém as opções disponíveis para filtros."""
-    return {
-        'ufs': sorted(df['UF_NOTIFICACAO'].dropna().unique().tolist()) if 'UF_NOTIFICACAO' in df.columns else [],
-        'tipos_evento': sorted(df['TIPO_REACAO_TRANSFUSIONAL'].dropna().unique().tolist()) if 'TIPO_REACAO_TRANSFUSIONAL' in df.columns else [],
-        'anos': sorted(df['ANO'].dropna().unique().astype(int).tolist()) if 'ANO' in df.columns else []
-    }
+    snapshot = obter_snapshot()
+    if snapshot is not None and df is snapshot['df']:
+        return snapshot['opcoes']
+    return opcoes_filtro(df)
+
+def gerar_grafico_metricas(df_filtrado, limiar=None):
+    """Gera gráfico de métricas principais.
 
-def gerar_grafico_metricas(df_filtrado):
-    """Gera gráfico de métricas principais."""
+    Com `limiar`, as anomalias são recontadas a partir de `score_anomalia`
+    (score acima do limiar) em vez da marcação gravada no processamento.
+    """
     total_notificacoes = len(df_filtrado)
-    total_anomalias = df_filtrado['anomalias'].sum() if 'anomalias' in df_filtrado.columns else 0
+    if limiar is not None and 'score_anomalia' in df_filtrado.columns:
+        total_anomalias = int((df_filtrado['score_anomalia'].to_numpy() > limiar).sum())
+    else:
+        total_anomalias = df_filtrado['anomalias'].sum() if 'anomalias' in df_filtrado.columns else 0
     perc_anomalias = (total_anomalias / total_notificacoes * 100) if total_notificacoes > 0 else 0
     
     return {
         'total_notificacoes': total_notificacoes,
         'total_anomalias': total_anomalias,
-        'perc_anomalias': round(perc_anomalias, 2)
+        'perc_anomalias': round(perc_anomalias, 2),
+        'limiar': limiar,
+        'aproximado': False
     }
 
-def gerar_grafico_timeline(df_filtrado):
-    """Gera gráfico de tendência temporal."""
-    if 'ANO' not in df_filtrado.columns or df_filtrado.empty:
+def obter_aproximado_requisicao():
+    """Lê o parâmetro `aproximado` (resposta estimada da amostra, para a primeira exibição)."""
+    return request.args.get('aproximado', '').lower() in ('1', 'true', 'sim')
+
+def selecao_aproximada(filtros):
+    """Amostra do snapshot e a máscara da seleção sobre ela; None se não houver amostra."""
+    snapshot = obter_snapshot()
+    if snapshot is None:
         return None
-    
-    df_ano = df_filtrado.groupby('ANO').size().reset_index(name='Notificações')
+    mascara = mascara_amostra(snapshot, filtros)
+    return None if mascara is None else (snapshot['amostra'], mascara)
+
+def gerar_metricas_aproximadas(aproximacao, limiar=None):
+    """Métricas estimadas da amostra, com intervalos de confiança (mesmas chaves das exatas)."""
+    amostra, mascara = aproximacao
+    df_amostra = amostra['df']
+    if limiar is not None and 'score_anomalia' in df_amostra.columns:
+        anomalia = df_amostra['score_anomalia'].to_numpy() > limiar
+    elif 'anomalias' in df_amostra.columns:
+        anomalia = df_amostra['anomalias'].fillna(0).to_numpy() != 0
+    else:
+        anomalia = np.zeros(len(df_amostra), dtype=bool)
+    return metricas_estimadas(amostra, mascara, anomalia, limiar)
+
+def estimativa_grafico(aproximacao, coluna):
+    """Contagens estimadas por valor da coluna para os gráficos; None fora do modo aproximado."""
+    if aproximacao is None:
+        return None
+    amostra, mascara = aproximacao
+    return contagens_estimadas(amostra, mascara, coluna)
+
+def obter_top_anomalias(df_filtrado, k=TOP_K_PADRAO):
+    """Retorna as `k` notificações do filtro com maior score de anomalia.
+
+    Usa a ordenação global por score calculada no carregamento, de modo que o
+    filtro só precisa marcar as linhas selecionadas, sem reordenar o recorte.
+    """
+    ordem = dados_do_snapshot('ordem_score')
+    if ordem is None or 'score_anomalia' not in df_filtrado.columns or df_filtrado.empty:
+        return df_filtrado.head(0)
+    
+    selecionadas = np.zeros(len(ordem), dtype=bool)
+    selecionadas[df_filtrado.index.to_numpy()] = True
+    posicoes = ordem[selecionadas[ordem]][:k]
+    
+    if banco.usar_banco():
+        return banco.linhas_por_posicao(posicoes)
+    return df_filtrado.loc[posicoes]
+
+def obter_limiar_requisicao():
+    """Lê o parâmetro `limiar` (score de anomalia) da requisição, se informado."""
+    return request.args.get('limiar', type=float)
+
+def exportar_figura(fig, div_id, formato='html'):
+    """Figura como fragmento HTML (páginas) ou como JSON do Plotly (`formato='json'`, montada no navegador)."""
+    if formato == 'json':
+        return fig.to_json()
+    return fig.to_html(include_plotlyjs=False, div_id=div_id)
+
+def gerar_grafico_timeline(df_filtrado, formato='html', estimativa=None):
+    """Gera gráfico de tendência temporal (com `estimativa`, a partir da amostra, com margem de erro)."""
+    if estimativa is not None:
+        if estimativa.empty:
+            return None
+        df_ano = estimativa.sort_values('ANO').rename(columns={'estimativa': 'Notificações'})
+    elif 'ANO' not in df_filtrado.columns or df_filtrado.empty:
+        return None
+    else:
+        df_ano = df_filtrado.groupby('ANO').size().reset_index(name='Notificações')
     
     fig = px.line(df_ano, x='ANO', y='Notificações', markers=True,
-                  title='Tendência de Notificações por Ano',
+                  error_y='erro' if estimativa is not None else None,
+                  title='Tendência de Notificações por Ano' + (' (estimativa)' if estimativa is not None else ''),
                   labels={'ANO': 'Ano', 'Notificações': 'Quantidade'})
     
-    return fig.to_html(include_plotlyjs=False, div_id='timeline-chart')
+    return exportar_figura(fig, 'timeline-chart', formato)
 
-def gerar_grafico_distribuicao_uf(df_filtrado):
-    """Gera gráfico de distribuição por UF."""
-    if 'UF_NOTIFICACAO' not in df_filtrado.columns or df_filtrado.empty:
+def calcular_atrasos(filtros):
+    """Percentis do atraso de notificação da seleção, a partir dos esboços do snapshot.
+
+    Filtros que não são partições dos esboços (datas) caem no cálculo exato.
+    """
+    snapshot = obter_snapshot()
+    if snapshot is None or snapshot['atrasos'] is None:
+        return None
+    filtros = {k: v for k, v in filtros.items() if v and k in FILTROS_SUPORTADOS}
+    if set(filtros) - set(COLUNAS_PARTICAO):
+        resumo = quantis_exatos(aplicar_filtros(snapshot['df'], filtros))
+        return {**resumo, 'aproximado': False, 'por_ano': []}
+    return {**quantis_atraso(snapshot['atrasos'], filtros), 'aproximado': True,
+            'por_ano': quantis_atraso_por(snapshot['atrasos'], filtros, 'anos')}
+
+def gerar_grafico_atrasos(atrasos, formato='html'):
+    """Gera gráfico da mediana, p90 e p99 do atraso de notificação por ano."""
+    if not atrasos or not atrasos['por_ano']:
         return None
     
-    df_uf = df_filtrado['UF_NOTIFICACAO'].value_counts().reset_index()
-    df_uf.columns = ['UF', 'Quantidade']
+    df_atrasos = pd.DataFrame(atrasos['por_ano']).rename(columns={'anos': 'Ano'})
+    df_atrasos = df_atrasos.melt(id_vars='Ano', value_vars=['mediana', 'p90', 'p99'],
+                                 var_name='Percentil', value_name='Dias')
     
-    fig = px.bar(df_uf, x='UF', y='Quantidade', title='Notificações por UF',
-                 labels={'UF': 'Estado', 'Quantidade': 'Quantidade de Notificações'})
+    fig = px.line(df_atrasos, x='Ano', y='Dias', color='Percentil', markers=True,
+                  title='Atraso de Notificação por Ano (mediana, p90 e p99)',
+                  labels={'Dias': 'Dias entre ocorrência e notificação'})
     
-    return fig.to_html(include_plotlyjs=False, div_id='uf-chart')
+    return exportar_figura(fig, 'atrasos-chart', formato)
 
-def gerar_grafico_distribuicao_tipo(df_filtrado):
-    """Gera gráfico de distribuição por tipo de evento."""
-    if 'TIPO_REACAO_TRANSFUSIONAL' not in df_filtrado.columns or df_filtrado.empty:
+def gerar_grafico_distribuicao_uf(df_filtrado, formato='html', estimativa=None):
+    """Gera gráfico de distribuição por UF (com `estimativa`, a partir da amostra, com margem de erro)."""
+    if estimativa is not None:
+        if estimativa.empty:
+            return None
+        df_uf = estimativa.sort_values('estimativa', ascending=False)
+        df_uf.columns = ['UF', 'Quantidade', 'erro']
+    elif 'UF_NOTIFICACAO' not in df_filtrado.columns or df_filtrado.empty:
         return None
+    else:
+        df_uf = df_filtrado['UF_NOTIFICACAO'].value_counts().loc[lambda s: s > 0].reset_index()
+        df_uf.columns = ['UF', 'Quantidade']
     
-    df_tipo = df_filtrado['TIPO_REACAO_TRANSFUSIONAL'].value_counts().reset_index()
-    df_tipo.columns = ['Tipo de Evento', 'Quantidade']
+    fig = px.bar(df_uf, x='UF', y='Quantidade', error_y='erro' if estimativa is not None else None,
+                 title='Notificações por UF' + (' (estimativa)' if estimativa is not None else ''),
+                 labels={'UF': 'Estado', 'Quantidade': 'Quantidade de Notificações'})
+    
+    return exportar_figura(fig, 'uf-chart', formato)
+
+def gerar_grafico_distribuicao_tipo(df_filtrado, formato='html', estimativa=None):
+    """Gera gráfico de distribuição por tipo de evento (com `estimativa`, a partir da amostra)."""
+    if estimativa is not None:
+        if estimativa.empty:
+            return None
+        df_tipo = estimativa.sort_values('estimativa', ascending=False)
+        df_tipo.columns = ['Tipo de Evento', 'Quantidade', 'erro']
+    elif 'TIPO_REACAO_TRANSFUSIONAL' not in df_filtrado.columns or df_filtrado.empty:
+        return None
+    else:
+        df_tipo = df_filtrado['TIPO_REACAO_TRANSFUSIONAL'].value_counts().loc[lambda s: s > 0].reset_index()
+        df_tipo.columns = ['Tipo de Evento', 'Quantidade']
     
     fig = px.bar(df_tipo, x='Tipo de Evento', y='Quantidade', 
-                 title='Distribuição por Tipo de Evento',
+                 error_y='erro' if estimativa is not None else None,
+                 title='Distribuição por Tipo de Evento' + (' (estimativa)' if estimativa is not None else ''),
                  labels={'Tipo de Evento': 'Tipo', 'Quantidade': 'Quantidade'})
     
-    return fig.to_html(include_plotlyjs=False, div_id='tipo-chart')
+    return exportar_figura(fig, 'tipo-chart', formato)
 
-def gerar_mapa_brasil(df_filtrado):
+def gerar_mapa_brasil(df_filtrado, formato='html'):
 
     if 'UF_NOTIFICACAO' not in df_filtrado.columns or df_filtrado.empty:
         return None
@@ -166,7 +272,7 @@ def gerar_mapa_brasil(df_filtrado):
         with open(CAMINHO_GEOJSON, 'r', encoding='utf-8') as f:
             geojson_data = json.load(f)
         
-        df_map_choropleth = df_filtrado.groupby('UF_NOTIFICACAO').size().reset_index(name='Notificações')
+        df_map_choropleth = df_filtrado.groupby('UF_NOTIFICACAO', observed=True).size().reset_index(name='Notificações')
         df_map_choropleth.columns = ['UF', 'Notificações']
         
         fig = px.choropleth(df_map_choropleth, geojson=geojson_data, locations='UF',
@@ -215,15 +321,15 @@ def gerar_mapa_brasil(df_filtrado):
             coloraxis_showscale=True
         )
         
-        return fig.to_html(include_plotlyjs=False, div_id='map-chart')
+        return exportar_figura(fig, 'map-chart', formato)
     
     except Exception as e:
         print(f"Erro ao gerar mapa: {e}")
         return None
 
-def gerar_grafico_correlacao(df_filtrado):
+def gerar_grafico_correlacao(df_filtrado, formato='html'):
     """Gera heatmap de correlação entre variáveis numéricas."""
-    numeric_cols = df_filtrado.select_dtypes(include=['int64', 'float64']).columns
+    numeric_cols = df_filtrado.select_dtypes(include='number').columns
     
     corr_matrix = df_filtrado[numeric_cols].corr()
     
@@ -232,9 +338,11 @@ def gerar_grafico_correlacao(df_filtrado):
     
     fig.update_layout(title='Matriz de Correlação entre Variáveis Numéricas')
     
-    return fig.to_html(include_plotlyjs=False, div_id='correlation-chart')
+    return exportar_figura(fig, 'correlation-chart', formato)
 
 @app.route('/')
+@cachear
+@coalescer
 def index():
     """Página inicial com visão geral."""
     df = carregar_dados()
@@ -243,13 +351,13 @@ def index():
         return render_template('erro.html', mensagem='Nenhum dado disponível')
     
     opcoes_filtro = obter_opcoes_filtro(df)
-    metricas = gerar_grafico_metricas(df)
+    metricas = gerar_grafico_metricas(df, obter_limiar_requisicao())
     
     return render_template('index.html',
                          logo_path='logo_hemovigilancia.png',
                          opcoes_filtro=opcoes_filtro,
                          metricas=metricas,
-                         ultima_atualizacao=dados_cache['ultima_atualizacao'])
+                         ultima_atualizacao=dados_do_snapshot('ultima_atualizacao'))
 
 @app.route('/atualizar-dados')
 def atualizar_dados():
@@ -259,17 +367,18 @@ def atualizar_dados():
 @app.route('/api/executar-atualizacao')
 def executar_atualizacao():
     """API para executar o crawler e atualizar a base de dados em background."""
-    global dados_cache
-    
     try:
         crawler = HemovigilanciaCrawler(base_path=os.path.join(os.path.dirname(__file__), 'data'))
         
         novo_caminho_csv = crawler.run()
         
         if novo_caminho_csv:
-            dados_cache['df'] = None
-            dados_cache['timestamp'] = None
+            invalidar_snapshot()
             carregar_dados()
+            # A vigilância só processa as linhas a partir do mês ainda aberto.
+            obter_vigilancia(obter_snapshot())
+            # As combinações de filtros mais pedidas são renderizadas antes de os usuários chegarem.
+            iniciar_aquecimento(app, lambda: dados_do_snapshot('versao'))
             
             return jsonify({'sucesso': True, 'mensagem': 'Dados atualizados com sucesso!'})
         else:
@@ -281,8 +390,14 @@ def executar_atualizacao():
 
 
 @app.route('/visao-geral')
+@cachear
+@coalescer
 def visao_geral():
-    """Página de visão geral com métricas e tendências."""
+    """Página de visão geral com métricas e tendências.
+
+    Com `aproximado=1`, métricas e tendência saem da amostra (provisórias) e
+    o navegador as troca pelos valores exatos em seguida.
+    """
     df = carregar_dados()
     
     if df.empty:
@@ -291,18 +406,28 @@ def visao_geral():
     filtros = request.args.to_dict(flat=False)
     filtros = {k: v[0].split(',') if v[0] else [] for k, v in filtros.items() if v}
     
-    df_filtrado = aplicar_filtros(df, filtros)
-    metricas = gerar_grafico_metricas(df_filtrado)
-    timeline = gerar_grafico_timeline(df_filtrado)
+    aproximacao = selecao_aproximada(filtros) if obter_aproximado_requisicao() else None
+    if aproximacao is not None:
+        metricas = gerar_metricas_aproximadas(aproximacao, obter_limiar_requisicao())
+        timeline = gerar_grafico_timeline(None, estimativa=estimativa_grafico(aproximacao, 'ANO'))
+    else:
+        df_filtrado = aplicar_filtros(df, filtros)
+        metricas = gerar_grafico_metricas(df_filtrado, obter_limiar_requisicao())
+        timeline = gerar_grafico_timeline(df_filtrado)
+    atrasos = gerar_grafico_atrasos(calcular_atrasos(filtros))
     
     return render_template('visao_geral.html',
                          metricas=metricas,
                          timeline=timeline,
+                         atrasos=atrasos,
+                         provisorios=['timeline'] if aproximacao is not None else [],
                          logo_path='logo_hemovigilancia.png')
 
 @app.route('/distribuicoes')
+@cachear
+@coalescer
 def distribuicoes():
-    """Página de distribuições e análises."""
+    """Página de distribuições e análises (com `aproximado=1`, estimativas provisórias da amostra)."""
     df = carregar_dados()
     
     if df.empty:
@@ -311,17 +436,25 @@ def distribuicoes():
     filtros = request.args.to_dict(flat=False)
     filtros = {k: v[0].split(',') if v[0] else [] for k, v in filtros.items() if v}
     
-    df_filtrado = aplicar_filtros(df, filtros)
-    
-    grafico_uf = gerar_grafico_distribuicao_uf(df_filtrado)
-    grafico_tipo = gerar_grafico_distribuicao_tipo(df_filtrado)
+    aproximacao = selecao_aproximada(filtros) if obter_aproximado_requisicao() else None
+    if aproximacao is not None:
+        grafico_uf = gerar_grafico_distribuicao_uf(None, estimativa=estimativa_grafico(aproximacao, 'UF_NOTIFICACAO'))
+        grafico_tipo = gerar_grafico_distribuicao_tipo(
+            None, estimativa=estimativa_grafico(aproximacao, 'TIPO_REACAO_TRANSFUSIONAL'))
+    else:
+        df_filtrado = aplicar_filtros(df, filtros)
+        grafico_uf = gerar_grafico_distribuicao_uf(df_filtrado)
+        grafico_tipo = gerar_grafico_distribuicao_tipo(df_filtrado)
     
     return render_template('distribuicoes.html',
                          grafico_uf=grafico_uf,
                          grafico_tipo=grafico_tipo,
+                         provisorios=['uf', 'tipo'] if aproximacao is not None else [],
                          logo_path='logo_hemovigilancia.png')
 
 @app.route('/mapa-brasil')
+@cachear
+@coalescer
 def mapa_brasil():
     """Página com mapa interativo do Brasil."""
     df = carregar_dados()
@@ -340,6 +473,8 @@ def mapa_brasil():
                          logo_path='logo_hemovigilancia.png')
 
 @app.route('/correlacao')
+@cachear
+@coalescer
 def correlacao():
     """Página de análise de correlação."""
     df = carregar_dados()
@@ -358,6 +493,8 @@ def correlacao():
                          logo_path='logo_hemovigilancia.png')
 
 @app.route('/dados')
+@cachear
+@coalescer
 def dados():
     """Página de acesso aos dados brutos."""
     df = carregar_dados()
@@ -369,11 +506,12 @@ def dados():
     filtros = {k: v[0].split(',') if v[0] else [] for k, v in filtros.items() if v}
     
     df_filtrado = aplicar_filtros(df, filtros)
+    df_display = linhas_completas(df_filtrado, 1000)
 
-    colunas_remover = ['anomalias', 'ANO', 'MES']
-    colunas_exibir = [col for col in df_filtrado.columns.tolist() if col not in colunas_remover]
+    colunas_remover = ['anomalias', 'score_anomalia', 'ANO', 'MES']
+    colunas_exibir = [col for col in df_display.columns.tolist() if col not in colunas_remover]
     
-    df_display = df_filtrado[colunas_exibir].head(1000)
+    df_display = df_display[colunas_exibir]
     
     return render_template('dados.html',
                          dados=df_display.to_dict('records'),
@@ -382,6 +520,8 @@ def dados():
                          logo_path='logo_hemovigilancia.png')
 
 @app.route('/dados/maximizar')
+@cachear
+@coalescer
 def dados_maximizar():
     """Página de maximização de dados brutos."""
     df = carregar_dados()
@@ -393,11 +533,12 @@ def dados_maximizar():
     filtros = {k: v[0].split(',') if v[0] else [] for k, v in filtros.items() if v}
     
     df_filtrado = aplicar_filtros(df, filtros)
+    df_display = linhas_completas(df_filtrado, 5000)
     
-    colunas_remover = ['anomalias', 'ANO', 'MES']
-    colunas_exibir = [col for col in df_filtrado.columns.tolist() if col not in colunas_remover]
+    colunas_remover = ['anomalias', 'score_anomalia', 'ANO', 'MES']
+    colunas_exibir = [col for col in df_display.columns.tolist() if col not in colunas_remover]
 
-    df_display = df_filtrado[colunas_exibir].head(5000)
+    df_display = df_display[colunas_exibir]
     
     return render_template('dados_maximizar.html',
                          dados=df_display.to_dict('records'),
@@ -407,11 +548,145 @@ def dados_maximizar():
 
 
 @app.route('/api/filtros')
+@cachear
+@coalescer
 def api_filtros():
-    """API para obter opções de filtros."""
+    """API para obter opções de filtros, com a contagem de cada opção (facetas).
+
+    Com a seleção atual na query string, a contagem de cada opção considera
+    os demais filtros ativos. Saem do cubo UF x tipo x ano do snapshot; só
+    com filtros de data ou busca o cubo é refeito sobre o recorte deles.
+    """
     df = carregar_dados()
     opcoes = obter_opcoes_filtro(df)
-    return jsonify(opcoes)
+    snapshot = obter_snapshot()
+    if snapshot is None or snapshot['cubo'] is None:
+        return jsonify(opcoes)
+    
+    filtros = request.args.to_dict(flat=False)
+    filtros = {k: v[0].split(',') if v[0] else [] for k, v in filtros.items() if v}
+    
+    cubo = snapshot['cubo']
+    outros = {k: v for k, v in filtros.items() if k in FILTROS_SUPORTADOS and k not in COLUNAS_FILTRO and v}
+    if outros:
+        cubo = cubo_filtros(aplicar_filtros(df, outros), opcoes)
+    
+    return jsonify({**opcoes, 'contagens': facetas(cubo, opcoes, filtros)})
+
+@app.route('/api/metricas')
+@cachear
+@coalescer
+def api_metricas():
+    """API com as métricas do filtro e as notificações mais anômalas.
+
+    Parâmetros: os filtros usuais, `limiar` (score acima do qual a notificação
+    conta como anomalia), `top_k` (quantidade de notificações mais anômalas) e
+    `aproximado` (métricas estimadas da amostra, com intervalos de confiança;
+    sem a lista de mais anômalas, que só existe exata).
+    """
+    df = carregar_dados()
+    
+    if df.empty:
+        return jsonify({'erro': 'Nenhum dado disponível'}), 400
+    
+    filtros = request.args.to_dict(flat=False)
+    filtros = {k: v[0].split(',') if v[0] else [] for k, v in filtros.items() if v}
+    
+    aproximacao = selecao_aproximada(filtros) if obter_aproximado_requisicao() else None
+    if aproximacao is not None:
+        return jsonify({
+            'metricas': gerar_metricas_aproximadas(aproximacao, obter_limiar_requisicao()),
+            'top_anomalias': []
+        })
+    
+    df_filtrado = aplicar_filtros(df, filtros)
+    metricas = gerar_grafico_metricas(df_filtrado, obter_limiar_requisicao())
+    metricas['total_anomalias'] = int(metricas['total_anomalias'])
+    
+    top_k = max(0, min(request.args.get('top_k', default=TOP_K_PADRAO, type=int), TOP_K_MAXIMO))
+    df_top = obter_top_anomalias(df_filtrado, top_k)
+    df_top = df_top.astype(object).where(df_top.notna(), None)
+    
+    return jsonify({
+        'metricas': metricas,
+        'top_anomalias': df_top.to_dict('records')
+    })
+
+# Gráficos do painel: cada um recebe o recorte já filtrado, os filtros e a aproximação
+# (amostra e máscara, ou None) e devolve o JSON do Plotly.
+GRAFICOS_PAINEL = {
+    'timeline': lambda df_filtrado, filtros, aproximacao: gerar_grafico_timeline(
+        df_filtrado, 'json', estimativa_grafico(aproximacao, 'ANO')),
+    'atrasos': lambda df_filtrado, filtros, aproximacao: gerar_grafico_atrasos(calcular_atrasos(filtros), 'json'),
+    'uf': lambda df_filtrado, filtros, aproximacao: gerar_grafico_distribuicao_uf(
+        df_filtrado, 'json', estimativa_grafico(aproximacao, 'UF_NOTIFICACAO')),
+    'tipo': lambda df_filtrado, filtros, aproximacao: gerar_grafico_distribuicao_tipo(
+        df_filtrado, 'json', estimativa_grafico(aproximacao, 'TIPO_REACAO_TRANSFUSIONAL')),
+    'mapa': lambda df_filtrado, filtros, aproximacao: gerar_mapa_brasil(df_filtrado, 'json'),
+    'correlacao': lambda df_filtrado, filtros, aproximacao: gerar_grafico_correlacao(df_filtrado, 'json'),
+}
+
+def montar_grafico_painel(nome, df_filtrado, filtros, aproximacao=None):
+    """Monta um gráfico do painel; uma falha vira None sem derrubar os demais."""
+    if nome not in GRAFICOS_APROXIMADOS:
+        aproximacao = None
+    try:
+        return GRAFICOS_PAINEL[nome](df_filtrado, filtros, aproximacao)
+    except Exception as e:
+        print(f"⚠️ Erro ao gerar o gráfico '{nome}' do painel: {e}")
+        return None
+
+@app.route('/painel')
+@cachear
+@coalescer
+def painel():
+    """Painel com todas as análises em abas; os dados vêm de uma só chamada a /api/painel."""
+    return render_template('painel.html',
+                         graficos=list(GRAFICOS_PAINEL),
+                         graficos_aproximados=list(GRAFICOS_APROXIMADOS),
+                         logo_path='logo_hemovigilancia.png',
+                         ultima_atualizacao=dados_do_snapshot('ultima_atualizacao'))
+
+@app.route('/api/painel')
+@cachear
+@coalescer
+def api_painel():
+    """API com as métricas e todos os gráficos do painel para uma seleção.
+
+    O filtro é resolvido uma única vez e os gráficos, independentes entre si,
+    são montados em paralelo sobre o mesmo recorte. Parâmetros: os filtros
+    usuais, `limiar`, `graficos` (nomes separados por vírgula; padrão: todos)
+    e `aproximado` (métricas e os gráficos de GRAFICOS_APROXIMADOS estimados
+    da amostra, sem filtrar a base inteira se só eles forem pedidos). Cada
+    gráfico vem como figura do Plotly em JSON, ou null se não houver dados.
+    """
+    df = carregar_dados()
+    
+    if df.empty:
+        return jsonify({'erro': 'Nenhum dado disponível'}), 400
+    
+    filtros = request.args.to_dict(flat=False)
+    filtros = {k: v[0].split(',') if v[0] else [] for k, v in filtros.items() if v}
+    nomes = filtros.pop('graficos', None) or list(GRAFICOS_PAINEL)
+    desconhecidos = [nome for nome in nomes if nome not in GRAFICOS_PAINEL]
+    if desconhecidos:
+        return jsonify({'erro': f"Gráficos desconhecidos: {', '.join(desconhecidos)}"}), 400
+    
+    aproximacao = selecao_aproximada(filtros) if obter_aproximado_requisicao() else None
+    exatos = aproximacao is None or set(nomes) - set(GRAFICOS_APROXIMADOS)
+    df_filtrado = aplicar_filtros(df, filtros) if exatos else None
+    tarefas = {nome: _executor_painel.submit(montar_grafico_painel, nome, df_filtrado, filtros, aproximacao)
+               for nome in dict.fromkeys(nomes)}
+    if aproximacao is not None:
+        metricas = gerar_metricas_aproximadas(aproximacao, obter_limiar_requisicao())
+    else:
+        metricas = gerar_grafico_metricas(df_filtrado, obter_limiar_requisicao())
+        metricas['total_anomalias'] = int(metricas['total_anomalias'])
+    
+    # As figuras já são JSON: entram no corpo sem decodificar e codificar de novo.
+    graficos = ', '.join(f'{json.dumps(nome)}: {tarefa.result() or "null"}' for nome, tarefa in tarefas.items())
+    return Response(f'{{"metricas": {json.dumps(metricas)}, "graficos": {{{graficos}}}}}',
+                    mimetype='application/json')
 
 @app.route('/api/dados-filtrados', methods=['POST'])
 def api_dados_filtrados():
@@ -426,7 +701,7 @@ def api_dados_filtrados():
     
     return jsonify({
         'total': len(df_filtrado),
-        'dados': df_filtrado.head(100).to_dict('records')
+        'dados': linhas_completas(df_filtrado, 100).to_dict('records')
     })
 
 @app.route('/api/exportar-csv')
@@ -440,13 +715,81 @@ def api_exportar_csv():
     filtros = request.args.to_dict(flat=False)
     filtros = {k: v[0].split(',') if v[0] else [] for k, v in filtros.items() if v}
     
-    df_filtrado = aplicar_filtros(df, filtros)
-    csv_data = df_filtrado.to_csv(index=False, sep=';', encoding='ISO-8859-1')
-    
-    return csv_data, 200, {
+    cabecalhos = {
         'Content-Disposition': 'attachment; filename=hemovigilancia_exportado.csv',
         'Content-Type': 'text/csv; charset=ISO-8859-1'
     }
+    
+    if banco.usar_banco():
+        # Lido do banco em blocos e enviado à medida que é gerado.
+        blocos = (bloco.encode('ISO-8859-1', errors='replace') for bloco in banco.blocos_csv(filtros))
+        return Response(stream_with_context(blocos), 200, cabecalhos)
+    
+    df_filtrado = aplicar_filtros(df, filtros)
+    csv_data = df_filtrado.to_csv(index=False, sep=';', encoding='ISO-8859-1')
+    
+    return csv_data, 200, cabecalhos
+
+@app.route('/api/previsao')
+@cachear
+@coalescer
+def api_previsao():
+    """API com a previsão mensal de notificações para a seleção de UFs e tipos de evento.
+
+    Parâmetros: `ufs` e `tipos_evento` (listas separadas por vírgula; vazio =
+    todos) e `horizonte` (meses). A previsão já vem calculada para a versão
+    atual dos dados; aqui só é feita a soma das séries selecionadas.
+    """
+    snapshot = obter_snapshot()
+    if snapshot is None:
+        return jsonify({'erro': 'Nenhum dado disponível'}), 400
+    
+    filtros = request.args.to_dict(flat=False)
+    filtros = {k: v[0].split(',') if v[0] else [] for k, v in filtros.items() if v}
+    horizonte = max(1, min(request.args.get('horizonte', default=12, type=int), HORIZONTE_PREVISAO))
+    
+    previsao = prever_selecao(obter_previsoes(snapshot), filtros.get('ufs'), filtros.get('tipos_evento'), horizonte)
+    if previsao is None:
+        return jsonify({'erro': 'Nenhuma série encontrada para a seleção'}), 404
+    return jsonify(previsao)
+
+@app.route('/api/atrasos')
+@cachear
+@coalescer
+def api_atrasos():
+    """API com mediana, p90 e p99 do atraso de notificação (dias) para a seleção."""
+    filtros = request.args.to_dict(flat=False)
+    filtros = {k: v[0].split(',') if v[0] else [] for k, v in filtros.items() if v}
+    
+    atrasos = calcular_atrasos(filtros)
+    if atrasos is None:
+        return jsonify({'erro': 'Nenhum dado de atraso disponível'}), 400
+    return jsonify(atrasos)
+
+@app.route('/api/alertas')
+@cachear
+@coalescer
+def api_alertas():
+    """API com os alertas de pico (EWMA/CUSUM) por UF e por tipo de reação.
+
+    Parâmetros opcionais: `dimensoes` (UF, TIPO), `series` (ex.: SP,RJ),
+    `metricas` (notificacoes, taxa_anomalias) e `limite`.
+    """
+    snapshot = obter_snapshot()
+    if snapshot is None:
+        return jsonify({'erro': 'Nenhum dado disponível'}), 400
+    
+    filtros = request.args.to_dict(flat=False)
+    filtros = {k: v[0].split(',') if v[0] else [] for k, v in filtros.items() if v}
+    limite = max(1, request.args.get('limite', default=50, type=int))
+    
+    estado = obter_vigilancia(snapshot)
+    alertas = filtrar_alertas(estado, filtros.get('dimensoes'), filtros.get('series'), filtros.get('metricas'), limite)
+    return jsonify({
+        'mes_aberto': rotulo_mes_aberto(estado),
+        'alertas': alertas,
+        'series': resumo_series(estado),
+    })
 
 @app.route('/api/status')
 def api_status():
@@ -454,10 +797,20 @@ def api_status():
     df = carregar_dados()
     return jsonify({
         'status': 'ok' if not df.empty else 'erro',
-        'ultima_atualizacao': dados_cache['ultima_atualizacao'],
-        'total_registros': len(df)
+        'ultima_atualizacao': dados_do_snapshot('ultima_atualizacao'),
+        'total_registros': len(df),
+        'aquecimento': estado_aquecimento()
     })
 
+@app.cli.command('exportar-estatico')
+@click.option('--destino', default=DESTINO_EXPORTACAO, show_default=True, help='Diretório de saída.')
+@click.option('--processos', type=int, default=None, help='Processos em paralelo (padrão: número de CPUs).')
+def exportar_estatico(destino, processos):
+    """Exporta as páginas (visão global e por UF) para um diretório estático pré-comprimido."""
+    carregar_dados()
+    exportar_site(app, destino, processos)
+
 if __name__ == '__main__':
     carregar_dados()
+    iniciar_aquecimento(app, lambda: dados_do_snapshot('versao'))
     app.run(debug=True)
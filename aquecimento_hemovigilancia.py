@@ -0,0 +1,244 @@
+"""
+Pré-aquecimento das respostas mais populares após cada troca dos dados.
+
+Cada GET das views decoradas registra a combinação rota + parâmetros
+normalizados num contador de popularidade com decaimento exponencial
+(meia-vida MEIA_VIDA_POPULARIDADE_HORAS), gravado em disco de tempos em
+tempos. As respostas ficam num cache em memória chaveado pela versão dos
+dados, de modo que uma troca de versão invalida tudo de uma vez.
+
+Depois da troca (`iniciar_aquecimento`), uma thread em segundo plano
+renderiza as TOP_N_AQUECIMENTO combinações mais populares pela própria
+aplicação, antes que os usuários cheguem a elas. O progresso fica em
+`estado_aquecimento()`.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+import joblib
+from flask import current_app, request
+
+from coalescencia_hemovigilancia import parametros_normalizados
+
+CAMINHO_POPULARIDADE = 'data/popularidade.joblib'
+MEIA_VIDA_POPULARIDADE_HORAS = 72
+TOP_N_AQUECIMENTO = 20
+# Acessos entre gravações do contador em disco.
+SALVAR_A_CADA = 50
+# Combinações com peso decaído abaixo disso são esquecidas ao gravar.
+PESO_MINIMO = 0.05
+# Acima disso o contador é podado, mantendo as 3/4 mais populares.
+MAX_COMBINACOES = 2000
+# Limite do cache de respostas (soma dos corpos, em bytes).
+LIMITE_CACHE_RESPOSTAS = 64 * 1024 * 1024
+# Marca no environ das requisições feitas pelo próprio aquecimento (não contam popularidade).
+MARCA_AQUECIMENTO = 'hemovigilancia.aquecimento'
+
+_trava = threading.Lock()
+_popularidade = None
+_acessos_nao_salvos = 0
+_respostas = OrderedDict()
+_bytes_respostas = 0
+_estado = {'versao': None, 'total': 0, 'concluidas': 0, 'falhas': 0,
+           'em_andamento': False, 'inicio': None, 'fim': None}
+
+
+def peso_decaido(peso, atualizado, agora):
+    """Peso de uma combinação trazido do instante `atualizado` para `agora`."""
+    return peso * 0.5 ** ((agora - atualizado) / (MEIA_VIDA_POPULARIDADE_HORAS * 3600))
+
+
+def carregar_popularidade(caminho=CAMINHO_POPULARIDADE):
+    """Contador salvo ({(rota, parametros): (peso, atualizado)}), ou vazio."""
+    if not os.path.exists(caminho):
+        return {}
+    try:
+        return joblib.load(caminho)
+    except Exception as e:
+        print(f"⚠️ Não foi possível carregar a popularidade das consultas: {e}")
+        return {}
+
+
+def salvar_popularidade(caminho=CAMINHO_POPULARIDADE, agora=None):
+    """Grava o contador, descartando as combinações cujo peso decaiu abaixo de PESO_MINIMO."""
+    global _acessos_nao_salvos
+    agora = time.time() if agora is None else agora
+    with _trava:
+        contador = _obter_popularidade()
+        for chave in [chave for chave, (peso, atualizado) in contador.items()
+                      if peso_decaido(peso, atualizado, agora) < PESO_MINIMO]:
+            del contador[chave]
+        contador = dict(contador)
+        _acessos_nao_salvos = 0
+    try:
+        caminho_temporario = caminho + '.tmp'
+        joblib.dump(contador, caminho_temporario)
+        os.replace(caminho_temporario, caminho)
+    except Exception as e:
+        print(f"⚠️ Não foi possível salvar a popularidade das consultas: {e}")
+
+
+def _obter_popularidade():
+    # Chamada com a trava adquirida.
+    global _popularidade
+    if _popularidade is None:
+        _popularidade = carregar_popularidade()
+    return _popularidade
+
+
+def _podar(contador, agora):
+    # Chamada com a trava adquirida.
+    pesos = sorted(((peso_decaido(peso, atualizado, agora), chave)
+                    for chave, (peso, atualizado) in contador.items()), key=lambda item: item[0])
+    for _, chave in pesos[:len(pesos) - MAX_COMBINACOES * 3 // 4]:
+        del contador[chave]
+
+
+def registrar_acesso(rota, parametros, agora=None):
+    """Soma 1 ao peso decaído da combinação; grava em disco a cada SALVAR_A_CADA acessos."""
+    global _acessos_nao_salvos
+    agora = time.time() if agora is None else agora
+    with _trava:
+        contador = _obter_popularidade()
+        peso, atualizado = contador.get((rota, parametros), (0.0, agora))
+        contador[(rota, parametros)] = (peso_decaido(peso, atualizado, agora) + 1, agora)
+        if len(contador) > MAX_COMBINACOES:
+            _podar(contador, agora)
+        _acessos_nao_salvos += 1
+        salvar = _acessos_nao_salvos >= SALVAR_A_CADA
+    if salvar:
+        salvar_popularidade()
+
+
+def mais_populares(n=TOP_N_AQUECIMENTO, agora=None):
+    """As `n` combinações (rota, parametros) de maior peso decaído, da mais para a menos popular."""
+    agora = time.time() if agora is None else agora
+    with _trava:
+        pesos = [(peso_decaido(peso, atualizado, agora), chave)
+                 for chave, (peso, atualizado) in _obter_popularidade().items()]
+    pesos.sort(key=lambda item: item[0], reverse=True)
+    return [chave for _, chave in pesos[:n]]
+
+
+def url_da_combinacao(rota, parametros):
+    """URL equivalente a uma combinação normalizada."""
+    if not parametros:
+        return rota
+    return rota + '?' + urlencode([(nome, ','.join(valores)) for nome, valores in parametros])
+
+
+def resposta_em_cache(chave):
+    with _trava:
+        resposta = _respostas.get(chave)
+        if resposta is not None:
+            _respostas.move_to_end(chave)
+        return resposta
+
+
+def guardar_resposta(chave, resposta):
+    """Guarda a resposta (corpo, status, cabeçalhos), descartando as menos usadas acima do limite."""
+    global _bytes_respostas
+    tamanho = len(resposta[0])
+    if tamanho > LIMITE_CACHE_RESPOSTAS:
+        return
+    with _trava:
+        if chave in _respostas:
+            _bytes_respostas -= len(_respostas.pop(chave)[0])
+        _respostas[chave] = resposta
+        _bytes_respostas += tamanho
+        while _bytes_respostas > LIMITE_CACHE_RESPOSTAS:
+            _, antiga = _respostas.popitem(last=False)
+            _bytes_respostas -= len(antiga[0])
+
+
+def descartar_versoes_antigas(versao):
+    """Remove do cache as respostas de outras versões dos dados."""
+    global _bytes_respostas
+    with _trava:
+        for chave in [chave for chave in _respostas if chave[0] != versao]:
+            _bytes_respostas -= len(_respostas.pop(chave)[0])
+
+
+def cachear_requisicao(versao, permitidos=None):
+    """Decorador de view: registra a popularidade do GET e serve a resposta do cache da versão.
+
+    Use abaixo do @app.route e acima do coalescedor, para que as falhas de
+    cache simultâneas ainda compartilhem uma execução. Só os parâmetros
+    `permitidos` (todos, se None) entram na chave e na popularidade. Só
+    respostas 200 são guardadas.
+    """
+    def decorador(view):
+        @wraps(view)
+        def envoltorio(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+            parametros = parametros_normalizados(permitidos)
+            if not request.environ.get(MARCA_AQUECIMENTO):
+                registrar_acesso(request.path, parametros)
+            chave = (versao(), request.path, parametros)
+            guardada = resposta_em_cache(chave)
+            if guardada is None:
+                resposta = current_app.make_response(view(*args, **kwargs))
+                if resposta.status_code != 200 or resposta.is_streamed:
+                    return resposta
+                guardada = (resposta.get_data(), resposta.status_code, list(resposta.headers.items()))
+                guardar_resposta(chave, guardada)
+            corpo, status, cabecalhos = guardada
+            return current_app.response_class(corpo, status=status, headers=cabecalhos)
+        return envoltorio
+    return decorador
+
+
+def estado_aquecimento():
+    """Progresso do último aquecimento (para /api/status)."""
+    with _trava:
+        return dict(_estado)
+
+
+def _aquecer(app, versao, combinacoes, versao_atual):
+    cliente = app.test_client()
+    for rota, parametros in combinacoes:
+        if versao_atual() != versao:
+            # Os dados mudaram de novo: o próximo aquecimento assume.
+            break
+        try:
+            resposta = cliente.get(url_da_combinacao(rota, parametros),
+                                   environ_overrides={MARCA_AQUECIMENTO: True})
+            sucesso = resposta.status_code == 200
+        except Exception as e:
+            print(f"⚠️ Falha ao pré-aquecer {rota}: {e}")
+            sucesso = False
+        with _trava:
+            if _estado['versao'] != versao:
+                # Um aquecimento mais novo já assumiu o progresso.
+                break
+            _estado['concluidas'] += 1
+            _estado['falhas'] += 0 if sucesso else 1
+    with _trava:
+        if _estado['versao'] == versao:
+            _estado['em_andamento'] = False
+            _estado['fim'] = datetime.now().isoformat(timespec='seconds')
+
+
+def iniciar_aquecimento(app, versao_atual, n=TOP_N_AQUECIMENTO):
+    """Renderiza em segundo plano as `n` combinações mais populares para a versão atual dos dados."""
+    versao = versao_atual()
+    descartar_versoes_antigas(versao)
+    salvar_popularidade()
+    combinacoes = mais_populares(n)
+    with _trava:
+        _estado.update({'versao': versao, 'total': len(combinacoes), 'concluidas': 0, 'falhas': 0,
+                        'em_andamento': bool(combinacoes), 'inicio': datetime.now().isoformat(timespec='seconds'),
+                        'fim': None})
+    if not combinacoes:
+        return None
+    thread = threading.Thread(target=_aquecer, args=(app, versao, combinacoes, versao_atual),
+                              name='aquecimento', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,133 @@
+"""
+Esboços de quantis do atraso de notificação (TEMPO_NOTIFICACAO_DIAS).
+
+Cada partição UF x ano x tipo de reação guarda um histograma em faixas
+logarítmicas (como o DDSketch): a faixa de um valor x > 0 é
+ceil(log_gamma(x)), com gamma = (1 + ALFA) / (1 - ALFA), e o quantil
+estimado tem erro relativo de no máximo ALFA. Atrasos zero (ou negativos,
+inconsistentes) ficam numa faixa própria. Como todas as partições usam as
+mesmas faixas, juntar partições é somar contagens: os percentis de qualquer
+seleção saem da soma das linhas, sem ordenar os dados.
+"""
+
+import numpy as np
+import pandas as pd
+
+COLUNA_ATRASO = 'TEMPO_NOTIFICACAO_DIAS'
+ALFA_ESBOCO = 0.01
+GAMMA_ESBOCO = (1 + ALFA_ESBOCO) / (1 - ALFA_ESBOCO)
+# Faixas até ~100 anos de atraso; acima disso, tudo na última faixa.
+N_FAIXAS = int(np.ceil(np.log(36500) / np.log(GAMMA_ESBOCO))) + 2
+QUANTIS_ATRASO = {'mediana': 0.5, 'p90': 0.9, 'p99': 0.99}
+# Filtro -> coluna das partições.
+COLUNAS_PARTICAO = {
+    'ufs': 'UF_NOTIFICACAO',
+    'anos': 'ANO',
+    'tipos_evento': 'TIPO_REACAO_TRANSFUSIONAL',
+}
+
+# Valor representativo de cada faixa (a faixa 0 é o atraso zero).
+_VALORES_FAIXA = np.concatenate(([0.0], 2 * GAMMA_ESBOCO ** np.arange(N_FAIXAS - 1) / (GAMMA_ESBOCO + 1)))
+# A faixa i >= 2 cobre (gamma^(i-2), gamma^(i-1)]; a faixa 1 cobre (0, 1].
+_VALORES_FAIXA[1] = 1.0
+
+
+def faixa_atraso(valores):
+    """Índice da faixa de cada atraso (em dias)."""
+    valores = np.asarray(valores, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        faixas = np.ceil(np.log(valores) / np.log(GAMMA_ESBOCO)) + 1
+    faixas = np.where(valores > 0, np.clip(faixas, 1, N_FAIXAS - 1), 0)
+    return faixas.astype(np.int64)
+
+
+def construir_esbocos(df):
+    """Esboço de cada partição UF x ano x tipo presente nos dados; None sem a coluna de atraso."""
+    colunas = list(COLUNAS_PARTICAO.values())
+    if COLUNA_ATRASO not in df.columns or not set(colunas) <= set(df.columns):
+        return None
+    atrasos = pd.to_numeric(df[COLUNA_ATRASO], errors='coerce').to_numpy(dtype=float)
+    validas = ~np.isnan(atrasos)
+
+    codigo_particao = np.zeros(len(df), dtype=np.int64)
+    rotulos = []
+    for coluna in colunas:
+        codigos, unicos = pd.factorize(df[coluna], use_na_sentinel=False)
+        codigo_particao = codigo_particao * len(unicos) + codigos
+        rotulos.append(np.asarray(unicos, dtype=object))
+    particao, combinacoes = pd.factorize(codigo_particao[validas])
+
+    contagens = np.bincount(particao * N_FAIXAS + faixa_atraso(atrasos[validas]),
+                            minlength=len(combinacoes) * N_FAIXAS).reshape(len(combinacoes), N_FAIXAS)
+    esbocos = {'contagens': contagens.astype(np.int32)}
+    # Decompõe o código combinado de volta nos rótulos de cada coluna.
+    resto = np.asarray(combinacoes, dtype=np.int64)
+    for (filtro, _), unicos in reversed(list(zip(COLUNAS_PARTICAO.items(), rotulos))):
+        esbocos[filtro] = np.array([str(v) for v in unicos[resto % len(unicos)]], dtype=object)
+        resto = resto // len(unicos)
+    # Anos como inteiro em texto, igual aos filtros vindos da URL.
+    esbocos['anos'] = np.array([str(int(float(a))) if a not in ('nan', '<NA>', 'None') else a
+                                for a in esbocos['anos']], dtype=object)
+    # Códigos inteiros por filtro: a seleção compara inteiros, não textos.
+    esbocos['codigos'] = {}
+    for filtro in COLUNAS_PARTICAO:
+        codigos, unicos = pd.factorize(esbocos[filtro])
+        esbocos['codigos'][filtro] = (codigos, {rotulo: i for i, rotulo in enumerate(unicos)})
+    esbocos['total'] = contagens.sum(axis=0)
+    return esbocos
+
+
+def particoes_da_selecao(esbocos, filtros):
+    """Máscara das partições que compõem a seleção (filtros vazios = todos)."""
+    mascara = None
+    for filtro in COLUNAS_PARTICAO:
+        valores = filtros.get(filtro)
+        if not valores:
+            continue
+        if filtro == 'anos':
+            valores = [str(int(v)) for v in pd.to_numeric(pd.Series(list(valores)), errors='coerce').dropna()]
+        codigos, por_rotulo = esbocos['codigos'][filtro]
+        selecionados = [por_rotulo[str(v)] for v in valores if str(v) in por_rotulo]
+        atual = np.isin(codigos, selecionados)
+        mascara = atual if mascara is None else mascara & atual
+    return np.ones(len(esbocos['contagens']), dtype=bool) if mascara is None else mascara
+
+
+def quantis_das_contagens(contagens, quantis=QUANTIS_ATRASO):
+    """Quantis estimados a partir de um histograma mesclado; None se vazio."""
+    total = int(contagens.sum())
+    if not total:
+        return {'n': 0, **{nome: None for nome in quantis}}
+    acumulado = np.cumsum(contagens)
+    resultado = {'n': total}
+    for nome, q in quantis.items():
+        faixa = int(np.searchsorted(acumulado, q * (total - 1), side='right'))
+        resultado[nome] = round(float(_VALORES_FAIXA[faixa]), 1)
+    return resultado
+
+
+def quantis_atraso(esbocos, filtros=None, quantis=QUANTIS_ATRASO):
+    """Mediana, p90 e p99 do atraso da seleção, mesclando os esboços das partições."""
+    filtros = {nome: valores for nome, valores in (filtros or {}).items() if nome in COLUNAS_PARTICAO and valores}
+    if not filtros:
+        return quantis_das_contagens(esbocos['total'], quantis)
+    mascara = particoes_da_selecao(esbocos, filtros)
+    return quantis_das_contagens(esbocos['contagens'][mascara].sum(axis=0), quantis)
+
+
+def quantis_atraso_por(esbocos, filtros=None, por='anos', quantis=QUANTIS_ATRASO):
+    """Quantis da seleção separados por um dos filtros (ex.: por ano), em ordem."""
+    mascara = particoes_da_selecao(esbocos, filtros or {})
+    grupos, rotulos = pd.factorize(esbocos[por][mascara], sort=True)
+    mescladas = np.zeros((len(rotulos), N_FAIXAS), dtype=np.int64)
+    np.add.at(mescladas, grupos, esbocos['contagens'][mascara])
+    return [{por: rotulo, **quantis_das_contagens(linha, quantis)} for rotulo, linha in zip(rotulos, mescladas)]
+
+
+def quantis_exatos(df, quantis=QUANTIS_ATRASO):
+    """Quantis exatos sobre as linhas (para filtros que não correspondem a partições)."""
+    atrasos = pd.to_numeric(df[COLUNA_ATRASO], errors='coerce').dropna().to_numpy(dtype=float)
+    if not len(atrasos):
+        return {'n': 0, **{nome: None for nome in quantis}}
+    valores = np.quantile(np.clip(atrasos, 0, None), list(quantis.values()))
+    return {'n': int(len(atrasos)), **{nome: round(float(v), 1) for nome, v in zip(quantis, valores)}}
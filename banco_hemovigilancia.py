@@ -0,0 +1,230 @@
+"""
+Backend opcional em SQLite para servir os dados sem o DataFrame completo.
+
+Com HEMOVIGILANCIA_BACKEND=sqlite o CSV processado é importado em blocos
+para data/hemovigilancia.sqlite, com índices compostos nas colunas de
+filtro e nas datas e uma tabela FTS5 para a busca textual. O snapshot em
+memória passa a ter só as colunas usadas nos filtros, gráficos e métricas;
+os filtros são resolvidos em SQL (posições das linhas, já na ordem de
+relevância quando há busca) e as linhas completas das páginas de dados e
+das exportações são lidas do banco sob demanda.
+
+O banco é refeito quando o CSV de origem muda (nome, tamanho e data de
+modificação, como a `versao` do snapshot).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from busca_hemovigilancia import COLUNA_BUSCA, TOKENIZADOR_BUSCA, consulta_fts, texto_busca
+from dataset_hemovigilancia import COLUNAS_FILTRO, FONTES_SNAPSHOT, montar_snapshot, versao_arquivos
+from esquema_hemovigilancia import (
+    SEPARADOR_CSV, aplicar_esquema, converter_datas, ler_csv_em_blocos, resolver_formato_data,
+)
+
+BACKEND_DADOS = os.environ.get('HEMOVIGILANCIA_BACKEND', 'pandas')
+CAMINHO_BANCO = 'data/hemovigilancia.sqlite'
+TABELA_NOTIFICACOES = 'notificacoes'
+TABELA_BUSCA = 'busca'
+TAMANHO_BLOCO_BANCO = 100000
+INDICES_BANCO = {
+    'idx_uf_ano': ('UF_NOTIFICACAO', 'ANO'),
+    'idx_tipo_ano': ('TIPO_REACAO_TRANSFUSIONAL', 'ANO'),
+    'idx_data_ocorrencia': ('DATA_OCORRENCIA_EVENTO',),
+    'idx_data_notificacao': ('DATA_NOTIFICACAO_EVENTO',),
+}
+# Colunas carregadas no snapshot em memória no modo SQLite.
+COLUNAS_MEMORIA = [
+    'UF_NOTIFICACAO', 'TIPO_REACAO_TRANSFUSIONAL', 'DATA_OCORRENCIA_EVENTO', 'DATA_NOTIFICACAO_EVENTO',
+    'ANO', 'MES', 'TEMPO_NOTIFICACAO_DIAS', 'IDADE_PACIENTE', 'SCORE_ANOMALIA', 'ANOMALIAS',
+    'GRAU_RISCO_PREVISTO',
+]
+FORMATO_DATA_BANCO = '%Y-%m-%d %H:%M:%S'
+
+_trava_banco = threading.Lock()
+_local = threading.local()
+_versao_banco = None
+
+
+def usar_banco():
+    return BACKEND_DADOS == 'sqlite'
+
+
+def fonte_banco(fontes=FONTES_SNAPSHOT):
+    """Primeiro CSV existente entre as fontes; None se nenhum existir."""
+    return next((f for f in fontes if f.endswith('.csv') and os.path.exists(f)), None)
+
+
+def construir_banco(caminho_csv, caminho=CAMINHO_BANCO, tamanho_bloco=TAMANHO_BLOCO_BANCO):
+    """Importa o CSV em blocos para um banco novo (gravado ao lado e renomeado no fim)."""
+    caminho_temporario = caminho + '.tmp'
+    if os.path.exists(caminho_temporario):
+        os.remove(caminho_temporario)
+    conexao = sqlite3.connect(caminho_temporario)
+    try:
+        formato_data = None
+        for bloco in ler_csv_em_blocos(caminho_csv, tamanho_bloco):
+            if formato_data is None:
+                amostra = bloco.get('DATA_OCORRENCIA_EVENTO', pd.Series(dtype=object))
+                formato_data = resolver_formato_data(amostra)
+            bloco = converter_datas(bloco, formato_data)
+            if 'ANO' not in bloco.columns and 'DATA_OCORRENCIA_EVENTO' in bloco.columns:
+                bloco['ANO'] = bloco['DATA_OCORRENCIA_EVENTO'].dt.year.astype('Int32')
+                bloco['MES'] = bloco['DATA_OCORRENCIA_EVENTO'].dt.month.astype('Int32')
+            bloco.to_sql(TABELA_NOTIFICACOES, conexao, if_exists='append', index=False)
+
+        colunas = {linha[1] for linha in conexao.execute(f"PRAGMA table_info({TABELA_NOTIFICACOES})")}
+        for nome, colunas_indice in INDICES_BANCO.items():
+            if set(colunas_indice) <= colunas:
+                conexao.execute(f"CREATE INDEX {nome} ON {TABELA_NOTIFICACOES} ({', '.join(colunas_indice)})")
+        if COLUNA_BUSCA in colunas:
+            conexao.execute(
+                f"CREATE VIRTUAL TABLE {TABELA_BUSCA} USING fts5({COLUNA_BUSCA}, content='{TABELA_NOTIFICACOES}', "
+                f"content_rowid='rowid', tokenize='{TOKENIZADOR_BUSCA}')"
+            )
+            conexao.execute(f"INSERT INTO {TABELA_BUSCA}({TABELA_BUSCA}) VALUES ('rebuild')")
+        conexao.execute("CREATE TABLE meta (chave TEXT PRIMARY KEY, valor TEXT)")
+        conexao.execute("INSERT INTO meta VALUES ('versao', ?)", (versao_arquivos([caminho_csv]),))
+        conexao.commit()
+        conexao.execute("ANALYZE")
+    finally:
+        conexao.close()
+    os.replace(caminho_temporario, caminho)
+
+
+def versao_gravada(caminho=CAMINHO_BANCO):
+    if not os.path.exists(caminho):
+        return None
+    try:
+        with sqlite3.connect(f"file:{caminho}?mode=ro", uri=True) as conexao:
+            return conexao.execute("SELECT valor FROM meta WHERE chave = 'versao'").fetchone()[0]
+    except sqlite3.Error:
+        return None
+
+
+def obter_banco(fontes=FONTES_SNAPSHOT, caminho=CAMINHO_BANCO):
+    """Versão do banco, refazendo-o se a fonte mudou; None se não houver CSV de origem."""
+    global _versao_banco
+    with _trava_banco:
+        fonte = fonte_banco(fontes)
+        if fonte is None:
+            return versao_gravada(caminho)
+        versao = versao_arquivos([fonte])
+        if versao_gravada(caminho) != versao:
+            print(f"🗄️ Importando {fonte} para {caminho}...")
+            construir_banco(fonte, caminho)
+        _versao_banco = versao
+    return versao
+
+
+def _conexao(caminho=CAMINHO_BANCO):
+    """Conexão somente leitura da thread atual (reaberta quando o banco é refeito)."""
+    if getattr(_local, 'versao', None) != _versao_banco or getattr(_local, 'conexao', None) is None:
+        if getattr(_local, 'conexao', None) is not None:
+            _local.conexao.close()
+        _local.conexao = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+        _local.versao = _versao_banco
+    return _local.conexao
+
+
+def _data_sql(valor):
+    valor = valor[0] if isinstance(valor, (list, tuple)) else valor
+    return pd.to_datetime(valor).strftime(FORMATO_DATA_BANCO)
+
+
+def clausula_filtros(filtros):
+    """WHERE (com parâmetros) da seleção, sem a busca textual."""
+    condicoes, parametros = [], []
+    for nome, coluna in COLUNAS_FILTRO.items():
+        valores = filtros.get(nome)
+        if not valores:
+            continue
+        valores = list(valores)
+        if nome == 'anos':
+            valores = [int(v) for v in pd.to_numeric(pd.Series(valores), errors='coerce').dropna()]
+        else:
+            valores = [str(v) for v in valores]
+        condicoes.append(f"n.{coluna} IN ({', '.join('?' * len(valores))})" if valores else "0")
+        parametros += valores
+    if filtros.get('data_inicio'):
+        condicoes.append("n.DATA_OCORRENCIA_EVENTO >= ?")
+        parametros.append(_data_sql(filtros['data_inicio']))
+    if filtros.get('data_fim'):
+        condicoes.append("n.DATA_OCORRENCIA_EVENTO <= ?")
+        parametros.append(_data_sql(filtros['data_fim']))
+    return (' AND '.join(condicoes) or '1'), parametros
+
+
+def _consulta_selecao(filtros, colunas='n.rowid', sufixo=None):
+    """SELECT da seleção; com busca, junta a tabela FTS5 e ordena pela relevância.
+
+    `sufixo` (ex.: GROUP BY) substitui a ordenação.
+    """
+    onde, parametros = clausula_filtros(filtros)
+    consulta = texto_busca(filtros.get('busca'))
+    if not consulta:
+        return f"SELECT {colunas} FROM {TABELA_NOTIFICACOES} n WHERE {onde} {sufixo or 'ORDER BY n.rowid'}", parametros
+    expressao = consulta_fts(consulta)
+    if expressao is None:
+        return f"SELECT {colunas} FROM {TABELA_NOTIFICACOES} n WHERE 0 {sufixo or ''}", []
+    sql = (f"SELECT {colunas} FROM {TABELA_BUSCA} b JOIN {TABELA_NOTIFICACOES} n ON n.rowid = b.rowid "
+           f"WHERE {TABELA_BUSCA} MATCH ? AND {onde} {sufixo or 'ORDER BY b.rank'}")
+    return sql, [expressao] + parametros
+
+
+def posicoes(filtros):
+    """Posições (0-based, na ordem do snapshot) das linhas da seleção, calculadas no banco."""
+    sql, parametros = _consulta_selecao(filtros)
+    linhas = _conexao().execute(sql, parametros).fetchall()
+    return np.fromiter((rowid - 1 for (rowid,) in linhas), dtype=np.int64, count=len(linhas))
+
+
+def _tipar(df):
+    return aplicar_esquema(df, datas=False).pipe(converter_datas, FORMATO_DATA_BANCO)
+
+
+def linhas_por_posicao(posicoes_linhas, colunas=None):
+    """Linhas completas (ou só `colunas`) das posições dadas, na mesma ordem."""
+    lista = ', '.join(f'n.{c}' for c in colunas) if colunas else 'n.*'
+    posicoes_linhas = np.asarray(posicoes_linhas, dtype=np.int64)
+    df = pd.read_sql_query(
+        f"SELECT n.rowid AS _rowid, {lista} FROM {TABELA_NOTIFICACOES} n "
+        f"WHERE n.rowid IN (SELECT value FROM json_each(?))",
+        _conexao(), params=(json.dumps((posicoes_linhas + 1).tolist()),)
+    )
+    df = df.set_index('_rowid').reindex(posicoes_linhas + 1)
+    df.index = pd.Index(posicoes_linhas)
+    return _tipar(df)
+
+
+def blocos_csv(filtros, tamanho_bloco=TAMANHO_BLOCO_BANCO, sep=SEPARADOR_CSV):
+    """Gera o CSV da seleção em blocos de texto, sem montar o resultado inteiro em memória."""
+    sql, parametros = _consulta_selecao(filtros, 'n.*')
+    # Conexão própria: o gerador pode ser consumido depois que a requisição terminou.
+    conexao = sqlite3.connect(f"file:{CAMINHO_BANCO}?mode=ro", uri=True)
+    try:
+        primeiro = True
+        for bloco in pd.read_sql_query(sql, conexao, params=parametros, chunksize=tamanho_bloco):
+            yield bloco.to_csv(index=False, sep=sep, header=primeiro)
+            primeiro = False
+        if primeiro:
+            colunas = [linha[1] for linha in conexao.execute(f"PRAGMA table_info({TABELA_NOTIFICACOES})")]
+            yield sep.join(colunas) + '\n'
+    finally:
+        conexao.close()
+
+
+def carregar_snapshot_banco(fontes=FONTES_SNAPSHOT):
+    """Snapshot com só as COLUNAS_MEMORIA, lidas do banco; None se não houver dados."""
+    versao = obter_banco(fontes)
+    if versao is None:
+        return None
+    existentes = {linha[1] for linha in _conexao().execute(f"PRAGMA table_info({TABELA_NOTIFICACOES})")}
+    colunas = [c for c in COLUNAS_MEMORIA if c in existentes]
+    df = pd.read_sql_query(f"SELECT {', '.join(colunas)} FROM {TABELA_NOTIFICACOES} ORDER BY rowid", _conexao())
+    return montar_snapshot(_tipar(df), f"sqlite:{versao}", CAMINHO_BANCO)
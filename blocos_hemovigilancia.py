@@ -0,0 +1,30 @@
+"""
+Parâmetros comuns às etapas que leem o CSV em blocos e as distribuem em processos.
+
+Ficam aqui, e não no data_processor, para que anonimização, qualidade,
+gráficos e modelo de risco os importem no topo sem import circular (o
+data_processor importa esses módulos).
+"""
+
+import os
+
+from esquema_hemovigilancia import ler_csv_em_blocos, resolver_formato_data
+
+TAMANHO_BLOCO_PADRAO = 100_000
+
+
+def resolver_n_jobs(n_jobs):
+    """Converte `n_jobs` no padrão do scikit-learn (None, -1, ...) em número de processos."""
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return max(1, n_jobs)
+
+
+def inferir_formato_data(caminho):
+    """Formato de DATA_OCORRENCIA_EVENTO, resolvido sobre o primeiro bloco com valores preenchidos."""
+    for bloco in ler_csv_em_blocos(caminho, 1000, colunas=['DATA_OCORRENCIA_EVENTO']):
+        if 'DATA_OCORRENCIA_EVENTO' in bloco.columns and bloco['DATA_OCORRENCIA_EVENTO'].notna().any():
+            return resolver_formato_data(bloco['DATA_OCORRENCIA_EVENTO'])
+    return None
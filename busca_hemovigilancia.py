@@ -0,0 +1,81 @@
+"""
+Busca textual na descrição dos eventos (DS_ESPECIFICACAO_EVENTO).
+
+O índice é uma tabela FTS5 do SQLite em memória, com tokenização unicode61
+sem acentos (remove_diacritics 2): "reacao" encontra "reação". As
+descrições se repetem muito, então só os textos distintos são indexados; o
+código de cada linha (pd.factorize) leva o resultado de volta às linhas. A
+ordem de relevância é a do bm25 do FTS5.
+
+Sintaxe da consulta: palavras (todas obrigatórias), "frases entre aspas" e
+prefixos com * (ex.: hipoten*).
+"""
+
+import re
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+COLUNA_BUSCA = 'DS_ESPECIFICACAO_EVENTO'
+TOKENIZADOR_BUSCA = 'unicode61 remove_diacritics 2'
+
+_TERMOS_CONSULTA = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def texto_busca(valor):
+    """Consulta como texto; da query string ela pode chegar quebrada nas vírgulas."""
+    if isinstance(valor, (list, tuple)):
+        valor = ' '.join(str(v) for v in valor)
+    return ' '.join(str(valor or '').split())
+
+
+def construir_indice(df, coluna=COLUNA_BUSCA):
+    """Índice FTS5 dos textos distintos da coluna; None se a coluna não existir."""
+    if coluna not in df.columns:
+        return None
+    codigos, textos = pd.factorize(df[coluna])
+    conexao = sqlite3.connect(':memory:', check_same_thread=False)
+    conexao.execute(f"CREATE VIRTUAL TABLE textos USING fts5(texto, tokenize='{TOKENIZADOR_BUSCA}')")
+    conexao.executemany("INSERT INTO textos(rowid, texto) VALUES (?, ?)",
+                        ((i, str(texto)) for i, texto in enumerate(textos)))
+    conexao.commit()
+    return {'conexao': conexao, 'codigos': codigos, 'textos_distintos': len(textos), 'trava': threading.Lock()}
+
+
+def consulta_fts(consulta):
+    """Converte a consulta do usuário numa expressão FTS5 segura; None se vazia.
+
+    Cada termo vira uma string entre aspas (sem operadores do FTS5 vindos do
+    usuário); frases são mantidas e o * final vira busca por prefixo.
+    """
+    termos = []
+    for frase, palavra in _TERMOS_CONSULTA.findall(texto_busca(consulta)):
+        termo = frase if frase else palavra
+        prefixo = not frase and termo.endswith('*')
+        termo = termo.rstrip('*').replace('"', '').strip()
+        if termo:
+            termos.append(f'"{termo}"' + ('*' if prefixo else ''))
+    return ' '.join(termos) or None
+
+
+def buscar_textos(indice, consulta):
+    """Códigos dos textos que casam com a consulta, do mais para o menos relevante."""
+    expressao = consulta_fts(consulta)
+    if indice is None or expressao is None:
+        return np.zeros(0, dtype=np.int64)
+    with indice['trava']:
+        linhas = indice['conexao'].execute(
+            "SELECT rowid FROM textos WHERE textos MATCH ? ORDER BY bm25(textos)", (expressao,)
+        ).fetchall()
+    return np.array([rowid for (rowid,) in linhas], dtype=np.int64)
+
+
+def relevancia_linhas(indice, consulta):
+    """Posição de relevância de cada linha (0 = mais relevante) e -1 nas que não casam."""
+    encontrados = buscar_textos(indice, consulta)
+    # Uma posição a mais no fim: linhas sem texto (código -1) caem nela.
+    ordem = np.full(indice['textos_distintos'] + 1, -1, dtype=np.int64)
+    ordem[encontrados] = np.arange(len(encontrados))
+    return ordem[indice['codigos']]
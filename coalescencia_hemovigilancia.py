@@ -0,0 +1,89 @@
+"""
+Coalescência de chamadas idênticas simultâneas ("single flight").
+
+Enquanto uma chamada com certa chave está em andamento, as chamadas
+concorrentes com a mesma chave não recalculam: esperam e recebem o mesmo
+resultado (ou a mesma exceção). Terminada a chamada, a chave é liberada;
+não há cache, só a junção de trabalho simultâneo.
+
+`coalescer_requisicao` aplica isso às views do Flask, com a chave formada
+pela versão dos dados, a rota e os parâmetros normalizados da requisição.
+"""
+
+import threading
+from functools import wraps
+
+from flask import current_app, request
+
+_em_andamento = {}
+_trava = threading.Lock()
+
+
+def executar_uma_vez(chave, funcao, *args, **kwargs):
+    """Executa `funcao` para a chave; chamadas simultâneas com a mesma chave esperam o resultado."""
+    with _trava:
+        voo = _em_andamento.get(chave)
+        lider = voo is None
+        if lider:
+            voo = {'evento': threading.Event(), 'resultado': None, 'erro': None}
+            _em_andamento[chave] = voo
+
+    if not lider:
+        voo['evento'].wait()
+        if voo['erro'] is not None:
+            raise voo['erro']
+        return voo['resultado']
+
+    try:
+        voo['resultado'] = funcao(*args, **kwargs)
+    except BaseException as e:
+        voo['erro'] = e
+        raise
+    finally:
+        with _trava:
+            del _em_andamento[chave]
+        voo['evento'].set()
+    return voo['resultado']
+
+
+def parametros_normalizados(permitidos=None):
+    """Parâmetros da requisição em forma canônica: ordem dos nomes e dos valores listados não importa.
+
+    Como nas views, só o primeiro valor de um parâmetro repetido conta
+    (`request.args.get`); os demais não mudam a resposta e ficam fora da
+    chave. Com `permitidos`, os parâmetros fora dessa lista (que as views
+    ignoram) também ficam de fora.
+    """
+    normalizados = []
+    for nome in request.args.keys():
+        if permitidos is not None and nome not in permitidos:
+            continue
+        valor = request.args.get(nome, '')
+        if nome == 'busca':
+            # Na busca a ordem das palavras importa (frases).
+            itens = [' '.join(valor.split())]
+        else:
+            itens = sorted(v for v in valor.split(',') if v)
+        if any(itens):
+            normalizados.append((nome, tuple(itens)))
+    return tuple(sorted(normalizados))
+
+
+def coalescer_requisicao(versao, permitidos=None):
+    """Decorador de view: requisições GET idênticas simultâneas compartilham uma execução.
+
+    `versao()` devolve a versão atual dos dados, que entra na chave junto com
+    os parâmetros `permitidos` (todos, se None). Cada requisição recebe sua
+    própria cópia da resposta.
+    """
+    def decorador(view):
+        @wraps(view)
+        def envoltorio(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+            chave = (versao(), request.path, parametros_normalizados(permitidos))
+            resposta = executar_uma_vez(chave, lambda: current_app.make_response(view(*args, **kwargs)))
+            return current_app.response_class(resposta.get_data(), status=resposta.status_code,
+                                              headers=list(resposta.headers.items()))
+        return envoltorio
+    return decorador
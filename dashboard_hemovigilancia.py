@@ -14,57 +14,99 @@ except Exception as e:
     )
 import os
 import json
-from sklearn.linear_model import LinearRegression
 import numpy as np
 
+from previsao_hemovigilancia import obter_previsoes, previsao_anual
+from vigilancia_hemovigilancia import obter_vigilancia, filtrar_alertas
+from dataset_hemovigilancia import (
+    CAMINHO_RELATORIO_ANOMALIAS, FONTES_SNAPSHOT, carregar_snapshot, chave_filtros, filtrar, filtros_da_chave,
+)
+
 st.set_page_config(page_title="Dashboard Hemovigilância", layout="wide")
 st.title("📊 Dashboard Interativo de Hemovigilância")
 st.markdown("### Análise de notificações, anomalias e padrões regionais com risco e previsão")
 
-@st.cache_data
-def carregar_dados():
-    if os.path.exists("reports/resultado_com_anomalias.xlsx"):
-        df = pd.read_excel("reports/resultado_com_anomalias.xlsx")
-    elif os.path.exists("data/DADOS_ABERTOS_HEMOVIGILANCIA_UTF8.csv"):
-        df = pd.read_csv("data/DADOS_ABERTOS_HEMOVIGILANCIA_UTF8.csv", sep=";", encoding="ISO-8859-1")
-    else:
-        st.error("❌ Nenhum arquivo de dados encontrado.")
-        return pd.DataFrame()
-    
-    df.columns = df.columns.str.upper().str.strip()
-    
-    if "DATA_OCORRENCIA_EVENTO" in df.columns:
-        df["DATA_OCORRENCIA_EVENTO"] = pd.to_datetime(df["DATA_OCORRENCIA_EVENTO"], errors="coerce", dayfirst=True)
-        df["ANO"] = df["DATA_OCORRENCIA_EVENTO"].dt.year
-    elif "DATA_NOTIFICACAO_EVENTO" in df.columns:
-        df["DATA_NOTIFICACAO_EVENTO"] = pd.to_datetime(df["DATA_NOTIFICACAO_EVENTO"], errors="coerce", dayfirst=True)
-        df["ANO"] = df["DATA_NOTIFICACAO_EVENTO"].dt.year
-
-    if "ANOMALY_LABEL" in df.columns:
-        df = df.rename(columns={"ANOMALY_LABEL": "anomalias"})
-    
-    if "anomalias" in df.columns:
-        df["anomalias"] = pd.to_numeric(df["anomalias"], errors="coerce").fillna(0).astype(int)
-    return df
-
-df = carregar_dados()
+@st.cache_resource
+def obter_snapshot_dashboard():
+    """Snapshot somente leitura, compartilhado entre sessões e reruns (sem cópia por rerun)."""
+    # Prefere o relatório da análise avançada (Parquet/CSV gzip antes do xlsx).
+    return carregar_snapshot((CAMINHO_RELATORIO_ANOMALIAS,) + FONTES_SNAPSHOT)
+
+def montar_filtros(uf_sel, tipo_sel, ano_sel, opcoes, busca=""):
+    """Filtros no formato da camada de dados; seleção completa vira ausência de filtro."""
+    selecoes = {'ufs': uf_sel, 'tipos_evento': tipo_sel, 'anos': ano_sel}
+    filtros = {nome: list(sel) for nome, sel in selecoes.items() if len(sel) < len(opcoes[nome])}
+    if busca.strip():
+        filtros['busca'] = busca.strip()
+    return filtros
+
+@st.cache_data(max_entries=64)
+def agregacoes(versao, chave):
+    """Agregações dos gráficos, memoizadas por versão dos dados e seleção."""
+    snapshot = obter_snapshot_dashboard()
+    df_filtrado = filtrar(snapshot, filtros_da_chave(chave))
+    resultado = {'total': len(df_filtrado), 'anomalias': int(df_filtrado["anomalias"].sum())}
+    if "ANO" in df_filtrado.columns:
+        resultado['por_ano'] = df_filtrado.groupby("ANO").size().reset_index(name="Notificações")
+    if "UF_NOTIFICACAO" in df_filtrado.columns:
+        df_uf = df_filtrado["UF_NOTIFICACAO"].value_counts().loc[lambda s: s > 0].reset_index()
+        df_uf.columns = ["UF", "Quantidade"]
+        resultado['por_uf'] = df_uf
+        risco_uf = df_filtrado.groupby("UF_NOTIFICACAO", observed=True)["anomalias"].sum().reset_index()
+        resultado['risco_uf'] = risco_uf.sort_values("anomalias", ascending=False)
+    if "TIPO_REACAO_TRANSFUSIONAL" in df_filtrado.columns:
+        df_tipo = df_filtrado["TIPO_REACAO_TRANSFUSIONAL"].value_counts().loc[lambda s: s > 0].reset_index()
+        df_tipo.columns = ["Tipo de Evento", "Quantidade"]
+        resultado['por_tipo'] = df_tipo
+    numeric_cols = df_filtrado.select_dtypes(include='number').columns
+    resultado['correlacao'] = df_filtrado[numeric_cols].corr() if len(numeric_cols) >= 2 else None
+    return resultado
+
+@st.cache_resource(max_entries=2)
+def obter_previsoes_dashboard(versao):
+    """Previsões de todas as séries UF x tipo, ajustadas uma vez por versão dos dados."""
+    return obter_previsoes(obter_snapshot_dashboard())
+
+@st.cache_resource(max_entries=2)
+def obter_vigilancia_dashboard(versao):
+    """Estado da vigilância (EWMA/CUSUM), atualizado só com os meses novos desta versão."""
+    return obter_vigilancia(obter_snapshot_dashboard())
+
+@st.cache_data(max_entries=8)
+def csv_filtrado(versao, chave):
+    """CSV do recorte, gerado só quando pedido e reaproveitado nos reruns."""
+    df_filtrado = filtrar(obter_snapshot_dashboard(), filtros_da_chave(chave))
+    return df_filtrado.to_csv(index=False).encode("utf-8")
+
+snapshot = obter_snapshot_dashboard()
+if snapshot is None:
+    st.error("❌ Nenhum arquivo de dados encontrado.")
+    df = pd.DataFrame()
+else:
+    df = snapshot["df"]
 
 if not df.empty:
 
     st.sidebar.header("🔍 Filtros de Análise")
-    uf_options = sorted(df["UF_NOTIFICACAO"].dropna().unique()) if "UF_NOTIFICACAO" in df.columns else []
-    tipo_evento_options = sorted(df["TIPO_REACAO_TRANSFUSIONAL"].dropna().unique()) if "TIPO_REACAO_TRANSFUSIONAL" in df.columns else []
-    ano_options = sorted(df["ANO"].dropna().unique()) if "ANO" in df.columns else []
+    opcoes = snapshot["opcoes"]
+    uf_options = opcoes["ufs"]
+    tipo_evento_options = opcoes["tipos_evento"]
+    ano_options = opcoes["anos"]
 
     uf_sel = st.sidebar.multiselect("Selecione UF(s):", uf_options, default=uf_options)
     tipo_sel = st.sidebar.multiselect("Selecione Tipo de Evento:", tipo_evento_options, default=tipo_evento_options)
     ano_sel = st.sidebar.multiselect("Selecione Ano(s):", ano_options, default=ano_options)
+    busca = st.sidebar.text_input("Buscar na descrição do evento:", help='Palavras, "frases exatas" ou prefixos (ex.: hipoten*).')
+
+    if not (uf_sel and tipo_sel and ano_sel):
+        # Um filtro sem nenhum valor marcado não seleciona nenhuma linha.
+        st.warning("Nenhuma notificação para a seleção atual.")
+        st.stop()
 
-    df_filtrado = df[
-        (df["UF_NOTIFICACAO"].isin(uf_sel) if "UF_NOTIFICACAO" in df.columns else True) &
-        (df["TIPO_REACAO_TRANSFUSIONAL"].isin(tipo_sel) if "TIPO_REACAO_TRANSFUSIONAL" in df.columns else True) &
-        (df["ANO"].isin(ano_sel) if "ANO" in df.columns else True)
-    ]
+    filtros = montar_filtros(uf_sel, tipo_sel, ano_sel, opcoes, busca)
+    chave = chave_filtros(filtros)
+    df_filtrado = filtrar(snapshot, filtros)
+    resumo = agregacoes(snapshot["versao"], chave)
 
     aba1, aba2, aba3, aba4 = st.tabs(["📈 Visão Geral", "📊 Distribuições", "🗺️ Mapa Brasil", "🧩 Correlação & Dados"])
 
@@ -72,8 +114,8 @@ if not df.empty:
         st.subheader("📈 Métricas Gerais")
         col1, col2, col3 = st.columns(3)
 
-        total_notificacoes = len(df_filtrado)
-        total_anomalias = df_filtrado["anomalias"].sum() if "anomalias" in df_filtrado.columns else 0
+        total_notificacoes = resumo["total"]
+        total_anomalias = resumo["anomalias"]
         perc_anomalias = (total_anomalias / total_notificacoes * 100) if total_notificacoes > 0 else 0
 
         col1.metric("Total de Notificações", f"{total_notificacoes:,}".replace(",", "."))
@@ -83,121 +125,135 @@ if not df.empty:
         st.markdown("---")
         st.subheader("📅 Tendência Temporal das Notificações com Previsão")
 
-        if "ANO" in df_filtrado.columns:
-            df_ano = df_filtrado.groupby("ANO").size().reset_index(name="Notificações")
-            X = df_ano["ANO"].values.reshape(-1,1)
-            y = df_ano["Notificações"].values
-            model = LinearRegression().fit(X, y)
-            proximo_ano = df_ano["ANO"].max() + 1
-            previsao = int(model.predict(np.array([[proximo_ano]]))[0])
-            
-            df_prev = pd.concat([df_ano, pd.DataFrame([{"ANO": proximo_ano, "Notificações": previsao}])], ignore_index=True)
-            fig_ano = px.line(df_prev, x="ANO", y="Notificações", markers=True, title="Tendência de Notificações + Previsão")
-            fig_ano.add_scatter(x=[proximo_ano], y=[previsao], mode='markers+text', text=[f"Prev: {previsao}"], textposition="top center", marker=dict(color="red", size=12))
-            st.plotly_chart(fig_ano, use_container_width=True)
-
-            st.info(f"📌 Previsão de notificações para {proximo_ano}: {previsao}")
+        previsoes = obter_previsoes_dashboard(snapshot["versao"])
+        if "por_ano" in resumo and len(resumo["por_ano"]) and previsoes["n_series"]:
+            df_ano = resumo["por_ano"]
+            proximo_ano = int(previsoes["meses_previsao"][0] // 12)
+            if proximo_ano in df_ano["ANO"].values:
+                proximo_ano += 1  # Ano corrente incompleto: prevê o seguinte.
+            # A previsão é feita por UF x tipo sobre toda a série; não reflete ano nem busca.
+            fora_do_escopo = bool(filtros.get("anos") or filtros.get("busca"))
+            previsao = None if fora_do_escopo else previsao_anual(previsoes, proximo_ano, filtros.get("ufs"), filtros.get("tipos_evento"))
+
+            if previsao is not None:
+                previsao = int(round(previsao))
+                df_prev = pd.concat([df_ano, pd.DataFrame([{"ANO": proximo_ano, "Notificações": previsao}])], ignore_index=True)
+                fig_ano = px.line(df_prev, x="ANO", y="Notificações", markers=True, title="Tendência de Notificações + Previsão")
+                fig_ano.add_scatter(x=[proximo_ano], y=[previsao], mode='markers+text', text=[f"Prev: {previsao}"], textposition="top center", marker=dict(color="red", size=12))
+                st.plotly_chart(fig_ano, use_container_width=True)
+
+                st.info(f"📌 Previsão de notificações para {proximo_ano}: {previsao}")
+            elif fora_do_escopo:
+                fig_ano = px.line(df_ano, x="ANO", y="Notificações", markers=True, title="Tendência de Notificações")
+                st.plotly_chart(fig_ano, use_container_width=True)
+                st.caption("Previsão oculta: ela considera só os filtros de UF e tipo de evento, não os de ano e busca.")
 
     with aba2:
         st.subheader("📍 Distribuição Regional e por Tipo de Evento")
         col1, col2 = st.columns(2)
 
         with col1:
-            if "UF_NOTIFICACAO" in df_filtrado.columns:
-                df_uf = df_filtrado["UF_NOTIFICACAO"].value_counts().reset_index()
-                df_uf.columns = ["UF", "Quantidade"]
+            if "por_uf" in resumo:
+                df_uf = resumo["por_uf"]
                 fig_uf = px.bar(df_uf, x="UF", y="Quantidade", title="Notificações por UF", color="UF")
                 st.plotly_chart(fig_uf, use_container_width=True)
 
         with col2:
-            if "TIPO_REACAO_TRANSFUSIONAL" in df_filtrado.columns:
-                df_tipo = df_filtrado["TIPO_REACAO_TRANSFUSIONAL"].value_counts().reset_index()
-                df_tipo.columns = ["Tipo de Evento", "Quantidade"]
+            if "por_tipo" in resumo:
+                df_tipo = resumo["por_tipo"]
                 fig_tipo = px.bar(df_tipo, x="Tipo de Evento", y="Quantidade", title="Tipos de Eventos Notificados", color="Tipo de Evento")
                 st.plotly_chart(fig_tipo, use_container_width=True)
 
         st.markdown("---")
         st.subheader("⚠️ UFs com maior risco de anomalias")
-        if "anomalias" in df_filtrado.columns and "UF_NOTIFICACAO" in df_filtrado.columns:
-            risco_uf = df_filtrado.groupby("UF_NOTIFICACAO")["anomalias"].sum().reset_index()
-            risco_uf = risco_uf.sort_values("anomalias", ascending=False)
+        if "risco_uf" in resumo:
+            risco_uf = resumo["risco_uf"]
             st.dataframe(risco_uf.head(5), use_container_width=True)
             st.info(f"⚠️ UF com maior risco: {risco_uf.iloc[0]['UF_NOTIFICACAO']} ({risco_uf.iloc[0]['anomalias']} anomalias)")
 
-with aba3:
-    st.subheader("🗺️ Mapa Interativo de Notificações por UF (Risco)")
-
-    if "anomalias" in df_filtrado.columns and "UF_NOTIFICACAO" in df_filtrado.columns:
-        
-        df_map = df_filtrado.groupby("UF_NOTIFICACAO")["anomalias"].sum().reset_index()
-        df_map.columns = ["UF", "Risco"]
-
-        with open("data/br_states.json", "r", encoding="utf-8") as f:
-            brazil_geojson = json.load(f)
-
-        df_map["id_uf"] = df_map["UF"].astype(str)
-
-        coordenadas_estados = {
-            "AC": [-9.02, -70.81], "AL": [-9.57, -36.78], "AP": [1.41, -51.77], "AM": [-3.47, -65.10],
-            "BA": [-12.97, -41.65], "CE": [-5.20, -39.53], "DF": [-15.78, -47.93], "ES": [-19.19, -40.34],
-            "GO": [-15.98, -49.86], "MA": [-5.42, -45.44], "MT": [-12.64, -55.42], "MS": [-20.51, -54.54],
-            "MG": [-18.10, -44.38], "PA": [-3.79, -52.48], "PB": [-7.24, -36.78], "PR": [-24.89, -51.55],
-            "PE": [-8.38, -37.86], "PI": [-7.72, -42.73], "RJ": [-22.25, -42.66], "RN": [-5.79, -36.59],
-            "RS": [-30.17, -53.50], "RO": [-10.83, -63.34], "RR": [1.99, -61.33], "SC": [-27.33, -50.41],
-            "SP": [-22.19, -48.79], "SE": [-10.57, -37.45], "TO": [-10.25, -48.30]
-        }
-
-        df_map["lat"] = df_map["UF"].map(lambda x: coordenadas_estados.get(x, [None, None])[0])
-        df_map["lon"] = df_map["UF"].map(lambda x: coordenadas_estados.get(x, [None, None])[1])
-
-        fig_map = px.choropleth(
-            df_map,
-            geojson=brazil_geojson,
-            locations="UF",
-            featureidkey="properties.sigla",
-            color="Risco",
-            hover_name="UF",
-            color_continuous_scale="Reds",
-            title="🗺️ Risco de Anomalias por Estado (Brasil)",
-            scope="south america"
-        )
-
-        fig_pontos = px.scatter_geo(
-            df_map,
-            lat="lat",
-            lon="lon",
-            size="Risco",
-            color="Risco",
-            color_continuous_scale="Reds",
-            hover_name="UF",
-            text="UF",
-            size_max=25
-        )
-
-        for trace in fig_pontos.data:
-            fig_map.add_trace(trace)
-
-        fig_map.update_geos(
-            projection_type="mercator",
-            fitbounds="locations",
-            showcoastlines=True,
-            coastlinecolor="gray",
-            showland=True,
-            landcolor="lightgray"
-        )
-
-        fig_map.update_layout(
-            margin={"r":0,"t":50,"l":0,"b":0},
-            coloraxis_colorbar=dict(title="Nº de Anomalias"),
-        )
-
-        st.plotly_chart(fig_map, use_container_width=True)
+        st.markdown("---")
+        st.subheader("🚨 Alertas de Vigilância (picos mensais)")
+        vigilancia = obter_vigilancia_dashboard(snapshot["versao"])
+        series_sel = list(filtros.get("ufs", [])) + list(filtros.get("tipos_evento", []))
+        alertas = filtrar_alertas(vigilancia, series=series_sel, limite=20)
+        if alertas:
+            st.dataframe(pd.DataFrame(alertas), use_container_width=True)
+        else:
+            st.success("Nenhum alerta de pico para a seleção atual.")
+
+    with aba3:
+        st.subheader("🗺️ Mapa Interativo de Notificações por UF (Risco)")
+
+        if "risco_uf" in resumo:
+
+            df_map = resumo["risco_uf"].copy()
+            df_map.columns = ["UF", "Risco"]
+
+            with open("data/br_states.json", "r", encoding="utf-8") as f:
+                brazil_geojson = json.load(f)
+
+            df_map["id_uf"] = df_map["UF"].astype(str)
+
+            coordenadas_estados = {
+                "AC": [-9.02, -70.81], "AL": [-9.57, -36.78], "AP": [1.41, -51.77], "AM": [-3.47, -65.10],
+                "BA": [-12.97, -41.65], "CE": [-5.20, -39.53], "DF": [-15.78, -47.93], "ES": [-19.19, -40.34],
+                "GO": [-15.98, -49.86], "MA": [-5.42, -45.44], "MT": [-12.64, -55.42], "MS": [-20.51, -54.54],
+                "MG": [-18.10, -44.38], "PA": [-3.79, -52.48], "PB": [-7.24, -36.78], "PR": [-24.89, -51.55],
+                "PE": [-8.38, -37.86], "PI": [-7.72, -42.73], "RJ": [-22.25, -42.66], "RN": [-5.79, -36.59],
+                "RS": [-30.17, -53.50], "RO": [-10.83, -63.34], "RR": [1.99, -61.33], "SC": [-27.33, -50.41],
+                "SP": [-22.19, -48.79], "SE": [-10.57, -37.45], "TO": [-10.25, -48.30]
+            }
+
+            df_map["lat"] = df_map["UF"].map(lambda x: coordenadas_estados.get(x, [None, None])[0])
+            df_map["lon"] = df_map["UF"].map(lambda x: coordenadas_estados.get(x, [None, None])[1])
+
+            fig_map = px.choropleth(
+                df_map,
+                geojson=brazil_geojson,
+                locations="UF",
+                featureidkey="properties.sigla",
+                color="Risco",
+                hover_name="UF",
+                color_continuous_scale="Reds",
+                title="🗺️ Risco de Anomalias por Estado (Brasil)",
+                scope="south america"
+            )
+
+            fig_pontos = px.scatter_geo(
+                df_map,
+                lat="lat",
+                lon="lon",
+                size="Risco",
+                color="Risco",
+                color_continuous_scale="Reds",
+                hover_name="UF",
+                text="UF",
+                size_max=25
+            )
+
+            for trace in fig_pontos.data:
+                fig_map.add_trace(trace)
+
+            fig_map.update_geos(
+                projection_type="mercator",
+                fitbounds="locations",
+                showcoastlines=True,
+                coastlinecolor="gray",
+                showland=True,
+                landcolor="lightgray"
+            )
+
+            fig_map.update_layout(
+                margin={"r":0,"t":50,"l":0,"b":0},
+                coloraxis_colorbar=dict(title="Nº de Anomalias"),
+            )
+
+            st.plotly_chart(fig_map, use_container_width=True)
 
     with aba4:
         st.subheader("📊 Análise de Correlação Automática")
-        numeric_cols = df_filtrado.select_dtypes(include=['int64', 'float64']).columns
-        if len(numeric_cols) >= 2:
-            corr_matrix = df_filtrado[numeric_cols].corr()
+        corr_matrix = resumo["correlacao"]
+        if corr_matrix is not None:
             fig_corr = ff.create_annotated_heatmap(z=corr_matrix.values, x=list(corr_matrix.columns),
                                                    y=list(corr_matrix.columns), annotation_text=corr_matrix.round(2).values,
                                                    colorscale='Viridis')
@@ -208,5 +264,9 @@ with aba3:
         st.markdown("---")
         st.subheader("🧾 Dados Filtrados")
         st.dataframe(df_filtrado.head(1000), use_container_width=True)
-        csv = df_filtrado.to_csv(index=False).encode("utf-8")
-        st.download_button("Baixar CSV Filtrado", data=csv, file_name="hemovigilancia_filtrado.csv", mime="text/csv")
\ No newline at end of file
+        # O CSV só é gerado quando pedido, e fica em cache para a mesma seleção.
+        if st.button("Preparar CSV Filtrado"):
+            st.session_state["csv_chave"] = (snapshot["versao"], chave)
+        if st.session_state.get("csv_chave") == (snapshot["versao"], chave):
+            st.download_button("Baixar CSV Filtrado", data=csv_filtrado(snapshot["versao"], chave),
+                               file_name="hemovigilancia_filtrado.csv", mime="text/csv")
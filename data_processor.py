@@ -1,79 +1,638 @@
+import argparse
 import pandas as pd
 import numpy as np
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import joblib
+from pandas.api.types import union_categoricals
 from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import LabelEncoder
+
+from blocos_hemovigilancia import TAMANHO_BLOCO_PADRAO, inferir_formato_data, resolver_n_jobs
+from esquema_hemovigilancia import ler_csv, ler_csv_em_blocos
+from features_hemovigilancia import CodificadorEsparso
+from modelo_risco_hemovigilancia import carregar_modelo_risco, prever_grau_risco
+from anonimizacao_hemovigilancia import (
+    anonimizar_bloco, anonimizar_dataframe, combinar_auditorias, resumo_auditoria, salvar_auditoria
+)
+from qualidade_hemovigilancia import (
+    avaliar_bloco, combinar_parciais, montar_relatorio, salvar_relatorio_qualidade, submeter_bloco,
+)
 
 CAMINHO_DADOS = 'data/DADOS_ABERTOS_HEMOVIGILANCIA_UTF8.csv'
 CAMINHO_DADOS_PROCESSADO = 'data/DADOS_HEMOVIGILANCIA_PROCESSADO.csv'
+CAMINHO_MODELO_ANOMALIAS = 'data/modelo_anomalias.joblib'
+CAMINHO_CACHE_ANOMALIAS = 'data/cache_anomalias.npz'
+
+# Linhas no treino do modelo de anomalias no modo em blocos (amostra uniforme do histórico).
+LIMITE_TREINO_ANOMALIAS = 1_000_000
+
+COLUNAS_CATEGORICAS_MODELO = ['TIPO_REACAO_TRANSFUSIONAL', 'GRAU_RISCO']
+COLUNAS_MODELO = COLUNAS_CATEGORICAS_MODELO + ['IDADE_PACIENTE']
+
+# Versão do formato do artefato; alterar invalida modelos e caches salvos.
+FORMATO_ARTEFATO_ANOMALIAS = 2
+DIAS_RETREINO_ANOMALIAS = 30
+LIMIAR_DRIFT_PSI = 0.2
+LIMIAR_CATEGORIAS_NOVAS = 0.01
+FAIXAS_IDADE_DRIFT = [-np.inf, 1, 5, 10, 20, 30, 40, 50, 60, 70, np.inf]
+
+# Colunas aceitas no modo particionado (um modelo por valor da coluna).
+COLUNAS_PARTICAO = ['UF_NOTIFICACAO', 'TIPO_REACAO_TRANSFUSIONAL']
+# Partições menores que isto são pontuadas pelo modelo global.
+MIN_LINHAS_PARTICAO = 256
+# Abaixo disto a pontuação roda no próprio processo; abrir o pool custaria mais.
+MIN_LINHAS_POOL = 50_000
+PARAMETROS_ISOLATION_FOREST = {'random_state': 42, 'contamination': 'auto'}
+
+def pre_processar_dados(df, formato_data=None):
+    """Realiza o pré-processamento básico e cria colunas de data.
+
+    `formato_data` fixa o formato de DATA_OCORRENCIA_EVENTO; no processamento
+    em blocos ele é inferido uma única vez para que todos os blocos sejam
+    interpretados da mesma forma.
+    """
 
-def pre_processar_dados(df):
-    """Realiza o pré-processamento básico e cria colunas de data."""
-    
     df.columns = df.columns.str.upper().str.strip()
-    
+
+    def converter_data(coluna):
+        if formato_data:
+            return pd.to_datetime(df[coluna], errors="coerce", format=formato_data)
+        return pd.to_datetime(df[coluna], errors="coerce", dayfirst=True)
+
     if "DATA_OCORRENCIA_EVENTO" in df.columns:
-        df["DATA_OCORRENCIA_EVENTO"] = pd.to_datetime(df["DATA_OCORRENCIA_EVENTO"], errors="coerce", dayfirst=True)
+        df["DATA_OCORRENCIA_EVENTO"] = converter_data("DATA_OCORRENCIA_EVENTO")
+        # A data de notificação é descartada abaixo; o atraso é guardado antes para o modelo de risco.
+        if "DATA_NOTIFICACAO_EVENTO" in df.columns:
+            df["TEMPO_NOTIFICACAO_DIAS"] = (converter_data("DATA_NOTIFICACAO_EVENTO") - df["DATA_OCORRENCIA_EVENTO"]).dt.days
         df["ANO"] = df["DATA_OCORRENCIA_EVENTO"].dt.year
         df["MES"] = df["DATA_OCORRENCIA_EVENTO"].dt.month
         df = df.dropna(subset=['DATA_OCORRENCIA_EVENTO'])
-    
+
     df = df.drop(columns=['ID_NOTIFICACAO', 'DATA_NOTIFICACAO_EVENTO'], errors='ignore')
-    
+
     return df
 
-def detectar_anomalias(df):
-    
-    df_modelo = df.copy()
-    
-    features = ['TIPO_REACAO_TRANSFUSIONAL', 'GRAU_RISCO', 'IDADE_PACIENTE']
-    
-    if 'IDADE_PACIENTE' not in df_modelo.columns:
-        df_modelo['IDADE_PACIENTE'] = 0
-    
-    df_modelo['IDADE_PACIENTE'] = pd.to_numeric(df_modelo['IDADE_PACIENTE'], errors='coerce').fillna(df_modelo['IDADE_PACIENTE'].median())
-    df_modelo['GRAU_RISCO'] = df_modelo['GRAU_RISCO'].fillna('NAO INFORMADO')
-    df_modelo['TIPO_REACAO_TRANSFUSIONAL'] = df_modelo['TIPO_REACAO_TRANSFUSIONAL'].fillna('NAO INFORMADO')
-    
-    le = LabelEncoder()
-    df_modelo['TIPO_REACAO_COD'] = le.fit_transform(df_modelo['TIPO_REACAO_TRANSFUSIONAL'])
-    df_modelo['GRAU_RISCO_COD'] = le.fit_transform(df_modelo['GRAU_RISCO'])
-    
-    cols_modelo = ['IDADE_PACIENTE', 'TIPO_REACAO_COD', 'GRAU_RISCO_COD']
-    X = df_modelo[[col for col in cols_modelo if col in df_modelo.columns]]
-    
-    model = IsolationForest(random_state=42, contamination='auto')
+def _normalizar_colunas_modelo(df, mediana_idade):
+    """Aplica às colunas do modelo os mesmos preenchimentos usados no treino."""
+    df_modelo = pd.DataFrame(index=df.index)
+
+    if 'IDADE_PACIENTE' in df.columns:
+        idade = pd.to_numeric(df['IDADE_PACIENTE'], errors='coerce')
+    else:
+        idade = pd.Series(0.0, index=df.index)
+    df_modelo['IDADE_PACIENTE'] = idade.fillna(mediana_idade)
+
+    for col in COLUNAS_CATEGORICAS_MODELO:
+        df_modelo[col] = df[col].astype(object).fillna('NAO INFORMADO').astype(str)
+
+    return df_modelo
+
+def _distribuicoes_referencia(df_modelo):
+    """Proporções de cada categoria e faixa etária, usadas para medir drift."""
+    referencia = {
+        col: df_modelo[col].value_counts(normalize=True)
+        for col in COLUNAS_CATEGORICAS_MODELO
+    }
+    faixas = pd.cut(df_modelo['IDADE_PACIENTE'], FAIXAS_IDADE_DRIFT, right=False, labels=False)
+    referencia['IDADE_PACIENTE'] = faixas.value_counts(normalize=True)
+    return referencia
+
+def _psi(referencia, atual):
+    """Population Stability Index entre duas distribuições de proporções."""
+    categorias = referencia.index.union(atual.index)
+    p = referencia.reindex(categorias, fill_value=0).to_numpy() + 1e-6
+    q = atual.reindex(categorias, fill_value=0).to_numpy() + 1e-6
+    return float(np.sum((q - p) * np.log(q / p)))
+
+def _ajustar_isolation_forest(args):
+    X, parametros = args
+    return IsolationForest(**parametros).fit(X)
+
+def _pontuar_isolation_forest(args):
+    modelo, X = args
+    return -modelo.score_samples(X)
+
+# Modelos instalados em cada processo de um pool criado por `pool_pontuacao` (chave None = global).
+_modelos_processo = None
+
+def _instalar_modelos(modelo_global, modelos_particao):
+    global _modelos_processo
+    _modelos_processo = {None: modelo_global, **(modelos_particao or {})}
+
+def _pontuar_modelo_instalado(args):
+    chave, X = args
+    return -_modelos_processo[chave].score_samples(X)
+
+def pool_pontuacao(artefato, n_jobs=None):
+    """Pool de processos com os modelos do artefato já carregados em cada processo.
+
+    Para pontuar muitos blocos (`pontuar_em_paralelo(..., executor=pool)`)
+    pagando uma única vez a abertura do pool e o envio dos modelos; os
+    processos também servem para outras tarefas.
+    """
+    return ProcessPoolExecutor(max_workers=resolver_n_jobs(n_jobs), initializer=_instalar_modelos,
+                               initargs=(artefato['modelo'], artefato.get('modelos_particao')))
+
+def _posicoes_por_chave(chaves):
+    """Agrupa as posições das linhas por valor de `chaves`, preservando a ordem original."""
+    codigos, valores = pd.factorize(np.asarray(chaves), use_na_sentinel=False)
+    ordem = np.argsort(codigos, kind='stable')
+    inicios = np.searchsorted(codigos[ordem], np.arange(len(valores)))
+    return dict(zip(valores, np.split(ordem, inicios[1:])))
+
+def ajustar_modelos_particionados(X, chaves, parametros=None, n_jobs=None, min_linhas=MIN_LINHAS_PARTICAO):
+    """Ajusta um IsolationForest por valor de `chaves`, em paralelo num pool de processos.
+
+    Partições com menos de `min_linhas` linhas ficam sem modelo próprio.
+    """
+    parametros = dict(parametros or PARAMETROS_ISOLATION_FOREST)
+    X = np.asarray(X)
+    grupos = {chave: pos for chave, pos in _posicoes_por_chave(chaves).items() if len(pos) >= min_linhas}
+    tarefas = [(X[pos], parametros) for pos in grupos.values()]
+
+    processos = resolver_n_jobs(n_jobs)
+    if processos == 1 or len(tarefas) <= 1:
+        modelos = [_ajustar_isolation_forest(t) for t in tarefas]
+    else:
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            modelos = list(executor.map(_ajustar_isolation_forest, tarefas))
+
+    return dict(zip(grupos.keys(), modelos))
+
+def pontuar_em_paralelo(modelo_global, X, chaves=None, modelos_particao=None, n_jobs=None, executor=None):
+    """Calcula score (negativo de `score_samples`) e limiar de cada linha.
+
+    Cada linha é pontuada pelo modelo da sua partição, ou pelo global quando a
+    partição não tem modelo. As tarefas são divididas por partição e, dentro
+    dela, em blocos por processo; os resultados voltam na ordem original.
+    Com `executor` (de `pool_pontuacao`, com os mesmos modelos) as tarefas
+    levam só a chave do modelo e as linhas; sem ele um pool é aberto por chamada.
+    """
+    X = np.asarray(X)
+    processos = resolver_n_jobs(n_jobs)
+    scores = np.empty(len(X), dtype='float64')
+    limiares = np.empty(len(X), dtype='float64')
+
+    if chaves is None or not modelos_particao:
+        grupos = {None: np.arange(len(X))}
+    else:
+        grupos = _posicoes_por_chave(chaves)
+
+    tarefas, destinos = [], []
+    for chave, pos in grupos.items():
+        chave_modelo = chave if chave in (modelos_particao or {}) else None
+        modelo = modelos_particao[chave] if chave_modelo is not None else modelo_global
+        limiares[pos] = -modelo.offset_
+        for bloco in np.array_split(pos, processos) if len(pos) >= processos else [pos]:
+            if len(bloco):
+                tarefas.append((modelo, chave_modelo, X[bloco]))
+                destinos.append(bloco)
+
+    if executor is not None and processos > 1 and len(tarefas) > 1:
+        resultados = list(executor.map(_pontuar_modelo_instalado, [(c, Xb) for _, c, Xb in tarefas]))
+    elif processos == 1 or len(tarefas) <= 1 or len(X) < MIN_LINHAS_POOL:
+        resultados = [_pontuar_isolation_forest((m, Xb)) for m, _, Xb in tarefas]
+    else:
+        with ProcessPoolExecutor(max_workers=processos) as pool:
+            resultados = list(pool.map(_pontuar_isolation_forest, [(m, Xb) for m, _, Xb in tarefas]))
+
+    for bloco, resultado in zip(destinos, resultados):
+        scores[bloco] = resultado
+
+    return scores, limiares
+
+def _chaves_particao(df, coluna):
+    if coluna is None:
+        return None
+    if coluna not in df.columns:
+        return np.full(len(df), 'NAO INFORMADO', dtype=object)
+    return df[coluna].astype(object).fillna('NAO INFORMADO').astype(str).to_numpy()
+
+def treinar_modelo_anomalias(df, n_jobs=None, particionar_por=None):
+    """Ajusta os codificadores e o IsolationForest sobre as colunas do modelo.
+
+    Retorna um artefato com tudo o que é necessário para pontuar outros blocos
+    de dados de forma consistente com o treino. `n_jobs` usa vários núcleos no
+    ajuste; com `particionar_por` (uma de `COLUNAS_PARTICAO`) também é ajustado
+    um modelo por valor dessa coluna, capturando anomalias locais.
+    """
+    if particionar_por is not None and particionar_por not in COLUNAS_PARTICAO:
+        raise ValueError(f"Coluna de partição inválida: {particionar_por}. Use uma de {COLUNAS_PARTICAO}.")
+
+    idade = pd.to_numeric(df['IDADE_PACIENTE'], errors='coerce') if 'IDADE_PACIENTE' in df.columns else pd.Series(0.0, index=df.index)
+    mediana_idade = idade.median()
+    if pd.isna(mediana_idade):
+        mediana_idade = 0.0
+
+    df_modelo = _normalizar_colunas_modelo(df, mediana_idade)
+
+    codificador = CodificadorEsparso(COLUNAS_CATEGORICAS_MODELO).fit(df_modelo)
+
+    treinado_em = datetime.now()
+    artefato = {
+        'formato': FORMATO_ARTEFATO_ANOMALIAS,
+        'versao': f"{FORMATO_ARTEFATO_ANOMALIAS}-{treinado_em.strftime('%Y%m%d%H%M%S')}",
+        'treinado_em': treinado_em,
+        'mediana_idade': float(mediana_idade),
+        'codificador': codificador,
+        'referencia': _distribuicoes_referencia(df_modelo),
+        'particionar_por': particionar_por,
+        'modelo': None,
+        'modelos_particao': {},
+    }
+
+    X = _montar_matriz(df_modelo, artefato)
+    model = IsolationForest(n_jobs=n_jobs, **PARAMETROS_ISOLATION_FOREST)
     model.fit(X)
-    
-    df['ANOMALY_LABEL'] = model.predict(X)
-    
-    df['anomalias'] = df['ANOMALY_LABEL'].apply(lambda x: 1 if x == -1 else 0)
-    df = df.drop(columns=['ANOMALY_LABEL'], errors='ignore')
-    
+    artefato['modelo'] = model
+
+    if particionar_por is not None:
+        artefato['modelos_particao'] = ajustar_modelos_particionados(
+            X, _chaves_particao(df, particionar_por), n_jobs=n_jobs)
+
+    return artefato
+
+def _montar_matriz(df_modelo, artefato):
+    """Monta a matriz numérica de entrada do modelo a partir das colunas normalizadas."""
+    X = pd.DataFrame(index=df_modelo.index)
+    X['IDADE_PACIENTE'] = df_modelo['IDADE_PACIENTE']
+    # Códigos ordinais do vocabulário salvo; categorias nunca vistas recebem -1.
+    codigos = artefato['codificador'].codigos(df_modelo)
+    X['TIPO_REACAO_COD'] = codigos['TIPO_REACAO_TRANSFUSIONAL']
+    X['GRAU_RISCO_COD'] = codigos['GRAU_RISCO']
+    return X
+
+def motivo_retreino(artefato, df, particionar_por=None):
+    """Indica por que o artefato salvo não deve mais ser usado, ou None se ainda é válido.
+
+    O retreino acontece quando o modelo passa de `DIAS_RETREINO_ANOMALIAS` dias
+    ou quando a distribuição atual das colunas do modelo se afasta da de treino.
+    """
+    if artefato is None:
+        return "nenhum modelo salvo"
+    if artefato.get('formato') != FORMATO_ARTEFATO_ANOMALIAS:
+        return "formato de artefato desatualizado"
+    if artefato.get('particionar_por') != particionar_por:
+        return "modo de partição alterado"
+
+    idade_modelo = datetime.now() - artefato['treinado_em']
+    if idade_modelo.days >= DIAS_RETREINO_ANOMALIAS:
+        return f"modelo com {idade_modelo.days} dias"
+
+    df_modelo = _normalizar_colunas_modelo(df, artefato['mediana_idade'])
+    codigos = artefato['codificador'].codigos(df_modelo)
+    for col in COLUNAS_CATEGORICAS_MODELO:
+        novas = (codigos[col] == -1).mean()
+        if novas > LIMIAR_CATEGORIAS_NOVAS:
+            return f"{novas:.1%} de categorias novas em {col}"
+
+    atual = _distribuicoes_referencia(df_modelo)
+    for col, referencia in artefato['referencia'].items():
+        psi = _psi(referencia, atual[col])
+        if psi > LIMIAR_DRIFT_PSI:
+            return f"drift em {col} (PSI={psi:.3f})"
+
+    return None
+
+def carregar_artefato_anomalias(caminho=CAMINHO_MODELO_ANOMALIAS):
+    """Carrega o artefato salvo; retorna None se não existir ou estiver corrompido."""
+    if not os.path.exists(caminho):
+        return None
+    try:
+        return joblib.load(caminho)
+    except Exception as e:
+        print(f"⚠️ Não foi possível carregar o modelo de anomalias salvo: {e}")
+        return None
+
+def salvar_artefato_anomalias(artefato, caminho=CAMINHO_MODELO_ANOMALIAS):
+    caminho_temporario = caminho + '.tmp'
+    joblib.dump(artefato, caminho_temporario)
+    os.replace(caminho_temporario, caminho)
+
+def obter_artefato_anomalias(df, forcar_retreino=False, n_jobs=None, particionar_por=None):
+    """Reutiliza o modelo salvo ou treina (e salva) um novo quando necessário."""
+    artefato = carregar_artefato_anomalias()
+    motivo = "retreino solicitado" if forcar_retreino else motivo_retreino(artefato, df, particionar_por)
+
+    if motivo:
+        print(f"🔁 Treinando novo modelo de anomalias ({motivo}).")
+        artefato = treinar_modelo_anomalias(df, n_jobs=n_jobs, particionar_por=particionar_por)
+        salvar_artefato_anomalias(artefato)
+    else:
+        print(f"♻️ Reutilizando modelo de anomalias versão {artefato['versao']}.")
+
+    return artefato
+
+def carregar_cache_anomalias(versao, caminho=CAMINHO_CACHE_ANOMALIAS):
+    """Carrega os scores já calculados pela versão `versao` do modelo.
+
+    O cache é indexado pelo hash das colunas de entrada do modelo: linhas cujo
+    conteúdo não mudou reaproveitam o score anterior sem nova pontuação.
+    """
+    vazio = pd.Series(dtype='float64', index=pd.Index([], dtype='uint64'))
+    if not os.path.exists(caminho):
+        return vazio
+    try:
+        with np.load(caminho, allow_pickle=False) as arquivo:
+            if str(arquivo['versao']) != versao:
+                return vazio
+            return pd.Series(arquivo['scores'], index=pd.Index(arquivo['hashes']))
+    except Exception as e:
+        print(f"⚠️ Cache de anomalias ignorado: {e}")
+        return vazio
+
+def salvar_cache_anomalias(cache, versao, caminho=CAMINHO_CACHE_ANOMALIAS):
+    caminho_temporario = caminho + '.tmp.npz'
+    np.savez(caminho_temporario, versao=np.array(versao),
+             hashes=cache.index.to_numpy(dtype='uint64'), scores=cache.to_numpy(dtype='float64'))
+    os.replace(caminho_temporario, caminho)
+
+def limiar_padrao_anomalias(artefato):
+    """Score acima do qual o modelo global marca a linha como anômala (equivale a `predict == -1`)."""
+    return -float(artefato['modelo'].offset_)
+
+def _limiares_por_linha(artefato, chaves, n_linhas):
+    limiares = np.full(n_linhas, limiar_padrao_anomalias(artefato))
+    if chaves is not None:
+        for chave, modelo in artefato['modelos_particao'].items():
+            limiares[chaves == chave] = -modelo.offset_
+    return limiares
+
+def aplicar_modelo_anomalias(df, artefato, cache=None, n_jobs=None, executor=None):
+    """Grava `score_anomalia` e a marcação `anomalias` usando um artefato já treinado.
+
+    `score_anomalia` é o negativo de `score_samples`: quanto maior, mais anômala
+    a notificação. `anomalias` marca os scores acima do limiar do modelo que
+    pontuou a linha (o da partição, no modo particionado).
+
+    Com `cache` (ver `carregar_cache_anomalias`) só as linhas ausentes do cache
+    são pontuadas; o cache é devolvido junto com o DataFrame, já atualizado.
+    `executor` é repassado a `pontuar_em_paralelo`.
+    """
+    df_modelo = _normalizar_colunas_modelo(df, artefato['mediana_idade'])
+    particionar_por = artefato.get('particionar_por')
+    chaves = _chaves_particao(df, particionar_por)
+
+    if cache is None:
+        scores, limiares = pontuar_em_paralelo(artefato['modelo'], _montar_matriz(df_modelo, artefato),
+                                               chaves, artefato.get('modelos_particao'), n_jobs, executor)
+    else:
+        colunas_hash = df_modelo[COLUNAS_MODELO]
+        if chaves is not None:
+            colunas_hash = colunas_hash.assign(_PARTICAO=chaves)
+        hashes = pd.util.hash_pandas_object(colunas_hash, index=False).to_numpy()
+        posicoes = cache.index.get_indexer(hashes)
+        faltantes = posicoes < 0
+        scores = np.zeros(len(hashes), dtype='float64')
+        scores[~faltantes] = cache.to_numpy()[posicoes[~faltantes]]
+        limiares = _limiares_por_linha(artefato, chaves, len(df))
+
+        if faltantes.any():
+            X = _montar_matriz(df_modelo[faltantes], artefato)
+            scores[faltantes], _ = pontuar_em_paralelo(artefato['modelo'], X,
+                                                       chaves[faltantes] if chaves is not None else None,
+                                                       artefato.get('modelos_particao'), n_jobs, executor)
+            novos = pd.Series(scores[faltantes], index=pd.Index(hashes[faltantes]))
+            cache = pd.concat([cache, novos[~novos.index.duplicated()]])
+
+    df['score_anomalia'] = scores
+    df['anomalias'] = (scores > limiares).astype(int)
+
+    if cache is None:
+        return df
+    return df, cache
+
+def detectar_anomalias(df, artefato=None, n_jobs=None, particionar_por=None):
+
+    for col in COLUNAS_CATEGORICAS_MODELO:
+        if col not in df.columns:
+            df[col] = np.nan
+
+    if artefato is None:
+        artefato = treinar_modelo_anomalias(df, n_jobs=n_jobs, particionar_por=particionar_por)
+
+    return aplicar_modelo_anomalias(df, artefato, n_jobs=n_jobs)
+
+def aplicar_modelo_risco(df, artefato_risco):
+    """Acrescenta GRAU_RISCO_PREVISTO com o modelo de risco salvo, se houver um."""
+    if artefato_risco is not None and len(df):
+        df['GRAU_RISCO_PREVISTO'] = prever_grau_risco(df, artefato_risco)
     return df
 
-def processar_dados_principal():
-    """Função principal para processar e salvar os dados."""
+def calcular_estatisticas_globais(caminho, tamanho_bloco=TAMANHO_BLOCO_PADRAO, formato_data=None,
+                                  limite_linhas=LIMITE_TREINO_ANOMALIAS):
+    """Passada leve sobre o CSV lendo apenas as colunas do modelo.
+
+    Devolve uma amostra uniforme de até `limite_linhas` linhas (reservatório
+    por chave aleatória: a memória fica em `limite_linhas` + um bloco, qualquer
+    que seja o tamanho do histórico). Mediana, vocabulário, distribuições de
+    referência e o IsolationForest são ajustados sobre ela; categorias raras
+    que não caírem na amostra são tratadas como desconhecidas na pontuação.
+    As colunas categóricas são mantidas como `category` para ocupar poucos
+    bytes por linha.
+    """
+    categoricas = COLUNAS_CATEGORICAS_MODELO + [c for c in COLUNAS_PARTICAO if c not in COLUNAS_CATEGORICAS_MODELO]
+    necessarias = set(COLUNAS_MODELO) | set(categoricas) | {'DATA_OCORRENCIA_EVENTO'}
+    rng = np.random.default_rng(PARAMETROS_ISOLATION_FOREST['random_state'])
+
+    blocos, chaves = [], []
+    for bloco in ler_csv_em_blocos(caminho, tamanho_bloco, colunas=necessarias):
+        bloco = pre_processar_dados(bloco, formato_data)
+        bloco = bloco.drop(columns=['DATA_OCORRENCIA_EVENTO', 'ANO', 'MES'], errors='ignore')
+        for col in categoricas:
+            if col not in bloco.columns:
+                bloco[col] = np.nan
+            bloco[col] = bloco[col].astype('category')
+        if 'IDADE_PACIENTE' in bloco.columns:
+            bloco['IDADE_PACIENTE'] = pd.to_numeric(bloco['IDADE_PACIENTE'], errors='coerce').astype('float32')
+        blocos.append(bloco)
+        chaves.append(rng.random(len(bloco)))
+        if sum(len(c) for c in chaves) > limite_linhas:
+            # Ficam as `limite_linhas` linhas de menor chave entre as já lidas.
+            corte = np.partition(np.concatenate(chaves), limite_linhas - 1)[limite_linhas - 1]
+            mantidas = [c <= corte for c in chaves]
+            blocos = [b[m] for b, m in zip(blocos, mantidas)]
+            chaves = [c[m] for c, m in zip(chaves, mantidas)]
+
+    if not blocos:
+        return pd.DataFrame(columns=COLUNAS_MODELO)
+
+    df_modelo = pd.DataFrame({
+        col: pd.Series(union_categoricals([b[col] for b in blocos], ignore_order=True))
+        for col in categoricas
+    })
+    if all('IDADE_PACIENTE' in b.columns for b in blocos):
+        df_modelo['IDADE_PACIENTE'] = np.concatenate([b['IDADE_PACIENTE'].to_numpy() for b in blocos])
+
+    return df_modelo
+
+def processar_dados_em_blocos(tamanho_bloco=TAMANHO_BLOCO_PADRAO, forcar_retreino=False, n_jobs=None, particionar_por=None):
+    """Processa o CSV em blocos, mantendo a memória limitada ao tamanho do bloco.
+
+    Uma primeira passada leve treina o modelo de anomalias sobre uma amostra
+    uniforme de até LIMITE_TREINO_ANOMALIAS linhas de todo o histórico; a
+    segunda aplica as transformações bloco a bloco e acrescenta o resultado
+    ao arquivo de saída. As regras de qualidade de
+    cada bloco bruto rodam num pool de processos enquanto o bloco segue pelo
+    restante do processamento; o mesmo pool, aberto uma vez com os modelos
+    já carregados, pontua todos os blocos.
+    """
+    formato_data = inferir_formato_data(CAMINHO_DADOS)
+    artefato = obter_artefato_anomalias(calcular_estatisticas_globais(CAMINHO_DADOS, tamanho_bloco, formato_data),
+                                        forcar_retreino, n_jobs, particionar_por)
+    cache = carregar_cache_anomalias(artefato['versao'])
+    artefato_risco = carregar_modelo_risco()
+
+    caminho_temporario = CAMINHO_DADOS_PROCESSADO + '.tmp'
+    total_linhas = 0
+    primeiro_bloco = True
+    parciais_qualidade = []
+    parciais_anonimizacao = []
+    tempo_anonimizacao = 0.0
+    n_processos = resolver_n_jobs(n_jobs)
+    with pool_pontuacao(artefato, n_processos) as executor:
+        pendentes_qualidade = set()
+        for bloco in ler_csv_em_blocos(CAMINHO_DADOS, tamanho_bloco):
+            # anonimizar_bloco copia o bloco: o original pode seguir para o pool sem cópia extra.
+            submeter_bloco(executor, pendentes_qualidade, parciais_qualidade, bloco,
+                           formato_data=formato_data, limite=2 * n_processos)
+            inicio = time.perf_counter()
+            bloco, parcial = anonimizar_bloco(bloco)
+            tempo_anonimizacao += time.perf_counter() - inicio
+            parciais_anonimizacao.append(parcial)
+            bloco = pre_processar_dados(bloco, formato_data)
+            for col in COLUNAS_CATEGORICAS_MODELO:
+                if col not in bloco.columns:
+                    bloco[col] = np.nan
+            bloco, cache = aplicar_modelo_anomalias(bloco, artefato, cache, n_jobs, executor)
+            bloco = aplicar_modelo_risco(bloco, artefato_risco)
+
+            bloco.to_csv(caminho_temporario, sep=';', encoding='ISO-8859-1', index=False,
+                         mode='w' if primeiro_bloco else 'a', header=primeiro_bloco)
+            primeiro_bloco = False
+            total_linhas += len(bloco)
+        parciais_qualidade.extend(f.result() for f in pendentes_qualidade)
+
+    os.replace(caminho_temporario, CAMINHO_DADOS_PROCESSADO)
+    salvar_cache_anomalias(cache, artefato['versao'])
+    salvar_relatorio_qualidade(montar_relatorio(combinar_parciais(parciais_qualidade)))
+    salvar_auditoria(resumo_auditoria(combinar_auditorias(parciais_anonimizacao), 'mascara', tempo_anonimizacao))
+    return total_linhas
+
+def processar_dados_principal(tamanho_bloco=None, forcar_retreino=False, n_jobs=None, particionar_por=None):
+    """Função principal para processar e salvar os dados.
+
+    Com `tamanho_bloco` informado o arquivo é processado em blocos, sem carregar
+    o CSV inteiro em memória. O modelo de anomalias salvo é reutilizado até que
+    o agendamento ou o drift peçam retreino (ou `forcar_retreino`). `n_jobs` e
+    `particionar_por` controlam o treino e a pontuação em paralelo. Se houver
+    modelo de risco salvo (modelo_risco_hemovigilancia), cada linha recebe
+    GRAU_RISCO_PREVISTO. As regras de qualidade são avaliadas sobre os dados
+    brutos na mesma passada e o relatório vai para reports/qualidade_dados.json;
+    em seguida CPF, telefone e e-mail do texto livre são mascarados, com
+    auditoria em reports/auditoria_anonimizacao.json.
+    """
     if not os.path.exists(CAMINHO_DADOS):
         print(f"❌ Erro: Arquivo de dados não encontrado em {CAMINHO_DADOS}. Execute o crawler primeiro.")
         return False
-        
+
     try:
+        if tamanho_bloco:
+            total_linhas = processar_dados_em_blocos(tamanho_bloco, forcar_retreino, n_jobs, particionar_por)
+            print(f"✅ {total_linhas} linhas processadas em blocos de {tamanho_bloco}. Salvo em {CAMINHO_DADOS_PROCESSADO}")
+            return True
+
+        df = ler_csv(CAMINHO_DADOS, datas=False)
+        formato_data = inferir_formato_data(CAMINHO_DADOS)
+        relatorio_qualidade = montar_relatorio(avaliar_bloco(df, formato_data=formato_data))
+        df, auditoria_anonimizacao = anonimizar_dataframe(df, n_jobs=n_jobs)
+
+        df = pre_processar_dados(df, formato_data)
+
+        for col in COLUNAS_CATEGORICAS_MODELO:
+            if col not in df.columns:
+                df[col] = np.nan
+
+        artefato = obter_artefato_anomalias(df, forcar_retreino, n_jobs, particionar_por)
+        df, cache = aplicar_modelo_anomalias(df, artefato, carregar_cache_anomalias(artefato['versao']), n_jobs)
+        salvar_cache_anomalias(cache, artefato['versao'])
+        df = aplicar_modelo_risco(df, carregar_modelo_risco())
 
-        df = pd.read_csv(CAMINHO_DADOS, sep=';', encoding='ISO-8859-1', on_bad_lines='skip')
-        
-        df = pre_processar_dados(df)
-        
-        df = detectar_anomalias(df)
-        
         df.to_csv(CAMINHO_DADOS_PROCESSADO, sep=';', encoding='ISO-8859-1', index=False)
+        salvar_relatorio_qualidade(relatorio_qualidade)
+        salvar_auditoria(auditoria_anonimizacao)
         print(f"✅ Dados processados e anomalias detectadas. Salvo em {CAMINHO_DADOS_PROCESSADO}")
         return True
-        
+
     except Exception as e:
         print(f"❌ Erro durante o processamento dos dados: {e}")
         return False
 
-if __name__ == "__main__":
-    processar_dados_principal()
+def benchmark_anomalias(n_linhas=1_000_000, n_jobs=-1):
+    """Compara o tempo de treino + pontuação entre os modos de detecção de anomalias.
+
+    Usa dados sintéticos com a mesma forma das colunas do modelo, para que o
+    resultado não dependa do arquivo baixado.
+    """
+    rng = np.random.default_rng(42)
+    ufs = np.array(['AC', 'AL', 'AP', 'AM', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MT', 'MS', 'MG', 'PA',
+                    'PB', 'PR', 'PE', 'PI', 'RJ', 'RN', 'RS', 'RO', 'RR', 'SC', 'SP', 'SE', 'TO'])
+    df = pd.DataFrame({
+        'TIPO_REACAO_TRANSFUSIONAL': rng.choice([f'TIPO {i}' for i in range(20)], n_linhas),
+        'GRAU_RISCO': rng.choice(['Grau I   - Leve', 'Grau II  - Moderado', 'Grau III - Grave', 'Grau IV  - Óbito'], n_linhas),
+        'IDADE_PACIENTE': rng.integers(0, 100, n_linhas).astype(float),
+        'UF_NOTIFICACAO': rng.choice(ufs, n_linhas),
+    })
+
+    cenarios = [
+        ('sequencial (atual)', {'n_jobs': None, 'particionar_por': None}),
+        (f'paralelo (n_jobs={n_jobs})', {'n_jobs': n_jobs, 'particionar_por': None}),
+        ('particionado por UF', {'n_jobs': n_jobs, 'particionar_por': 'UF_NOTIFICACAO'}),
+        ('particionado por tipo', {'n_jobs': n_jobs, 'particionar_por': 'TIPO_REACAO_TRANSFUSIONAL'}),
+    ]
 
+    print(f"Benchmark de detecção de anomalias: {n_linhas} linhas, {os.cpu_count()} núcleos")
+    resultados = {}
+    for nome, parametros in cenarios:
+        inicio = time.perf_counter()
+        detectar_anomalias(df.copy(), **parametros)
+        resultados[nome] = time.perf_counter() - inicio
+        print(f"  {nome:<28} {resultados[nome]:8.2f} s")
+
+    # Pontuação em blocos, como no modo --tamanho-bloco: um pool por bloco contra um pool único.
+    artefato = treinar_modelo_anomalias(df, n_jobs=n_jobs)
+    X = _montar_matriz(_normalizar_colunas_modelo(df, artefato['mediana_idade']), artefato).to_numpy()
+    posicoes = np.array_split(np.arange(n_linhas), max(1, n_linhas // TAMANHO_BLOCO_PADRAO))
+    inicio = time.perf_counter()
+    for pos in posicoes:
+        pontuar_em_paralelo(artefato['modelo'], X[pos], n_jobs=n_jobs)
+    resultados['blocos, pool por bloco'] = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    with pool_pontuacao(artefato, n_jobs) as pool:
+        for pos in posicoes:
+            pontuar_em_paralelo(artefato['modelo'], X[pos], n_jobs=n_jobs, executor=pool)
+    resultados['blocos, pool único'] = time.perf_counter() - inicio
+    for nome in ('blocos, pool por bloco', 'blocos, pool único'):
+        print(f"  {nome:<28} {resultados[nome]:8.2f} s")
+    return resultados
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pré-processamento e detecção de anomalias de hemovigilância.")
+    parser.add_argument('--tamanho-bloco', type=int, default=None,
+                        help=f"Processa o CSV em blocos deste número de linhas (ex.: {TAMANHO_BLOCO_PADRAO}).")
+    parser.add_argument('--retreinar', action='store_true',
+                        help="Força o retreino do modelo de anomalias mesmo sem drift.")
+    parser.add_argument('--n-jobs', type=int, default=None,
+                        help="Processos usados no treino e na pontuação (-1 = todos os núcleos).")
+    parser.add_argument('--particionar-por', choices=COLUNAS_PARTICAO, default=None,
+                        help="Ajusta também um modelo por valor desta coluna (anomalias locais).")
+    parser.add_argument('--benchmark', type=int, metavar='N_LINHAS', default=None,
+                        help="Mede o tempo dos modos de detecção com N_LINHAS sintéticas e sai.")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark_anomalias(args.benchmark, n_jobs=args.n_jobs if args.n_jobs is not None else -1)
+    else:
+        processar_dados_principal(tamanho_bloco=args.tamanho_bloco, forcar_retreino=args.retreinar,
+                                  n_jobs=args.n_jobs, particionar_por=args.particionar_por)
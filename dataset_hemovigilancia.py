@@ -0,0 +1,347 @@
+"""
+Camada de dados compartilhada pelo app Flask e pelo dashboard Streamlit.
+
+Um snapshot é o DataFrame já carregado e derivado (ANO, MES, anomalias,
+score) mais as estruturas calculadas uma única vez sobre ele: a ordem global
+por score de anomalia, as opções dos filtros, o cubo de contagens UF x tipo
+x ano (de onde saem as facetas), os esboços de quantis do atraso de
+notificação e uma `versao` que identifica o arquivo de origem. O DataFrame
+do snapshot é somente leitura: quem precisar alterá-lo deve copiar antes.
+
+Os recortes por filtro são memoizados por seleção no próprio snapshot (LRU);
+como um novo carregamento cria um novo snapshot, o cache nunca fica velho.
+O filtro `busca` (texto livre na descrição do evento) usa um índice FTS5
+criado na primeira busca sobre o snapshot; com ele o recorte vem ordenado
+por relevância. Para respostas aproximadas, o snapshot guarda ainda uma
+amostra estratificada por UF x ano, criada no primeiro uso.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from amostra_hemovigilancia import construir_amostra
+from atrasos_hemovigilancia import construir_esbocos
+from busca_hemovigilancia import construir_indice, relevancia_linhas, texto_busca
+from esquema_hemovigilancia import ler_csv
+from relatorios_hemovigilancia import FORMATOS_RELATORIO, caminho_relatorio, carregar_relatorio
+
+CAMINHO_DADOS_ORIGINAL = 'data/DADOS_ABERTOS_HEMOVIGILANCIA_UTF8.csv'
+CAMINHO_DADOS = 'data/DADOS_HEMOVIGILANCIA_PROCESSADO.csv'  # Arquivo com anomalias
+CAMINHO_DADOS_BACKUP = 'data/old.DADOS_ABERTOS_HEMOVIGILANCIA_UTF8.csv'
+# Relatório da análise avançada (sem extensão: Parquet, CSV gzip ou xlsx).
+CAMINHO_RELATORIO_ANOMALIAS = 'reports/resultado_com_anomalias'
+
+FONTES_SNAPSHOT = (CAMINHO_DADOS, CAMINHO_DADOS_BACKUP, CAMINHO_DADOS_ORIGINAL)
+# Colunas lidas para o snapshot do app e do dashboard: as dos filtros, gráficos,
+# esboços e busca, mais o identificador exibido em /dados.
+COLUNAS_SNAPSHOT = [
+    'NU_NOTIFICACAO', 'UF_NOTIFICACAO', 'TIPO_REACAO_TRANSFUSIONAL', 'DATA_OCORRENCIA_EVENTO',
+    'DATA_NOTIFICACAO_EVENTO', 'ANO', 'MES', 'TEMPO_NOTIFICACAO_DIAS', 'IDADE_PACIENTE', 'GRAU_RISCO',
+    'SCORE_ANOMALIA', 'ANOMALIAS', 'ANOMALY_LABEL', 'GRAU_RISCO_PREVISTO', 'DS_ESPECIFICACAO_EVENTO',
+]
+MAX_FILTROS_MEMORIZADOS = 32
+
+# Filtro -> coluna filtrada por pertinência.
+COLUNAS_FILTRO = {
+    'ufs': 'UF_NOTIFICACAO',
+    'tipos_evento': 'TIPO_REACAO_TRANSFUSIONAL',
+    'anos': 'ANO',
+}
+FILTROS_SUPORTADOS = tuple(COLUNAS_FILTRO) + ('data_inicio', 'data_fim', 'busca')
+
+_snapshot_atual = None
+_carregador_snapshot = None
+_trava_snapshot = threading.Lock()
+_trava_indice_busca = threading.Lock()
+_trava_amostra = threading.Lock()
+
+
+def _arquivos_da_fonte(fonte):
+    if fonte.endswith('.csv'):
+        return [fonte] if os.path.exists(fonte) else []
+    return [c for c in (caminho_relatorio(fonte, f) for f in FORMATOS_RELATORIO) if os.path.exists(c)]
+
+
+def versao_arquivos(arquivos):
+    """Identifica o conteúdo da fonte pelo nome, tamanho e data de modificação dos arquivos."""
+    partes = []
+    for caminho in arquivos:
+        info = os.stat(caminho)
+        partes.append(f"{os.path.basename(caminho)}:{info.st_size}:{info.st_mtime_ns}")
+    return '|'.join(partes)
+
+
+def _derivar_colunas(df):
+    if "DATA_OCORRENCIA_EVENTO" in df.columns:
+        df["ANO"] = df["DATA_OCORRENCIA_EVENTO"].dt.year
+        df["MES"] = df["DATA_OCORRENCIA_EVENTO"].dt.month
+    elif "DATA_NOTIFICACAO_EVENTO" in df.columns:
+        df["ANO"] = df["DATA_NOTIFICACAO_EVENTO"].dt.year
+        df["MES"] = df["DATA_NOTIFICACAO_EVENTO"].dt.month
+
+    # O relatório da análise avançada marca anomalias em `anomaly_label`.
+    origem_anomalias = next((c for c in ("ANOMALIAS", "ANOMALY_LABEL") if c in df.columns), None)
+    if origem_anomalias:
+        df["anomalias"] = pd.to_numeric(df[origem_anomalias], errors="coerce").fillna(0).astype(int)
+    else:
+        df["anomalias"] = 0
+
+    if "SCORE_ANOMALIA" in df.columns:
+        df["score_anomalia"] = pd.to_numeric(df["SCORE_ANOMALIA"], errors="coerce")
+    return df
+
+
+def opcoes_filtro(df):
+    """Opções disponíveis para os filtros."""
+    return {
+        'ufs': sorted(df['UF_NOTIFICACAO'].dropna().unique().tolist()) if 'UF_NOTIFICACAO' in df.columns else [],
+        'tipos_evento': sorted(df['TIPO_REACAO_TRANSFUSIONAL'].dropna().unique().tolist()) if 'TIPO_REACAO_TRANSFUSIONAL' in df.columns else [],
+        'anos': sorted(df['ANO'].dropna().unique().astype(int).tolist()) if 'ANO' in df.columns else []
+    }
+
+
+def cubo_filtros(df, opcoes):
+    """Contagens UF x tipo x ano, com os eixos na ordem das opções dos filtros."""
+    eixos = [nome for nome in COLUNAS_FILTRO if COLUNAS_FILTRO[nome] in df.columns]
+    if not eixos:
+        return None
+    tamanhos = [len(opcoes[nome]) for nome in eixos]
+    codigo = np.zeros(len(df), dtype=np.int64)
+    validas = np.ones(len(df), dtype=bool)
+    for nome, tamanho in zip(eixos, tamanhos):
+        codigos = pd.Categorical(df[COLUNAS_FILTRO[nome]], categories=opcoes[nome]).codes.astype(np.int64)
+        validas &= codigos >= 0
+        codigo = codigo * tamanho + codigos
+    contagens = np.bincount(codigo[validas], minlength=int(np.prod(tamanhos))).reshape(tamanhos)
+    return {'eixos': eixos, 'contagens': contagens}
+
+
+def _valores_opcao(nome, valores):
+    if nome == 'anos':
+        return set(pd.to_numeric(pd.Series(list(valores)), errors='coerce').dropna().astype(int).tolist())
+    return {str(v) for v in valores}
+
+
+def facetas(cubo, opcoes, filtros):
+    """Para cada filtro, a contagem de cada opção dadas as seleções dos outros filtros.
+
+    Tudo sai do cubo: cada faceta é a soma do cubo restrito às seleções das
+    demais dimensões, sem ler as linhas.
+    """
+    mascaras = []
+    for nome in cubo['eixos']:
+        selecionados = _valores_opcao(nome, filtros.get(nome) or [])
+        if selecionados:
+            mascaras.append(np.array([v in selecionados for v in opcoes[nome]], dtype=bool))
+        else:
+            mascaras.append(None)
+
+    resultado = {}
+    for eixo, nome in enumerate(cubo['eixos']):
+        restrito = cubo['contagens']
+        for outro, mascara in enumerate(mascaras):
+            if outro != eixo and mascara is not None:
+                restrito = np.compress(mascara, restrito, axis=outro)
+        somas = restrito.sum(axis=tuple(i for i in range(restrito.ndim) if i != eixo))
+        resultado[nome] = {str(opcao): int(n) for opcao, n in zip(opcoes[nome], somas)}
+    return resultado
+
+
+def montar_snapshot(df, versao, caminho=None):
+    """Deriva as colunas e as estruturas compartilhadas de um DataFrame recém-carregado."""
+    df = _derivar_colunas(df.reset_index(drop=True))
+    if "score_anomalia" in df.columns:
+        # Posições ordenadas do score mais anômalo para o menos anômalo (NaN ao final).
+        ordem_score = np.argsort(-df["score_anomalia"].to_numpy(), kind='stable')
+    else:
+        ordem_score = None
+
+    opcoes = opcoes_filtro(df)
+    try:
+        ultima_atualizacao = datetime.fromtimestamp(os.path.getmtime(CAMINHO_DADOS)).strftime('%d/%m/%Y %H:%M:%S')
+    except FileNotFoundError:
+        ultima_atualizacao = "N/A (Arquivo principal não encontrado)"
+
+    return {
+        'df': df,
+        'versao': versao,
+        'origem': caminho,
+        'carregado_em': datetime.now(),
+        'ultima_atualizacao': ultima_atualizacao,
+        'ordem_score': ordem_score,
+        'opcoes': opcoes,
+        'cubo': cubo_filtros(df, opcoes),
+        'atrasos': construir_esbocos(df),
+        'indice_busca': None,
+        'amostra': None,
+        'filtros': OrderedDict(),
+        'trava': threading.Lock(),
+    }
+
+
+def carregar_snapshot(fontes=FONTES_SNAPSHOT, colunas=COLUNAS_SNAPSHOT):
+    """Carrega a primeira fonte existente (CSV ou base de relatório); None se nenhuma existir.
+
+    Só as `colunas` são lidas (None lê todas).
+    """
+    for fonte in fontes:
+        arquivos = _arquivos_da_fonte(fonte)
+        if not arquivos:
+            continue
+        if fonte.endswith('.csv'):
+            df = ler_csv(fonte, colunas=colunas)
+        else:
+            df = carregar_relatorio(fonte, colunas=colunas)
+        if df is not None:
+            return montar_snapshot(df, versao_arquivos(arquivos), fonte)
+    return None
+
+
+def definir_carregador(carregador):
+    """Troca a função que carrega o snapshot do processo (ex.: a do backend SQLite)."""
+    global _carregador_snapshot
+    _carregador_snapshot = carregador
+    invalidar_snapshot()
+
+
+def obter_snapshot(fontes=FONTES_SNAPSHOT):
+    """Snapshot do processo (carregado na primeira chamada); None se não houver dados."""
+    global _snapshot_atual
+    if _snapshot_atual is None:
+        with _trava_snapshot:
+            if _snapshot_atual is None:
+                _snapshot_atual = (_carregador_snapshot or carregar_snapshot)(fontes)
+    return _snapshot_atual
+
+
+def invalidar_snapshot():
+    """Descarta o snapshot do processo; o próximo `obter_snapshot` relê os dados."""
+    global _snapshot_atual
+    with _trava_snapshot:
+        _snapshot_atual = None
+
+
+def chave_filtros(filtros):
+    """Chave canônica (hashable) de uma seleção; filtros vazios ou desconhecidos são ignorados."""
+    chave = []
+    for nome, valor in filtros.items():
+        if not valor or nome not in FILTROS_SUPORTADOS:
+            continue
+        if nome == 'busca':
+            # A ordem das palavras importa nas frases: a consulta fica como texto.
+            valor = texto_busca(valor)
+            if valor:
+                chave.append((nome, valor))
+        elif isinstance(valor, (list, tuple, set)):
+            chave.append((nome, tuple(sorted(map(str, valor)))))
+        else:
+            chave.append((nome, str(valor)))
+    return tuple(sorted(chave))
+
+
+def filtros_da_chave(chave):
+    """Filtros a partir de uma chave de `chave_filtros`."""
+    return {nome: valor if isinstance(valor, str) else list(valor) for nome, valor in chave}
+
+
+def obter_indice_busca(snapshot):
+    """Índice de busca textual do snapshot, criado na primeira busca."""
+    if snapshot['indice_busca'] is None:
+        with _trava_indice_busca:
+            if snapshot['indice_busca'] is None:
+                snapshot['indice_busca'] = construir_indice(snapshot['df'])
+    return snapshot['indice_busca']
+
+
+def obter_amostra(snapshot):
+    """Amostra estratificada do snapshot, criada no primeiro pedido de resposta aproximada."""
+    if snapshot['amostra'] is None:
+        with _trava_amostra:
+            if snapshot['amostra'] is None:
+                snapshot['amostra'] = construir_amostra(snapshot['df'])
+    return snapshot['amostra']
+
+
+def mascara_amostra(snapshot, filtros):
+    """Máscara da seleção sobre as linhas da amostra do snapshot (None se não houver amostra)."""
+    amostra = obter_amostra(snapshot)
+    if amostra is None:
+        return None
+    mascara = mascara_filtros(amostra['df'], filtros)
+    consulta = texto_busca(filtros.get('busca'))
+    if consulta:
+        indice = obter_indice_busca(snapshot)
+        if indice is None:
+            return np.zeros(len(mascara), dtype=bool)
+        mascara &= relevancia_linhas(indice, consulta)[amostra['posicoes']] >= 0
+    return mascara
+
+
+def _data_filtro(valor):
+    # Da query string as datas chegam como lista de um elemento.
+    return pd.to_datetime(valor[0] if isinstance(valor, (list, tuple)) else valor)
+
+
+def mascara_filtros(df, filtros):
+    """Máscara booleana da seleção, combinando todos os filtros numa única passada."""
+    mascara = np.ones(len(df), dtype=bool)
+    for nome, coluna in COLUNAS_FILTRO.items():
+        valores = filtros.get(nome)
+        if not valores or coluna not in df.columns:
+            continue
+        if nome == 'anos':
+            # Da URL os anos chegam como texto; a coluna é numérica.
+            valores = pd.to_numeric(pd.Series(list(valores)), errors='coerce').dropna().tolist()
+        mascara &= df[coluna].isin(valores).to_numpy()
+    if filtros.get('data_inicio'):
+        mascara &= (df['DATA_OCORRENCIA_EVENTO'] >= _data_filtro(filtros['data_inicio'])).to_numpy()
+    if filtros.get('data_fim'):
+        mascara &= (df['DATA_OCORRENCIA_EVENTO'] <= _data_filtro(filtros['data_fim'])).to_numpy()
+    return mascara
+
+
+def selecionar(df, filtros, indice_busca=None):
+    """Linhas da seleção; com `busca`, só as que casam, da mais para a menos relevante.
+
+    Sem `indice_busca`, um índice temporário é criado para `df`.
+    """
+    mascara = mascara_filtros(df, filtros)
+    consulta = texto_busca(filtros.get('busca'))
+    if not consulta:
+        return df[mascara]
+    indice = indice_busca if indice_busca is not None else construir_indice(df)
+    if indice is None:
+        return df.iloc[:0]
+    relevancia = relevancia_linhas(indice, consulta)
+    posicoes = np.flatnonzero(mascara & (relevancia >= 0))
+    return df.iloc[posicoes[np.argsort(relevancia[posicoes], kind='stable')]]
+
+
+def filtrar(snapshot, filtros, seletor=None):
+    """Recorte do snapshot para a seleção, memoizado por seleção (somente leitura).
+
+    `seletor(df, filtros)` substitui a seleção em pandas (ex.: posições vindas do banco).
+    """
+    chave = chave_filtros(filtros)
+    if not chave:
+        return snapshot['df']
+    with snapshot['trava']:
+        if chave in snapshot['filtros']:
+            snapshot['filtros'].move_to_end(chave)
+            return snapshot['filtros'][chave]
+    df = snapshot['df']
+    if seletor is not None:
+        recorte = seletor(df, filtros)
+    else:
+        indice_busca = obter_indice_busca(snapshot) if 'busca' in dict(chave) else None
+        recorte = selecionar(df, filtros, indice_busca)
+    with snapshot['trava']:
+        snapshot['filtros'][chave] = recorte
+        while len(snapshot['filtros']) > MAX_FILTROS_MEMORIZADOS:
+            snapshot['filtros'].popitem(last=False)
+    return recorte
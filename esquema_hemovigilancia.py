@@ -0,0 +1,198 @@
+"""
+Esquema das colunas dos dados abertos de hemovigilância.
+
+NU_NOTIFICACAO é texto (tem zeros à esquerda), os campos descritivos têm
+poucos valores distintos e viram `category`, e o formato das datas é
+resolvido a partir dos próprios valores (`resolver_formato_data`).
+ETAPA_CICLO_SANGUE nem sempre vem no arquivo, mas entra no esquema porque o
+modelo de risco a usa quando existe; as colunas finais são criadas pelo
+data_processor.
+
+Todos os carregadores usam `ler_csv`/`ler_csv_em_blocos`, que passam `dtype`
+e `usecols` ao `read_csv` e convertem as datas uma única vez.
+"""
+
+import warnings
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:
+    from pandas._libs.tslibs.parsing import guess_datetime_format
+
+SEPARADOR_CSV = ';'
+ENCODING_CSV = 'ISO-8859-1'
+# Formatos tentados, em ordem, antes dos inferidos dos valores; o primeiro é o do arquivo da Anvisa.
+FORMATOS_DATA_CANDIDATOS = ('%m/%d/%Y %H:%M:%S', '%d/%m/%Y %H:%M:%S')
+# Valores conferidos ao escolher o formato das datas de uma coluna.
+AMOSTRA_FORMATO_DATA = 1000
+
+FAIXAS_ETARIAS_DICIONARIO = [
+    '< 1 ano', 'De 1 a 4 anos', 'De 5 a 9 anos', 'De 10 a 19 anos', 'De 20 a 29 anos',
+    'De 30 a 39 anos', 'De 40 a 49 anos', 'De 50 a 59 anos', 'De 60 a 69 anos',
+    'Acima de 70 anos', 'Não se enquadra'
+]
+
+# tipo: 'texto', 'categoria', 'data', 'inteiro', 'decimal'; nulo: se o campo pode vir vazio.
+ESQUEMA_COLUNAS = {
+    'ID_NOTIFICACAO': {'tipo': 'texto', 'nulo': True},
+    'NU_NOTIFICACAO': {'tipo': 'texto', 'nulo': False},
+    'DATA_OCORRENCIA_EVENTO': {'tipo': 'data', 'nulo': True},
+    'DATA_NOTIFICACAO_EVENTO': {'tipo': 'data', 'nulo': True},
+    'STATUS_ANALISE': {'tipo': 'categoria', 'nulo': True},
+    'PRODUTO_MOTIVO': {'tipo': 'categoria', 'nulo': True},
+    'TIPO_REACAO_TRANSFUSIONAL': {'tipo': 'categoria', 'nulo': True},
+    'GRAU_RISCO': {'tipo': 'categoria', 'nulo': True},
+    'CATEGORIA_NOTIFICADOR': {'tipo': 'categoria', 'nulo': True},
+    'TIPO_HEMOCOMPONENTE': {'tipo': 'categoria', 'nulo': True},
+    'FAIXA_ETARIA_PACIENTE': {'tipo': 'categoria', 'nulo': True},
+    'CIDADE_NOTIFICACAO': {'tipo': 'categoria', 'nulo': True},
+    'UF_NOTIFICACAO': {'tipo': 'categoria', 'nulo': True},
+    'DS_TEMPORALIDADE_REACAO': {'tipo': 'categoria', 'nulo': True},
+    'TIPO_EVENTO_ADVERSO': {'tipo': 'categoria', 'nulo': True},
+    'IDADE_PACIENTE': {'tipo': 'decimal', 'nulo': True},
+    'DS_ESPECIFICACAO_EVENTO': {'tipo': 'texto', 'nulo': True},
+    'ETAPA_CICLO_SANGUE': {'tipo': 'categoria', 'nulo': True},
+    # Colunas acrescentadas no arquivo processado.
+    'ANO': {'tipo': 'inteiro', 'nulo': True},
+    'MES': {'tipo': 'inteiro', 'nulo': True},
+    'TEMPO_NOTIFICACAO_DIAS': {'tipo': 'decimal', 'nulo': True},
+    'SCORE_ANOMALIA': {'tipo': 'score', 'nulo': True},
+    'ANOMALIAS': {'tipo': 'inteiro', 'nulo': True},
+    'GRAU_RISCO_PREVISTO': {'tipo': 'inteiro', 'nulo': True},
+}
+
+DTYPES_POR_TIPO = {
+    'texto': str,
+    'categoria': 'category',
+    'data': str,
+    'inteiro': 'Int32',
+    'decimal': 'float32',
+    'score': 'float64',
+}
+
+
+def colunas_do_tipo(tipo):
+    return [nome for nome, definicao in ESQUEMA_COLUNAS.items() if definicao['tipo'] == tipo]
+
+
+def dtype_leitura(nome, categorias=True):
+    """dtype do `read_csv` para a coluna (nome já normalizado), ou None se fora do esquema."""
+    definicao = ESQUEMA_COLUNAS.get(nome)
+    if definicao is None:
+        return None
+    if definicao['tipo'] == 'categoria' and not categorias:
+        return str
+    return DTYPES_POR_TIPO[definicao['tipo']]
+
+
+def _normalizar(nome):
+    return str(nome).upper().strip()
+
+
+def _parametros_leitura(caminho, colunas, categorias, encoding):
+    """`usecols` e `dtype` com os nomes exatos do cabeçalho do arquivo."""
+    cabecalho = pd.read_csv(caminho, sep=SEPARADOR_CSV, encoding=encoding, nrows=0).columns
+    desejadas = None if colunas is None else {_normalizar(c) for c in colunas}
+    usecols = [c for c in cabecalho if desejadas is None or _normalizar(c) in desejadas]
+    dtype = {c: dtype_leitura(_normalizar(c), categorias) for c in usecols
+             if dtype_leitura(_normalizar(c), categorias) is not None}
+    return usecols, dtype
+
+
+def _falhas_formato(valores, formato):
+    falhas = 0
+    for valor in valores:
+        try:
+            datetime.strptime(valor, formato)
+        except ValueError:
+            falhas += 1
+    return falhas
+
+
+def resolver_formato_data(valores):
+    """Formato das datas: o primeiro candidato que serve para toda a amostra.
+
+    Os candidatos são FORMATOS_DATA_CANDIDATOS e os inferidos do primeiro
+    valor (dia primeiro e mês primeiro), conferidos contra até
+    AMOSTRA_FORMATO_DATA valores não nulos. Se nenhum servir para todos,
+    avisa quantos valores ficarão vazios e usa o que falha menos; se nenhum
+    servir para valor algum, devolve None (inferência do pandas).
+    """
+    amostra = pd.Series(valores).dropna().astype(str).head(AMOSTRA_FORMATO_DATA).tolist()
+    if not amostra:
+        return None
+    candidatos = list(FORMATOS_DATA_CANDIDATOS)
+    for dia_primeiro in (True, False):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            formato = guess_datetime_format(amostra[0], dayfirst=dia_primeiro)
+        if formato and formato not in candidatos:
+            candidatos.append(formato)
+
+    falhas = {}
+    for formato in candidatos:
+        falhas[formato] = _falhas_formato(amostra, formato)
+        if not falhas[formato]:
+            return formato
+    melhor = min(candidatos, key=falhas.get)
+    if falhas[melhor] == len(amostra):
+        print(f"⚠️ Nenhum formato de data reconhecido (ex.: {amostra[0]!r}); usando a inferência do pandas.")
+        return None
+    print(f"⚠️ Nenhum formato de data serve para toda a amostra: {falhas[melhor]} de {len(amostra)} "
+          f"valores não seguem {melhor} e ficarão vazios.")
+    return melhor
+
+
+def converter_datas(df, formato_data=None, colunas=None):
+    """Converte as colunas de data do esquema (as que ainda são texto) para datetime."""
+    for col in colunas or colunas_do_tipo('data'):
+        if col not in df.columns or pd.api.types.is_datetime64_any_dtype(df[col]):
+            continue
+        formato = formato_data or resolver_formato_data(df[col])
+        if formato:
+            df[col] = pd.to_datetime(df[col], errors='coerce', format=formato)
+        else:
+            df[col] = pd.to_datetime(df[col], errors='coerce', dayfirst=True)
+    return df
+
+
+def aplicar_esquema(df, categorias=True, datas=True):
+    """Aplica os tipos do esquema a um DataFrame já carregado (ex.: vindo de Excel)."""
+    df.columns = [_normalizar(c) for c in df.columns]
+    for col in df.columns:
+        dtype = dtype_leitura(col, categorias)
+        if dtype is None or ESQUEMA_COLUNAS[col]['tipo'] == 'data':
+            continue
+        if ESQUEMA_COLUNAS[col]['tipo'] in ('inteiro', 'decimal', 'score'):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+        elif dtype is str:
+            df[col] = df[col].astype(object).where(df[col].isna(), df[col].astype(str))
+        else:
+            df[col] = df[col].astype(dtype)
+    return converter_datas(df) if datas else df
+
+
+def ler_csv(caminho, colunas=None, categorias=True, datas=True, formato_data=None, encoding=ENCODING_CSV, **kwargs):
+    """`read_csv` tipado e projetado pelo esquema, com colunas em maiúsculas.
+
+    `colunas` restringe a leitura (nomes sem distinção de maiúsculas); colunas
+    fora do esquema são lidas com a inferência do pandas.
+    """
+    usecols, dtype = _parametros_leitura(caminho, colunas, categorias, encoding)
+    df = pd.read_csv(caminho, sep=SEPARADOR_CSV, encoding=encoding, on_bad_lines='skip',
+                     usecols=usecols, dtype=dtype, **kwargs)
+    df.columns = [_normalizar(c) for c in df.columns]
+    return converter_datas(df, formato_data) if datas else df
+
+
+def ler_csv_em_blocos(caminho, tamanho_bloco, colunas=None, categorias=True, datas=False, formato_data=None):
+    """Itera sobre o CSV em blocos tipados; por padrão as datas ficam como texto bruto."""
+    usecols, dtype = _parametros_leitura(caminho, colunas, categorias, ENCODING_CSV)
+    leitor = pd.read_csv(caminho, sep=SEPARADOR_CSV, encoding=ENCODING_CSV, on_bad_lines='skip',
+                         usecols=usecols, dtype=dtype, chunksize=tamanho_bloco)
+    for bloco in leitor:
+        bloco.columns = [_normalizar(c) for c in bloco.columns]
+        yield converter_datas(bloco, formato_data) if datas else bloco
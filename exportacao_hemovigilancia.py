@@ -0,0 +1,159 @@
+"""
+Exportação estática do dashboard para servir o tráfego somente leitura.
+
+As páginas de ROTAS_EXPORTACAO são renderizadas pela própria aplicação
+(test client) para a visão global e para cada uma das 27 UFs, junto com o
+JSON do painel (/api/painel) de cada escopo, que a página do painel
+exportada lê no lugar da API, e as respostas de /api/filtros e /api/status
+que as páginas pedem ao abrir. Os links para ROTAS_DINAMICAS, que não têm
+versão estática, são retirados das páginas. Cada escopo é um trabalho
+independente, distribuído num pool de processos. Arquivos de texto ganham
+uma cópia .gz ao lado (para `gzip_static` do nginx e similares).
+
+Estrutura gerada:
+
+    destino/index.html, destino/visao-geral/index.html, destino/painel/index.html, ...
+    destino/uf/SP/index.html, destino/uf/SP/visao-geral/index.html, ...
+    destino/painel.json, destino/uf/SP/painel.json
+    destino/api/filtros, destino/api/status
+    destino/static/...
+"""
+
+import gzip
+import importlib
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from aquecimento_hemovigilancia import MARCA_AQUECIMENTO
+
+DESTINO_EXPORTACAO = 'site_estatico'
+# Página -> rota.
+ROTAS_EXPORTACAO = {
+    'index': '/',
+    'visao_geral': '/visao-geral',
+    'painel': '/painel',
+    'distribuicoes': '/distribuicoes',
+    'mapa_brasil': '/mapa-brasil',
+    'correlacao': '/correlacao',
+}
+# Rotas que dependem do servidor (dados brutos, atualização).
+ROTAS_DINAMICAS = ('/dados', '/atualizar-dados')
+UFS_BRASIL = (
+    'AC', 'AL', 'AP', 'AM', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MT', 'MS', 'MG', 'PA',
+    'PB', 'PR', 'PE', 'PI', 'RJ', 'RN', 'RS', 'RO', 'RR', 'SC', 'SP', 'SE', 'TO',
+)
+EXTENSOES_COMPRIMIDAS = ('.html', '.json', '.js', '.css', '.svg', '.txt', '')
+NIVEL_GZIP = 9
+
+# Aplicação de cada processo do pool (criada no inicializador).
+_app = None
+
+
+def caminho_escopo(uf=None):
+    """Prefixo de URL (e de diretório) do escopo: '/' para a visão global, '/uf/SP/' por UF."""
+    return '/' if uf is None else f'/uf/{uf}/'
+
+
+def comprimir(caminho):
+    """Grava `caminho`.gz ao lado do arquivo (mtime zerado: exportações iguais geram bytes iguais)."""
+    with open(caminho, 'rb') as origem, open(caminho + '.gz', 'wb') as saida:
+        with gzip.GzipFile(filename='', mode='wb', fileobj=saida, compresslevel=NIVEL_GZIP, mtime=0) as destino_gz:
+            shutil.copyfileobj(origem, destino_gz)
+
+
+def gravar(destino, relativo, conteudo):
+    """Grava o arquivo (e o .gz, se for texto) e devolve o caminho relativo."""
+    caminho = os.path.join(destino, relativo.lstrip('/'))
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(caminho, 'wb') as f:
+        f.write(conteudo)
+    if os.path.splitext(caminho)[1] in EXTENSOES_COMPRIMIDAS:
+        comprimir(caminho)
+    return relativo
+
+
+def remover_links(html, rotas=ROTAS_DINAMICAS):
+    """Retira os links para `rotas` (com o item de menu que os contém, se houver)."""
+    for rota in rotas:
+        link = rf'<a\b[^>]*href="{re.escape(rota)}"[^>]*>.*?</a>'
+        html = re.sub(rf'<li\b[^>]*>\s*{link}\s*</li>', '', html, flags=re.S)
+        html = re.sub(link, '', html, flags=re.S)
+    return html
+
+
+def reescrever_links(html, uf):
+    """Aponta a navegação entre as páginas exportadas para as versões do escopo e retira as dinâmicas."""
+    prefixo = caminho_escopo(uf)
+    for rota in ROTAS_EXPORTACAO.values():
+        destino = prefixo if rota == '/' else prefixo + rota.lstrip('/') + '/'
+        html = html.replace(f'href="{rota}"', f'href="{destino}"')
+    return remover_links(html)
+
+
+def _iniciar_processo(nome_app):
+    global _app
+    # Com fork o módulo (e o snapshot já carregado) vêm do processo pai; senão são importados aqui.
+    modulo = importlib.import_module(nome_app)
+    modulo.carregar_dados()
+    _app = modulo.app
+
+
+def exportar_escopo(destino, uf=None):
+    """Renderiza as páginas e o JSON do painel de um escopo; devolve os arquivos gravados."""
+    cliente = _app.test_client()
+    ambiente = {MARCA_AQUECIMENTO: True}
+    consulta = {} if uf is None else {'ufs': uf}
+    prefixo = caminho_escopo(uf)
+    arquivos = []
+    for rota in ROTAS_EXPORTACAO.values():
+        resposta = cliente.get(rota, query_string=consulta, environ_overrides=ambiente)
+        if resposta.status_code != 200:
+            raise RuntimeError(f"{rota} ({uf or 'global'}) respondeu {resposta.status_code}")
+        html = reescrever_links(resposta.get_data(as_text=True), uf)
+        if rota == '/painel':
+            # Sem servidor, o painel lê o JSON exportado do escopo em vez de /api/painel.
+            html = html.replace('id="painel"', f'id="painel" data-estatico="{prefixo}painel.json"', 1)
+        relativo = prefixo + ('' if rota == '/' else rota.lstrip('/') + '/') + 'index.html'
+        arquivos.append(gravar(destino, relativo, html.encode('utf-8')))
+
+    resposta = cliente.get('/api/painel', query_string=consulta, environ_overrides=ambiente)
+    if resposta.status_code == 200:
+        arquivos.append(gravar(destino, prefixo + 'painel.json', resposta.get_data()))
+    return arquivos
+
+
+def exportar_site(app, destino=DESTINO_EXPORTACAO, processos=None, ufs=UFS_BRASIL):
+    """Exporta a visão global e a de cada UF em paralelo; devolve o número de arquivos gravados."""
+    inicio = time.time()
+    os.makedirs(destino, exist_ok=True)
+
+    # Assets e respostas pedidas pelas páginas ao abrir: gerados uma vez, no processo principal.
+    gravados = 0
+    destino_static = os.path.join(destino, 'static')
+    shutil.copytree(app.static_folder, destino_static, dirs_exist_ok=True)
+    for pasta, _, nomes in os.walk(destino_static):
+        for nome in nomes:
+            if not nome.endswith('.gz') and os.path.splitext(nome)[1] in EXTENSOES_COMPRIMIDAS:
+                comprimir(os.path.join(pasta, nome))
+            gravados += 1
+    cliente = app.test_client()
+    for rota in ('/api/filtros', '/api/status'):
+        gravar(destino, rota, cliente.get(rota, environ_overrides={MARCA_AQUECIMENTO: True}).get_data())
+        gravados += 1
+
+    escopos = [None] + list(ufs)
+    with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo,
+                             initargs=(app.import_name,)) as executor:
+        trabalhos = {executor.submit(exportar_escopo, destino, uf): uf for uf in escopos}
+        for trabalho in as_completed(trabalhos):
+            uf = trabalhos[trabalho]
+            try:
+                gravados += len(trabalho.result())
+            except Exception as e:
+                print(f"⚠️ Falha ao exportar {uf or 'a visão global'}: {e}")
+
+    print(f"✅ Exportação estática: {gravados} arquivos em {destino} ({time.time() - inicio:.1f}s)")
+    return gravados
@@ -0,0 +1,184 @@
+"""
+Engenharia de features compartilhada pelos módulos de processamento e análise.
+
+Monta matrizes esparsas (one-hot) com vocabulário de categorias salvo junto do
+codificador, de modo que o mesmo mapeamento coluna -> posição seja usado no
+treino e na pontuação de dados novos.
+"""
+
+import numpy as np
+import pandas as pd
+import joblib
+from scipy import sparse
+
+CATEGORIA_AUSENTE = 'NA_CATEGORY'
+
+MAPEAMENTO_GRAU_RISCO = {
+    'Grau I   - Leve': 1,
+    'Grau II  - Moderado': 2,
+    'Grau III - Grave': 3,
+    'Grau IV  - Óbito': 4
+}
+
+COLUNAS_CATEGORICAS_RISCO = [
+    'PRODUTO_MOTIVO',
+    'TIPO_REACAO_TRANSFUSIONAL',
+    'CATEGORIA_NOTIFICADOR',
+    'TIPO_HEMOCOMPONENTE',
+    'FAIXA_ETARIA_PACIENTE',
+    'UF_NOTIFICACAO',
+    'DS_TEMPORALIDADE_REACAO',
+    'TIPO_EVENTO_ADVERSO',
+    'ETAPA_CICLO_SANGUE'
+]
+
+COLUNAS_NUMERICAS_RISCO = [
+    'TEMPO_NOTIFICACAO_DIAS',
+    'ANO_OCORRENCIA',
+    'MES_OCORRENCIA',
+    'DIA_SEMANA_OCORRENCIA',
+    'HORA_OCORRENCIA',
+    'IDADE_PACIENTE'
+]
+
+
+def adicionar_features_temporais(df):
+    """Deriva as features de data usadas pelos modelos a partir das colunas já convertidas.
+
+    Sem DATA_NOTIFICACAO_EVENTO (descartada no pré-processamento), mantém o
+    TEMPO_NOTIFICACAO_DIAS já calculado antes do descarte.
+    """
+    if {'DATA_NOTIFICACAO_EVENTO', 'DATA_OCORRENCIA_EVENTO'} <= set(df.columns):
+        df['TEMPO_NOTIFICACAO_DIAS'] = (df['DATA_NOTIFICACAO_EVENTO'] - df['DATA_OCORRENCIA_EVENTO']).dt.days
+    if 'DATA_OCORRENCIA_EVENTO' in df.columns:
+        ocorrencia = df['DATA_OCORRENCIA_EVENTO']
+        df['ANO_OCORRENCIA'] = ocorrencia.dt.year
+        df['MES_OCORRENCIA'] = ocorrencia.dt.month
+        df['DIA_SEMANA_OCORRENCIA'] = ocorrencia.dt.dayofweek
+        df['HORA_OCORRENCIA'] = ocorrencia.dt.hour
+    return df
+
+
+def imputar_numericos(df, colunas, estrategia='mediana', valores=None):
+    """Preenche nulos das colunas numéricas de uma vez, sem laço por coluna.
+
+    `estrategia` pode ser 'mediana' ou 'zero'; `valores` (ex.: medianas do
+    treino) tem precedência sobre a estratégia.
+    """
+    numericos = df.reindex(columns=list(colunas)).apply(pd.to_numeric, errors='coerce')
+    numericos = numericos.replace([np.inf, -np.inf], np.nan)
+    if valores is None:
+        valores = numericos.median() if estrategia == 'mediana' else pd.Series(0.0, index=numericos.columns)
+        valores = valores.fillna(0.0)
+    return numericos.fillna(valores), valores
+
+
+class CodificadorEsparso:
+    """Codificador one-hot esparso com vocabulário salvo e imputação vetorizada.
+
+    Categorias ausentes do vocabulário (não vistas no treino, abaixo de
+    `min_frequencia` ou fora das `max_categorias` mais frequentes) não ativam
+    nenhuma coluna.
+    """
+
+    def __init__(self, colunas_categoricas, colunas_numericas=(), min_frequencia=1, max_categorias=None):
+        self.colunas_categoricas = list(colunas_categoricas)
+        self.colunas_numericas = list(colunas_numericas)
+        self.min_frequencia = min_frequencia
+        self.max_categorias = max_categorias
+        self.vocabulario = {}
+        self.medianas = None
+
+    def _categorias(self, df, col):
+        if col not in df.columns:
+            return pd.Series(CATEGORIA_AUSENTE, index=df.index)
+        return df[col].astype(object).fillna(CATEGORIA_AUSENTE).astype(str)
+
+    def fit(self, df):
+        for col in self.colunas_categoricas:
+            contagens = self._categorias(df, col).value_counts()
+            contagens = contagens[contagens >= self.min_frequencia]
+            if self.max_categorias is not None:
+                contagens = contagens.head(self.max_categorias)
+            self.vocabulario[col] = sorted(contagens.index)
+        colunas = [c for c in self.colunas_numericas if c in df.columns]
+        self.colunas_numericas = colunas
+        _, self.medianas = imputar_numericos(df, colunas)
+        return self
+
+    def codigos(self, df):
+        """Códigos ordinais (posição no vocabulário, -1 se desconhecida) por coluna categórica."""
+        return pd.DataFrame({
+            col: pd.Categorical(self._categorias(df, col), categories=self.vocabulario[col]).codes
+            for col in self.colunas_categoricas
+        }, index=df.index)
+
+    def transform(self, df):
+        """Retorna a matriz CSR [numéricas imputadas | one-hot das categóricas]."""
+        n_linhas = len(df)
+        blocos = []
+
+        if self.colunas_numericas:
+            numericos, _ = imputar_numericos(df, self.colunas_numericas, valores=self.medianas)
+            blocos.append(sparse.csr_matrix(numericos.to_numpy(dtype=np.float32)))
+
+        linhas, colunas = [], []
+        deslocamento = 0
+        for col, codigos in self.codigos(df).items():
+            codigos = codigos.to_numpy()
+            conhecidas = codigos >= 0
+            linhas.append(np.flatnonzero(conhecidas))
+            colunas.append(codigos[conhecidas] + deslocamento)
+            deslocamento += len(self.vocabulario[col])
+
+        if deslocamento:
+            linhas = np.concatenate(linhas)
+            colunas = np.concatenate(colunas)
+            dados = np.ones(len(linhas), dtype=np.float32)
+            blocos.append(sparse.csr_matrix((dados, (linhas, colunas)), shape=(n_linhas, deslocamento)))
+
+        if not blocos:
+            return sparse.csr_matrix((n_linhas, 0), dtype=np.float32)
+        return sparse.hstack(blocos, format='csr')
+
+    def transform_ordinal(self, df):
+        """Matriz densa [numéricas imputadas | códigos ordinais], com NaN para categorias desconhecidas.
+
+        É o formato esperado por modelos com suporte nativo a categorias
+        (ver `mascara_categorica`).
+        """
+        partes = []
+        if self.colunas_numericas:
+            numericos, _ = imputar_numericos(df, self.colunas_numericas, valores=self.medianas)
+            partes.append(numericos.to_numpy(dtype=np.float32))
+        codigos = self.codigos(df).to_numpy(dtype=np.float32)
+        codigos[codigos < 0] = np.nan
+        partes.append(codigos)
+        return np.hstack(partes)
+
+    @property
+    def mascara_categorica(self):
+        """Indica quais colunas de `transform_ordinal` são categóricas."""
+        return np.array([False] * len(self.colunas_numericas) + [True] * len(self.colunas_categoricas))
+
+    @property
+    def nomes_ordinais(self):
+        return self.colunas_numericas + self.colunas_categoricas
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+    @property
+    def nomes_features(self):
+        """Nomes das colunas da matriz, no padrão de `pd.get_dummies` (COLUNA_valor)."""
+        nomes = list(self.colunas_numericas)
+        for col in self.colunas_categoricas:
+            nomes.extend(f"{col}_{valor}" for valor in self.vocabulario[col])
+        return nomes
+
+    def salvar(self, caminho):
+        joblib.dump(self, caminho)
+
+    @staticmethod
+    def carregar(caminho):
+        return joblib.load(caminho)
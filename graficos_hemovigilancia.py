@@ -0,0 +1,158 @@
+"""
+Renderização dos gráficos dos relatórios de hemovigilância.
+
+Os dados de cada gráfico são agregados antes (contagens, histogramas, fração
+de ausentes por faixa de linhas), com custo linear e vetorizado; a figura
+recebe só esse resumo, de tamanho fixo qualquer que seja o número de linhas.
+As especificações independentes são renderizadas em paralelo num pool de
+processos com `renderizar_figuras`.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import matplotlib
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from blocos_hemovigilancia import resolver_n_jobs
+
+FAIXAS_AUSENTES = 200
+BINS_HISTOGRAMA = 50
+
+
+def agregar_ausentes(df, n_faixas=FAIXAS_AUSENTES):
+    """Fração de valores ausentes por coluna em cada faixa de linhas consecutivas.
+
+    Retorna um DataFrame (faixas x colunas) indexado pela primeira linha de
+    cada faixa; substitui o `isnull()` linha a linha no mapa de calor.
+    """
+    ausentes = df.isna().to_numpy()
+    if not len(ausentes):
+        return pd.DataFrame(columns=df.columns, dtype=float)
+    inicios = np.unique(np.linspace(0, len(ausentes), min(n_faixas, len(ausentes)), endpoint=False).astype(np.int64))
+    tamanhos = np.diff(np.append(inicios, len(ausentes)))
+    fracoes = np.add.reduceat(ausentes, inicios, axis=0) / tamanhos[:, None]
+    return pd.DataFrame(fracoes, index=inicios, columns=df.columns)
+
+
+def figura_ausentes(df, arquivo, titulo='Mapa de Calor de Valores Ausentes'):
+    matriz = agregar_ausentes(df)
+    return {'tipo': 'ausentes', 'arquivo': arquivo, 'titulo': titulo,
+            'valores': matriz.to_numpy(), 'colunas': [str(c) for c in matriz.columns],
+            'linhas': matriz.index.to_numpy()}
+
+
+def figura_contagens(serie, arquivo, titulo, paleta='viridis', top=None, ordenar_indice=False,
+                     vertical=False, rotulo_valor='Contagem'):
+    """Gráfico de barras com a contagem de cada valor da série (opcionalmente só os `top`)."""
+    contagens = serie.value_counts()
+    contagens = contagens[contagens > 0]
+    if ordenar_indice:
+        contagens = contagens.sort_index()
+    if top:
+        contagens = contagens.head(top)
+    return figura_barras(contagens, arquivo, titulo, paleta, vertical, rotulo_valor)
+
+
+def figura_barras(valores, arquivo, titulo, paleta='viridis', vertical=False, rotulo_valor=None, rotulo_categoria=None):
+    """Barras a partir de uma série já agregada (índice = rótulos)."""
+    return {'tipo': 'barras', 'arquivo': arquivo, 'titulo': titulo, 'paleta': paleta, 'vertical': vertical,
+            'rotulos': [str(r) for r in valores.index], 'valores': valores.to_numpy(dtype=float),
+            'rotulo_valor': rotulo_valor, 'rotulo_categoria': rotulo_categoria}
+
+
+def figura_serie(valores, arquivo, titulo):
+    """Linha a partir de uma série já agregada, na ordem do índice."""
+    return {'tipo': 'linha', 'arquivo': arquivo, 'titulo': titulo,
+            'rotulos': [str(r) for r in valores.index], 'valores': valores.to_numpy(dtype=float)}
+
+
+def figura_histograma(serie, arquivo, titulo, limite_quantil=0.99, bins=BINS_HISTOGRAMA,
+                      rotulo_x=None, rotulo_y='Frequência'):
+    """Histograma entre 0 e o quantil `limite_quantil`, com as contagens calculadas aqui."""
+    valores = pd.to_numeric(serie, errors='coerce').dropna().to_numpy(dtype=float)
+    maximo = float(np.quantile(valores, limite_quantil)) if len(valores) else 1.0
+    contagens, bordas = np.histogram(valores, bins=bins, range=(0, maximo if maximo > 0 else 1.0))
+    return {'tipo': 'histograma', 'arquivo': arquivo, 'titulo': titulo, 'contagens': contagens,
+            'bordas': bordas, 'rotulo_x': rotulo_x, 'rotulo_y': rotulo_y}
+
+
+def _desenhar_ausentes(figura):
+    fig, ax = plt.subplots(figsize=(12, 6))
+    sns.heatmap(figura['valores'], vmin=0, vmax=1, cmap='viridis', xticklabels=figura['colunas'],
+                yticklabels=False, cbar_kws={'label': 'Fração de ausentes'}, ax=ax)
+    ax.set_ylabel(f"Linhas ({len(figura['linhas'])} faixas)")
+    return fig, ax
+
+
+def _desenhar_barras(figura):
+    tamanho = (12, 6) if figura['vertical'] else (10, max(4, 0.5 * len(figura['rotulos']) + 2))
+    fig, ax = plt.subplots(figsize=tamanho)
+    cores = sns.color_palette(figura['paleta'], len(figura['rotulos']))
+    if figura['vertical']:
+        # Posições numéricas: rótulos como '2019' não viram eixo categórico implícito.
+        posicoes = np.arange(len(figura['rotulos']))
+        ax.bar(posicoes, figura['valores'], color=cores)
+        ax.set_xticks(posicoes, figura['rotulos'], rotation=45)
+        ax.set_ylabel(figura['rotulo_valor'] or '')
+        ax.set_xlabel(figura['rotulo_categoria'] or '')
+    else:
+        posicoes = np.arange(len(figura['rotulos']))[::-1]
+        ax.barh(posicoes, figura['valores'], color=cores)
+        ax.set_yticks(posicoes, figura['rotulos'])
+        ax.set_xlabel(figura['rotulo_valor'] or '')
+        ax.set_ylabel(figura['rotulo_categoria'] or '')
+    return fig, ax
+
+
+def _desenhar_linha(figura):
+    fig, ax = plt.subplots(figsize=(10, 4))
+    posicoes = np.arange(len(figura['rotulos']))
+    ax.plot(posicoes, figura['valores'])
+    ax.set_xticks(posicoes, figura['rotulos'], rotation=45)
+    return fig, ax
+
+
+def _desenhar_histograma(figura):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    bordas = figura['bordas']
+    ax.stairs(figura['contagens'], bordas, fill=True, alpha=0.7)
+    ax.set_xlim(bordas[0], bordas[-1])
+    ax.set_xlabel(figura['rotulo_x'] or '')
+    ax.set_ylabel(figura['rotulo_y'] or '')
+    return fig, ax
+
+
+DESENHISTAS_FIGURA = {
+    'ausentes': _desenhar_ausentes,
+    'barras': _desenhar_barras,
+    'linha': _desenhar_linha,
+    'histograma': _desenhar_histograma,
+}
+
+
+def renderizar_figura(figura):
+    """Desenha e salva uma especificação; retorna o caminho do arquivo."""
+    sns.set_style('whitegrid')
+    fig, ax = DESENHISTAS_FIGURA[figura['tipo']](figura)
+    ax.set_title(figura['titulo'])
+    diretorio = os.path.dirname(figura['arquivo'])
+    if diretorio:
+        os.makedirs(diretorio, exist_ok=True)
+    fig.savefig(figura['arquivo'], bbox_inches='tight', dpi=figura.get('dpi', 100))
+    plt.close(fig)
+    return figura['arquivo']
+
+
+def renderizar_figuras(figuras, n_jobs=None):
+    """Renderiza as especificações em paralelo; retorna os caminhos na ordem de entrada."""
+    n_processos = min(resolver_n_jobs(n_jobs), len(figuras))
+    if n_processos <= 1:
+        return [renderizar_figura(figura) for figura in figuras]
+    with ProcessPoolExecutor(max_workers=n_processos) as executor:
+        return list(executor.map(renderizar_figura, figuras))
@@ -0,0 +1,183 @@
+"""
+Treino e uso do modelo que prevê o grau de risco (GRAU_RISCO_NUM) das notificações.
+
+Dois motores estão disponíveis:
+- 'hgb': HistGradientBoostingClassifier com categorias nativas (códigos
+  ordinais), multi-thread por padrão; é o motor recomendado.
+- 'rf': RandomForestClassifier sobre a matriz one-hot esparsa, como na
+  análise original, agora com `n_jobs`.
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime
+
+import pandas as pd
+import joblib
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.inspection import permutation_importance
+from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
+from sklearn.model_selection import train_test_split
+
+from blocos_hemovigilancia import inferir_formato_data
+from esquema_hemovigilancia import ler_csv
+from features_hemovigilancia import (
+    CodificadorEsparso,
+    adicionar_features_temporais,
+    MAPEAMENTO_GRAU_RISCO,
+    COLUNAS_CATEGORICAS_RISCO,
+    COLUNAS_NUMERICAS_RISCO,
+)
+
+CAMINHO_MODELO_RISCO = 'data/modelo_risco.joblib'
+MOTORES_RISCO = ('hgb', 'rf')
+# O HistGradientBoosting aceita no máximo 255 categorias por coluna.
+MAX_CATEGORIAS_RISCO = 250
+AMOSTRA_IMPORTANCIA = 5000
+
+
+def montar_conjunto_risco(df, motor='hgb', codificador=None):
+    """Deriva as features e monta a matriz do motor escolhido.
+
+    Retorna um dicionário com `X` (one-hot esparsa), `X_ordinal` (apenas para
+    'hgb'), o alvo `y` (None se não houver GRAU_RISCO), os nomes das features,
+    o codificador e os identificadores das linhas.
+    """
+    if motor not in MOTORES_RISCO:
+        raise ValueError(f"Motor inválido: {motor}. Use um de {MOTORES_RISCO}.")
+
+    df = adicionar_features_temporais(df)
+
+    y = None
+    if 'GRAU_RISCO' in df.columns:
+        grau = df['GRAU_RISCO'].map(MAPEAMENTO_GRAU_RISCO)
+        if codificador is None:
+            df = df[grau.notna()]
+            grau = grau[grau.notna()].astype(int)
+        y = grau.to_numpy()
+
+    if codificador is None:
+        codificador = CodificadorEsparso(COLUNAS_CATEGORICAS_RISCO, COLUNAS_NUMERICAS_RISCO,
+                                         max_categorias=MAX_CATEGORIAS_RISCO).fit(df)
+
+    return {
+        'motor': motor,
+        'X': codificador.transform(df),
+        'X_ordinal': codificador.transform_ordinal(df) if motor == 'hgb' else None,
+        'y': y,
+        'nomes_features': codificador.nomes_ordinais if motor == 'hgb' else codificador.nomes_features,
+        'codificador': codificador,
+        'ids': df['NU_NOTIFICACAO'].to_numpy() if 'NU_NOTIFICACAO' in df.columns else df.index.to_numpy(),
+    }
+
+
+def _matriz_do_motor(conjunto):
+    return conjunto['X_ordinal'] if conjunto['motor'] == 'hgb' else conjunto['X']
+
+
+def _criar_estimador(motor, codificador, n_jobs, random_state):
+    if motor == 'hgb':
+        # Usa todos os núcleos via OpenMP; limite com OMP_NUM_THREADS se preciso.
+        return HistGradientBoostingClassifier(categorical_features=codificador.mascara_categorica,
+                                              class_weight='balanced', random_state=random_state)
+    return RandomForestClassifier(n_estimators=100, random_state=random_state,
+                                  class_weight='balanced', n_jobs=n_jobs)
+
+
+def amostrar_estratificado(X, y, amostra, random_state=42):
+    """Subamostra estratificada por classe: `amostra` é fração (0-1) ou número de linhas."""
+    if amostra is None:
+        return X, y
+    if amostra <= 0:
+        raise ValueError(f"amostra deve ser positiva (fração 0-1 ou número de linhas), recebido {amostra}")
+    if amostra >= 1:
+        # Vindo da linha de comando é float; o scikit-learn só aceita contagem inteira.
+        amostra = int(amostra)
+        if amostra >= len(y):
+            return X, y
+    X_amostra, _, y_amostra, _ = train_test_split(X, y, train_size=amostra, random_state=random_state, stratify=y)
+    return X_amostra, y_amostra
+
+
+def treinar_modelo_risco(conjunto, amostra=None, n_jobs=-1, random_state=42):
+    """Treina e avalia o modelo do grau de risco sobre um conjunto de `montar_conjunto_risco`.
+
+    Retorna o artefato (modelo, codificador, motor e métricas de avaliação),
+    pronto para `salvar_modelo_risco` e `prever_grau_risco`.
+    """
+    X, y = amostrar_estratificado(_matriz_do_motor(conjunto), conjunto['y'], amostra, random_state)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=random_state, stratify=y)
+
+    modelo = _criar_estimador(conjunto['motor'], conjunto['codificador'], n_jobs, random_state)
+    inicio = time.perf_counter()
+    modelo.fit(X_train, y_train)
+    tempo_treino = time.perf_counter() - inicio
+
+    y_pred = modelo.predict(X_test)
+
+    if hasattr(modelo, 'feature_importances_'):
+        importancias = modelo.feature_importances_
+    else:
+        n_amostra = min(AMOSTRA_IMPORTANCIA, X_test.shape[0])
+        resultado = permutation_importance(modelo, X_test[:n_amostra], y_test[:n_amostra],
+                                           n_repeats=3, random_state=random_state, n_jobs=n_jobs)
+        importancias = resultado.importances_mean
+
+    return {
+        'motor': conjunto['motor'],
+        'modelo': modelo,
+        'codificador': conjunto['codificador'],
+        'treinado_em': datetime.now(),
+        'linhas_treino': int(X_train.shape[0]),
+        'tempo_treino_s': tempo_treino,
+        'acuracia': accuracy_score(y_test, y_pred),
+        'relatorio': classification_report(y_test, y_pred, zero_division=0),
+        'matriz_confusao': confusion_matrix(y_test, y_pred),
+        'importancias': pd.Series(importancias, index=conjunto['nomes_features']),
+    }
+
+
+def salvar_modelo_risco(artefato, caminho=CAMINHO_MODELO_RISCO):
+    caminho_temporario = caminho + '.tmp'
+    joblib.dump(artefato, caminho_temporario)
+    os.replace(caminho_temporario, caminho)
+
+
+def carregar_modelo_risco(caminho=CAMINHO_MODELO_RISCO):
+    """Carrega o artefato salvo; retorna None se não existir ou estiver corrompido."""
+    if not os.path.exists(caminho):
+        return None
+    try:
+        return joblib.load(caminho)
+    except Exception as e:
+        print(f"⚠️ Não foi possível carregar o modelo de risco salvo: {e}")
+        return None
+
+
+def prever_grau_risco(df, artefato):
+    """Prevê o grau de risco (1 a 4) de cada linha com o artefato salvo."""
+    conjunto = montar_conjunto_risco(df.copy(), artefato['motor'], artefato['codificador'])
+    return artefato['modelo'].predict(_matriz_do_motor(conjunto)).astype(int)
+
+
+if __name__ == "__main__":
+    from data_processor import CAMINHO_DADOS, pre_processar_dados
+
+    parser = argparse.ArgumentParser(description="Treina o modelo de previsão do grau de risco.")
+    parser.add_argument('--motor', choices=MOTORES_RISCO, default='hgb')
+    parser.add_argument('--amostra', type=float, default=None,
+                        help="Fração (0-1) ou número de linhas para subamostra estratificada.")
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    args = parser.parse_args()
+    if args.amostra is not None and args.amostra <= 0:
+        parser.error("--amostra deve ser positiva")
+
+    df = pre_processar_dados(ler_csv(CAMINHO_DADOS, datas=False), inferir_formato_data(CAMINHO_DADOS))
+    artefato = treinar_modelo_risco(montar_conjunto_risco(df, args.motor), args.amostra, args.n_jobs)
+    salvar_modelo_risco(artefato)
+
+    print(artefato['relatorio'])
+    print(f"Motor: {artefato['motor']} | linhas de treino: {artefato['linhas_treino']} | "
+          f"treino: {artefato['tempo_treino_s']:.1f} s | acurácia: {artefato['acuracia']:.4f}")
+    print(f"✅ Modelo de risco salvo em {CAMINHO_MODELO_RISCO}")
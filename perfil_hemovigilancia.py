@@ -0,0 +1,133 @@
+"""
+Relatório de perfil (ydata-profiling) em modo amostrado e com cache.
+
+O ProfileReport roda sobre uma amostra estratificada por UF e ano, de tamanho
+limitado qualquer que seja o número de linhas; as contagens exatas das
+colunas-chave são calculadas à parte, numa passada vetorizada sobre os dados
+completos, e gravadas em JSON junto do HTML. Ambos ficam em cache pelo hash
+do conjunto de dados: rodar de novo sobre os mesmos dados só copia o cache.
+"""
+
+import hashlib
+import importlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+try:
+    ydata_profiling = importlib.import_module("ydata_profiling")
+    ProfileReport = getattr(ydata_profiling, "ProfileReport", None)
+    HAS_PROFILE = ProfileReport is not None
+except Exception:
+    ProfileReport = None
+    HAS_PROFILE = False
+
+AMOSTRA_PERFIL = 50000
+ESTRATOS_PERFIL = ['UF_NOTIFICACAO', 'ANO']
+COLUNAS_CONTAGEM_EXATA = [
+    'UF_NOTIFICACAO', 'ANO', 'GRAU_RISCO', 'STATUS_ANALISE', 'TIPO_REACAO_TRANSFUSIONAL',
+    'TIPO_EVENTO_ADVERSO', 'FAIXA_ETARIA_PACIENTE', 'anomaly_label'
+]
+VERSAO_PERFIL = 1
+
+
+def _com_ano(df):
+    """Acrescenta ANO (da data de ocorrência) se ainda não existir, sem copiar as demais colunas."""
+    if 'ANO' in df.columns or 'DATA_OCORRENCIA_EVENTO' not in df.columns:
+        return df
+    datas = df['DATA_OCORRENCIA_EVENTO']
+    if not pd.api.types.is_datetime64_any_dtype(datas):
+        datas = pd.to_datetime(datas, errors='coerce', dayfirst=True)
+    return df.assign(ANO=datas.dt.year.astype('Int32'))
+
+
+def hash_dataset(df):
+    """Hash do conteúdo (valores, nomes e tipos das colunas) para a chave do cache."""
+    resumo = hashlib.blake2b(digest_size=16)
+    resumo.update(f"v{VERSAO_PERFIL}|{len(df)}|".encode('utf-8'))
+    for col in df.columns:
+        resumo.update(f"{col}:{df[col].dtype}|".encode('utf-8'))
+        resumo.update(pd.util.hash_pandas_object(df[col], index=False).to_numpy().tobytes())
+    return resumo.hexdigest()
+
+
+def amostra_estratificada(df, tamanho=AMOSTRA_PERFIL, estratos=None, random_state=42):
+    """Amostra proporcional aos estratos, com ao menos uma linha de cada estrato.
+
+    O tamanho final fica limitado a `tamanho` mais o número de estratos.
+    """
+    if len(df) <= tamanho:
+        return df
+    estratos = [c for c in (ESTRATOS_PERFIL if estratos is None else estratos) if c in df.columns]
+    if not estratos:
+        return df.sample(n=tamanho, random_state=random_state)
+
+    codigos = np.zeros(len(df), dtype=np.int64)
+    for col in estratos:
+        codigo, unicos = pd.factorize(df[col], use_na_sentinel=False)
+        codigos = codigos * len(unicos) + codigo
+    grupos, unicos = pd.factorize(codigos)
+    tamanhos = np.bincount(grupos)
+    cotas = np.maximum(1, np.floor(tamanhos * tamanho / len(df))).astype(np.int64)
+
+    # Ordem aleatória dentro de cada estrato; ficam as primeiras `cota` linhas.
+    rng = np.random.default_rng(random_state)
+    ordem = np.lexsort((rng.random(len(df)), grupos))
+    inicio_grupo = np.concatenate(([0], np.cumsum(tamanhos)[:-1]))
+    posicao = np.arange(len(df)) - inicio_grupo[grupos[ordem]]
+    escolhidas = np.sort(ordem[posicao < cotas[grupos[ordem]]])
+    return df.iloc[escolhidas]
+
+
+def contagens_exatas(df, colunas=None):
+    """Contagens exatas por valor, nulos e distintos das colunas-chave, sobre todas as linhas."""
+    colunas = [c for c in (COLUNAS_CONTAGEM_EXATA if colunas is None else colunas) if c in df.columns]
+    resultado = {'linhas': int(len(df)), 'colunas': {}}
+    for col in colunas:
+        contagens = df[col].value_counts(dropna=True)
+        contagens = contagens[contagens > 0]
+        resultado['colunas'][col] = {
+            'nulos': int(df[col].isna().sum()),
+            'distintos': int(len(contagens)),
+            'contagens': {str(valor): int(n) for valor, n in contagens.items()},
+        }
+    return resultado
+
+
+def gerar_perfil(df, caminho_html, caminho_cache, amostra=AMOSTRA_PERFIL, titulo="Relatório de Perfil - Hemovigilância"):
+    """Gera (ou reaproveita do cache) o perfil amostrado e as contagens exatas.
+
+    Retorna um dicionário com o hash, se veio do cache, os caminhos gravados
+    e o número de linhas da amostra. Sem ydata-profiling, só o JSON é gerado.
+    """
+    df = _com_ano(df)
+    chave = hash_dataset(df)
+    os.makedirs(caminho_cache, exist_ok=True)
+    html_cache = os.path.join(caminho_cache, f"{chave}.html")
+    json_cache = os.path.join(caminho_cache, f"{chave}.json")
+    caminho_json = os.path.splitext(caminho_html)[0] + "_contagens.json"
+
+    do_cache = os.path.exists(json_cache) and (os.path.exists(html_cache) or not HAS_PROFILE)
+    linhas_amostra = None
+    if not do_cache:
+        contagens = contagens_exatas(df)
+        if HAS_PROFILE:
+            base = amostra_estratificada(df, amostra)
+            linhas_amostra = len(base)
+            contagens['amostra_perfil'] = {'linhas': linhas_amostra, 'estratos': ESTRATOS_PERFIL}
+            perfil = ProfileReport(base, title=f"{titulo} (amostra de {linhas_amostra} linhas)", minimal=True)
+            perfil.to_file(html_cache + ".tmp.html")
+            os.replace(html_cache + ".tmp.html", html_cache)
+        with open(json_cache + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(contagens, f, ensure_ascii=False, indent=2)
+        os.replace(json_cache + ".tmp", json_cache)
+
+    gravados = [caminho_json]
+    shutil.copyfile(json_cache, caminho_json)
+    if os.path.exists(html_cache):
+        shutil.copyfile(html_cache, caminho_html)
+        gravados.append(caminho_html)
+    return {'hash': chave, 'do_cache': do_cache, 'arquivos': gravados, 'linhas_amostra': linhas_amostra}
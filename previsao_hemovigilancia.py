@@ -0,0 +1,224 @@
+"""
+Previsão mensal de notificações para todas as séries UF x tipo de reação.
+
+As contagens mensais de todas as séries são montadas numa única matriz
+(séries x meses) e ajustadas de uma vez por mínimos quadrados: como todas
+compartilham a mesma matriz de regressores (tendência linear e, com dois
+anos ou mais de histórico, efeito de cada mês do ano), um único `lstsq`
+resolve milhares de séries. Também é calculada uma linha de base sazonal
+(média do mesmo mês nos últimos anos).
+
+As previsões de todo o horizonte são calculadas no ajuste e guardadas por
+versão dos dados; a consulta de uma série é só uma busca. O modelo é linear,
+então a previsão de um conjunto de séries é a soma das previsões de cada uma.
+"""
+
+import os
+import threading
+
+import joblib
+import numpy as np
+import pandas as pd
+
+CAMINHO_MODELO_PREVISAO = 'data/modelo_previsao.joblib'
+HORIZONTE_PREVISAO = 24
+MESES_MINIMOS_SAZONALIDADE = 24
+ANOS_BASELINE = 3
+Z_INTERVALO = 1.96
+# Marca "todas" as UFs ou todos os tipos nas séries agregadas.
+TODOS = '*'
+
+_previsoes_por_versao = {}
+_trava_previsoes = threading.Lock()
+
+
+def _regressores(indices_mes, inicio, n_meses, sazonal):
+    """Matriz de regressores: intercepto, tendência e (opcional) 11 dummies de mês do ano."""
+    t = (indices_mes - inicio) / max(n_meses - 1, 1)
+    colunas = [np.ones(len(indices_mes)), t]
+    if sazonal:
+        mes_do_ano = indices_mes % 12
+        colunas += [(mes_do_ano == m).astype(float) for m in range(1, 12)]
+    return np.column_stack(colunas)
+
+
+def montar_series(df):
+    """Contagens mensais de cada série UF x tipo, mais os totais por UF, por tipo e geral.
+
+    Retorna (chaves, Y, primeiro_mes), com `chaves` um DataFrame (UF, TIPO),
+    Y uma matriz (séries x meses) e o mês inicial como índice ano*12 + mês-1.
+    """
+    datas = df['DATA_OCORRENCIA_EVENTO']
+    if not pd.api.types.is_datetime64_any_dtype(datas):
+        datas = pd.to_datetime(datas, errors='coerce', dayfirst=True)
+    uf_cod, ufs = pd.factorize(df['UF_NOTIFICACAO'])
+    tipo_cod, tipos = pd.factorize(df['TIPO_REACAO_TRANSFUSIONAL'])
+    mes = (datas.dt.year * 12 + datas.dt.month - 1).to_numpy(dtype=float)
+    validas = (uf_cod >= 0) & (tipo_cod >= 0) & ~np.isnan(mes)
+    if not validas.any():
+        return pd.DataFrame(columns=['UF', 'TIPO']), np.zeros((0, 0)), None
+
+    uf_cod, tipo_cod, mes = uf_cod[validas], tipo_cod[validas], mes[validas].astype(np.int64)
+    primeiro_mes = int(mes.min())
+    n_meses = int(mes.max()) - primeiro_mes + 1
+    serie_cod, combinacoes = pd.factorize(uf_cod * len(tipos) + tipo_cod)
+    Y = np.bincount(serie_cod * n_meses + (mes - primeiro_mes),
+                    minlength=len(combinacoes) * n_meses).reshape(len(combinacoes), n_meses).astype(float)
+    uf_serie, tipo_serie = combinacoes // len(tipos), combinacoes % len(tipos)
+
+    # Totais: as séries agregadas são somas de linhas da matriz.
+    por_uf = np.zeros((len(ufs), n_meses))
+    np.add.at(por_uf, uf_serie, Y)
+    por_tipo = np.zeros((len(tipos), n_meses))
+    np.add.at(por_tipo, tipo_serie, Y)
+
+    chaves = pd.DataFrame({
+        'UF': [str(ufs[i]) for i in uf_serie] + [str(u) for u in ufs] + [TODOS] * len(tipos) + [TODOS],
+        'TIPO': [str(tipos[i]) for i in tipo_serie] + [TODOS] * len(ufs) + [str(t) for t in tipos] + [TODOS],
+    })
+    return chaves, np.vstack([Y, por_uf, por_tipo, Y.sum(axis=0, keepdims=True)]), primeiro_mes
+
+
+def ajustar_previsoes(df, horizonte=HORIZONTE_PREVISAO, versao=None):
+    """Ajusta tendência + sazonalidade e a linha de base sazonal de todas as séries de uma vez."""
+    chaves, Y, primeiro_mes = montar_series(df)
+    n_series, n_meses = Y.shape
+    if not n_series:
+        return {'versao': versao, 'chaves': chaves, 'indice': {}, 'n_series': 0}
+
+    sazonal = n_meses >= MESES_MINIMOS_SAZONALIDADE
+    meses_hist = np.arange(primeiro_mes, primeiro_mes + n_meses)
+    meses_fut = np.arange(primeiro_mes + n_meses, primeiro_mes + n_meses + horizonte)
+    X = _regressores(meses_hist, primeiro_mes, n_meses, sazonal)
+    X_fut = _regressores(meses_fut, primeiro_mes, n_meses, sazonal)
+
+    coeficientes, _, _, _ = np.linalg.lstsq(X, Y.T, rcond=None)
+    residuos = Y.T - X @ coeficientes
+    graus_liberdade = max(n_meses - X.shape[1], 1)
+    sigma = np.sqrt((residuos ** 2).sum(axis=0) / graus_liberdade)
+    # Sem truncar em zero aqui: a soma de séries precisa da previsão linear de cada uma.
+    previsao = (X_fut @ coeficientes).T
+
+    # Linha de base: média do mesmo mês do ano nos últimos ANOS_BASELINE anos de histórico.
+    recentes = Y[:, -min(n_meses, 12 * ANOS_BASELINE):]
+    meses_recentes = meses_hist[-recentes.shape[1]:] % 12
+    media_geral = recentes.mean(axis=1)
+    perfil = np.column_stack([
+        recentes[:, meses_recentes == m].mean(axis=1) if (meses_recentes == m).any() else media_geral
+        for m in range(12)
+    ])
+    baseline = perfil[:, meses_fut % 12]
+
+    return {
+        'versao': versao,
+        'chaves': chaves,
+        'indice': {(uf, tipo): i for i, (uf, tipo) in enumerate(zip(chaves['UF'], chaves['TIPO']))},
+        'n_series': n_series,
+        'sazonal': sazonal,
+        'meses_historico': meses_hist,
+        'meses_previsao': meses_fut,
+        'historico': Y,
+        'coeficientes': coeficientes.T,
+        'sigma': sigma,
+        'previsao': previsao,
+        'baseline': baseline,
+    }
+
+
+def _rotulo_mes(indice):
+    return f"{indice // 12:04d}-{indice % 12 + 1:02d}"
+
+
+def linhas_da_selecao(modelo, ufs=None, tipos=None):
+    """Linhas da matriz cuja soma forma a seleção (listas vazias = todos)."""
+    ufs, tipos = [str(u) for u in ufs or []], [str(t) for t in tipos or []]
+    indice = modelo['indice']
+    if not ufs and not tipos:
+        chaves = [(TODOS, TODOS)]
+    elif not tipos:
+        chaves = [(uf, TODOS) for uf in ufs]
+    elif not ufs:
+        chaves = [(TODOS, tipo) for tipo in tipos]
+    else:
+        chaves = [(uf, tipo) for uf in ufs for tipo in tipos]
+    return [indice[c] for c in chaves if c in indice]
+
+
+def prever_selecao(modelo, ufs=None, tipos=None, horizonte=None):
+    """Histórico e previsão mensal da soma das séries selecionadas; None se nenhuma existir.
+
+    O intervalo usa a soma das variâncias das séries (resíduos tratados como
+    independentes), um limite aproximado para seleções com várias séries.
+    """
+    linhas = linhas_da_selecao(modelo, ufs, tipos)
+    if not linhas:
+        return None
+    horizonte = min(horizonte or len(modelo['meses_previsao']), len(modelo['meses_previsao']))
+    previsao = np.clip(modelo['previsao'][linhas, :horizonte].sum(axis=0), 0, None)
+    margem = Z_INTERVALO * np.sqrt((modelo['sigma'][linhas] ** 2).sum())
+    return {
+        'versao': modelo['versao'],
+        'series': len(linhas),
+        'sazonal': modelo['sazonal'],
+        'historico': {
+            'meses': [_rotulo_mes(m) for m in modelo['meses_historico']],
+            'valores': modelo['historico'][linhas].sum(axis=0).round(2).tolist(),
+        },
+        'previsao': {
+            'meses': [_rotulo_mes(m) for m in modelo['meses_previsao'][:horizonte]],
+            'valores': previsao.round(2).tolist(),
+            'inferior': np.clip(previsao - margem, 0, None).round(2).tolist(),
+            'superior': (previsao + margem).round(2).tolist(),
+            'baseline': modelo['baseline'][linhas, :horizonte].sum(axis=0).round(2).tolist(),
+        },
+    }
+
+
+def previsao_anual(modelo, ano, ufs=None, tipos=None):
+    """Total previsto para um ano do horizonte (soma dos meses); None se fora do horizonte."""
+    linhas = linhas_da_selecao(modelo, ufs, tipos)
+    meses = modelo.get('meses_previsao')
+    if not linhas or meses is None or not (meses // 12 == ano).any():
+        return None
+    no_ano = meses // 12 == ano
+    # Meses do ano já observados entram pelo histórico.
+    observado = modelo['historico'][linhas][:, modelo['meses_historico'] // 12 == ano].sum()
+    previsto = np.clip(modelo['previsao'][linhas][:, no_ano].sum(axis=0), 0, None).sum()
+    return float(previsto + observado)
+
+
+def salvar_previsoes(modelo, caminho=CAMINHO_MODELO_PREVISAO):
+    caminho_temporario = caminho + '.tmp'
+    joblib.dump(modelo, caminho_temporario)
+    os.replace(caminho_temporario, caminho)
+
+
+def carregar_previsoes(versao, caminho=CAMINHO_MODELO_PREVISAO):
+    """Modelo salvo, se for da mesma versão dos dados; senão None."""
+    if not os.path.exists(caminho):
+        return None
+    try:
+        modelo = joblib.load(caminho)
+    except Exception as e:
+        print(f"⚠️ Não foi possível carregar as previsões salvas: {e}")
+        return None
+    return modelo if modelo.get('versao') == versao else None
+
+
+def obter_previsoes(snapshot, caminho=CAMINHO_MODELO_PREVISAO):
+    """Previsões do snapshot: da memória, do disco (mesma versão) ou ajustadas agora."""
+    versao = snapshot['versao']
+    with _trava_previsoes:
+        modelo = _previsoes_por_versao.get(versao)
+        if modelo is None:
+            modelo = carregar_previsoes(versao, caminho)
+            if modelo is None:
+                modelo = ajustar_previsoes(snapshot['df'], versao=versao)
+                try:
+                    salvar_previsoes(modelo, caminho)
+                except OSError as e:
+                    print(f"⚠️ Não foi possível salvar as previsões: {e}")
+            # Só a versão atual fica em memória.
+            _previsoes_por_versao.clear()
+            _previsoes_por_versao[versao] = modelo
+    return modelo
@@ -0,0 +1,266 @@
+"""
+Motor de regras de qualidade de dados da hemovigilância.
+
+As regras são declaradas como dicionários em REGRAS_QUALIDADE e avaliadas de
+forma vetorizada, todas numa única passada por bloco (as datas de cada bloco
+são convertidas uma só vez e compartilhadas entre as regras). Os resultados
+parciais dos blocos são somados num relatório estruturado com o número de
+violações e exemplos de NU_NOTIFICACAO por regra.
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from blocos_hemovigilancia import TAMANHO_BLOCO_PADRAO, inferir_formato_data, resolver_n_jobs
+from esquema_hemovigilancia import ESQUEMA_COLUNAS, FAIXAS_ETARIAS_DICIONARIO, ler_csv_em_blocos
+from features_hemovigilancia import MAPEAMENTO_GRAU_RISCO
+
+CAMINHO_RELATORIO_QUALIDADE = 'reports/qualidade_dados.json'
+COLUNA_ID_QUALIDADE = 'NU_NOTIFICACAO'
+MAX_EXEMPLOS_QUALIDADE = 10
+
+UFS_BRASIL = [
+    'AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA',
+    'PB', 'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO'
+]
+
+# Tipos: 'dominio', 'intervalo', 'data_valida', 'ordem_datas', 'atraso_maximo' e 'nulos'.
+# `taxa_maxima` (padrão 0) é a fração de violações tolerada antes de a regra falhar.
+REGRAS_QUALIDADE = [
+    {'nome': 'grau_risco_fora_do_dominio', 'tipo': 'dominio', 'coluna': 'GRAU_RISCO',
+     'valores': list(MAPEAMENTO_GRAU_RISCO)},
+    {'nome': 'uf_fora_do_dominio', 'tipo': 'dominio', 'coluna': 'UF_NOTIFICACAO', 'valores': UFS_BRASIL},
+    {'nome': 'faixa_etaria_fora_do_dominio', 'tipo': 'dominio', 'coluna': 'FAIXA_ETARIA_PACIENTE',
+     'valores': FAIXAS_ETARIAS_DICIONARIO},
+    {'nome': 'temporalidade_fora_do_dominio', 'tipo': 'dominio', 'coluna': 'DS_TEMPORALIDADE_REACAO',
+     'valores': ['Imediata', 'Tardia']},
+    {'nome': 'idade_fora_do_intervalo', 'tipo': 'intervalo', 'coluna': 'IDADE_PACIENTE',
+     'minimo': 0, 'maximo': 120},
+    {'nome': 'data_ocorrencia_invalida', 'tipo': 'data_valida', 'coluna': 'DATA_OCORRENCIA_EVENTO'},
+    {'nome': 'data_notificacao_invalida', 'tipo': 'data_valida', 'coluna': 'DATA_NOTIFICACAO_EVENTO'},
+    {'nome': 'notificacao_antes_da_ocorrencia', 'tipo': 'ordem_datas',
+     'inicio': 'DATA_OCORRENCIA_EVENTO', 'fim': 'DATA_NOTIFICACAO_EVENTO'},
+    {'nome': 'atraso_notificacao_acima_365_dias', 'tipo': 'atraso_maximo',
+     'inicio': 'DATA_OCORRENCIA_EVENTO', 'fim': 'DATA_NOTIFICACAO_EVENTO', 'dias': 365},
+    {'nome': 'nulos_grau_risco', 'tipo': 'nulos', 'coluna': 'GRAU_RISCO', 'taxa_maxima': 0.05},
+    {'nome': 'nulos_uf_notificacao', 'tipo': 'nulos', 'coluna': 'UF_NOTIFICACAO', 'taxa_maxima': 0.01},
+    {'nome': 'nulos_tipo_reacao', 'tipo': 'nulos', 'coluna': 'TIPO_REACAO_TRANSFUSIONAL', 'taxa_maxima': 0.05},
+    {'nome': 'nulos_idade_paciente', 'tipo': 'nulos', 'coluna': 'IDADE_PACIENTE', 'taxa_maxima': 0.2},
+] + [
+    # Campos que o esquema não permite vazios.
+    {'nome': f'nulos_{coluna.lower()}', 'tipo': 'nulos', 'coluna': coluna}
+    for coluna, definicao in ESQUEMA_COLUNAS.items() if not definicao['nulo']
+]
+
+
+def _colunas_da_regra(regra):
+    return [regra[chave] for chave in ('coluna', 'inicio', 'fim') if chave in regra]
+
+
+class _BlocoQualidade:
+    """Acesso às colunas de um bloco com nomes normalizados e datas convertidas uma única vez."""
+
+    def __init__(self, df, formato_data=None):
+        self.df = df
+        self.formato_data = formato_data
+        self.nomes = {str(c).upper().strip(): c for c in df.columns}
+        self._datas = {}
+
+    def tem(self, coluna):
+        return coluna in self.nomes
+
+    def coluna(self, coluna):
+        return self.df[self.nomes[coluna]]
+
+    def data(self, coluna):
+        if coluna not in self._datas:
+            valores = self.coluna(coluna)
+            if not pd.api.types.is_datetime64_any_dtype(valores):
+                if self.formato_data:
+                    valores = pd.to_datetime(valores, errors='coerce', format=self.formato_data)
+                else:
+                    valores = pd.to_datetime(valores, errors='coerce', dayfirst=True)
+            self._datas[coluna] = valores
+        return self._datas[coluna]
+
+
+def _violacoes_dominio(bloco, regra):
+    valores = bloco.coluna(regra['coluna'])
+    return (valores.notna() & ~valores.isin(regra['valores'])).to_numpy()
+
+
+def _violacoes_intervalo(bloco, regra):
+    valores = pd.to_numeric(bloco.coluna(regra['coluna']), errors='coerce')
+    return ((valores < regra['minimo']) | (valores > regra['maximo'])).to_numpy()
+
+
+def _violacoes_data_valida(bloco, regra):
+    return (bloco.coluna(regra['coluna']).notna() & bloco.data(regra['coluna']).isna()).to_numpy()
+
+
+def _violacoes_ordem_datas(bloco, regra):
+    return (bloco.data(regra['fim']) < bloco.data(regra['inicio'])).to_numpy()
+
+
+def _violacoes_atraso_maximo(bloco, regra):
+    atraso = (bloco.data(regra['fim']) - bloco.data(regra['inicio'])).dt.days
+    return (atraso > regra['dias']).to_numpy()
+
+
+def _violacoes_nulos(bloco, regra):
+    return bloco.coluna(regra['coluna']).isna().to_numpy()
+
+
+AVALIADORES_QUALIDADE = {
+    'dominio': _violacoes_dominio,
+    'intervalo': _violacoes_intervalo,
+    'data_valida': _violacoes_data_valida,
+    'ordem_datas': _violacoes_ordem_datas,
+    'atraso_maximo': _violacoes_atraso_maximo,
+    'nulos': _violacoes_nulos,
+}
+
+
+def avaliar_bloco(df, regras=None, formato_data=None):
+    """Avalia todas as regras sobre um bloco de dados brutos numa única passada.
+
+    Retorna o resultado parcial {'linhas', 'regras': {nome: {'violacoes',
+    'exemplos', 'ausente'}}}, que pode ser somado com `combinar_parciais`.
+    """
+    regras = REGRAS_QUALIDADE if regras is None else regras
+    bloco = _BlocoQualidade(df, formato_data)
+    ids = bloco.coluna(COLUNA_ID_QUALIDADE) if bloco.tem(COLUNA_ID_QUALIDADE) else pd.Series(df.index, index=df.index)
+
+    parcial = {'linhas': len(df), 'regras': {}}
+    for regra in regras:
+        if not all(bloco.tem(c) for c in _colunas_da_regra(regra)):
+            parcial['regras'][regra['nome']] = {'violacoes': 0, 'exemplos': [], 'ausente': True}
+            continue
+        violacoes = AVALIADORES_QUALIDADE[regra['tipo']](bloco, regra)
+        posicoes = np.flatnonzero(violacoes)
+        parcial['regras'][regra['nome']] = {
+            'violacoes': int(len(posicoes)),
+            'exemplos': ids.iloc[posicoes[:MAX_EXEMPLOS_QUALIDADE]].astype(str).tolist(),
+            'ausente': False,
+        }
+    return parcial
+
+
+def combinar_parciais(parciais):
+    """Soma os resultados parciais dos blocos, preservando a ordem dos exemplos."""
+    total = {'linhas': 0, 'regras': {}}
+    for parcial in parciais:
+        total['linhas'] += parcial['linhas']
+        for nome, resultado in parcial['regras'].items():
+            acumulado = total['regras'].setdefault(nome, {'violacoes': 0, 'exemplos': [], 'ausente': True})
+            acumulado['violacoes'] += resultado['violacoes']
+            acumulado['exemplos'] = (acumulado['exemplos'] + resultado['exemplos'])[:MAX_EXEMPLOS_QUALIDADE]
+            acumulado['ausente'] = acumulado['ausente'] and resultado['ausente']
+    return total
+
+
+def montar_relatorio(total, regras=None):
+    """Converte o resultado combinado no relatório final, com status por regra."""
+    regras = REGRAS_QUALIDADE if regras is None else regras
+    linhas = total['linhas']
+    itens = []
+    for regra in regras:
+        resultado = total['regras'].get(regra['nome'], {'violacoes': 0, 'exemplos': [], 'ausente': True})
+        taxa = resultado['violacoes'] / linhas if linhas else 0.0
+        if resultado['ausente']:
+            status = 'ignorada'
+        else:
+            status = 'falha' if taxa > regra.get('taxa_maxima', 0) else 'ok'
+        itens.append({
+            'nome': regra['nome'],
+            'tipo': regra['tipo'],
+            'colunas': _colunas_da_regra(regra),
+            'violacoes': resultado['violacoes'],
+            'taxa': round(taxa, 6),
+            'taxa_maxima': regra.get('taxa_maxima', 0),
+            'status': status,
+            'exemplos': resultado['exemplos'],
+        })
+    return {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'linhas': linhas,
+        'falhas': sum(item['status'] == 'falha' for item in itens),
+        'regras': itens,
+    }
+
+
+def _avaliar_bloco_args(args):
+    return avaliar_bloco(*args)
+
+
+def submeter_bloco(executor, pendentes, parciais, bloco, regras=None, formato_data=None, limite=None):
+    """Envia a avaliação do bloco ao pool; com `limite` avaliações pendentes, espera as primeiras terminarem.
+
+    Os resultados concluídos vão para `parciais`; ao final, quem chama junta os
+    que ainda estiverem em `pendentes`.
+    """
+    if limite and len(pendentes) >= limite:
+        concluidos, restantes = wait(pendentes, return_when=FIRST_COMPLETED)
+        pendentes.clear()
+        pendentes.update(restantes)
+        parciais.extend(f.result() for f in concluidos)
+    pendentes.add(executor.submit(_avaliar_bloco_args, (bloco, regras, formato_data)))
+
+
+def verificar_qualidade(caminho, tamanho_bloco=None, n_jobs=None, regras=None, formato_data=None):
+    """Verifica a qualidade do CSV bruto, avaliando os blocos em paralelo.
+
+    No máximo 2 blocos por processo ficam em memória ao mesmo tempo.
+    """
+    tamanho_bloco = tamanho_bloco or TAMANHO_BLOCO_PADRAO
+    formato_data = formato_data or inferir_formato_data(caminho)
+    n_processos = resolver_n_jobs(n_jobs)
+    blocos = ler_csv_em_blocos(caminho, tamanho_bloco)
+
+    if n_processos == 1:
+        return montar_relatorio(combinar_parciais(avaliar_bloco(b, regras, formato_data) for b in blocos), regras)
+
+    parciais = []
+    with ProcessPoolExecutor(max_workers=n_processos) as executor:
+        pendentes = set()
+        for bloco in blocos:
+            submeter_bloco(executor, pendentes, parciais, bloco, regras, formato_data, limite=2 * n_processos)
+        parciais.extend(f.result() for f in pendentes)
+    return montar_relatorio(combinar_parciais(parciais), regras)
+
+
+def salvar_relatorio_qualidade(relatorio, caminho=CAMINHO_RELATORIO_QUALIDADE):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+
+
+def imprimir_relatorio(relatorio):
+    print(f"\nQualidade dos dados: {relatorio['linhas']} linhas, {relatorio['falhas']} regra(s) com falha")
+    for item in relatorio['regras']:
+        if item['status'] == 'ignorada':
+            print(f"  [ignorada] {item['nome']}: colunas ausentes {item['colunas']}")
+            continue
+        print(f"  [{item['status']}] {item['nome']}: {item['violacoes']} violações ({item['taxa']:.2%})")
+        if item['exemplos'] and item['status'] == 'falha':
+            print(f"      exemplos: {', '.join(item['exemplos'][:5])}")
+
+
+if __name__ == "__main__":
+    from data_processor import CAMINHO_DADOS
+
+    parser = argparse.ArgumentParser(description="Verifica a qualidade do CSV bruto de hemovigilância.")
+    parser.add_argument('--tamanho-bloco', type=int, default=None)
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    args = parser.parse_args()
+
+    relatorio = verificar_qualidade(CAMINHO_DADOS, args.tamanho_bloco, args.n_jobs)
+    salvar_relatorio_qualidade(relatorio)
+    imprimir_relatorio(relatorio)
+    print(f"✅ Relatório salvo em {CAMINHO_RELATORIO_QUALIDADE}")
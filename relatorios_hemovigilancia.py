@@ -0,0 +1,144 @@
+"""
+Gravação e leitura dos relatórios tabulares da análise de hemovigilância.
+
+Por padrão os relatórios saem em Parquet (se o pyarrow estiver instalado) e
+em CSV gzip, formatos rápidos de gravar e de recarregar; `carregar_relatorio`
+usa o mais rápido disponível. O xlsx é opcional: gravado em modo streaming
+(planilha write-only do openpyxl, linhas enviadas em blocos), sem montar a
+planilha inteira em memória como o `to_excel`, e o openpyxl só é importado
+quando ele é pedido.
+"""
+
+import importlib
+import os
+
+import pandas as pd
+
+from esquema_hemovigilancia import SEPARADOR_CSV, ENCODING_CSV, aplicar_esquema, colunas_do_tipo, ler_csv
+
+# Em ordem de preferência na leitura.
+FORMATOS_RELATORIO = ('parquet', 'csv.gz', 'xlsx')
+# Gravados quando nenhum formato é pedido; o xlsx é opcional.
+FORMATOS_RELATORIO_PADRAO = ('parquet', 'csv.gz')
+TAMANHO_BLOCO_RELATORIO = 50000
+# Limite de linhas de uma planilha do Excel, já descontado o cabeçalho.
+MAX_LINHAS_PLANILHA = 1048575
+
+
+def _modulo_disponivel(nome):
+    try:
+        importlib.import_module(nome)
+        return True
+    except ImportError:
+        return False
+
+
+def parquet_disponivel():
+    return _modulo_disponivel('pyarrow')
+
+
+def xlsx_disponivel():
+    return _modulo_disponivel('openpyxl')
+
+
+def _linhas(bloco):
+    """Linhas do bloco como tuplas Python, com nulos (NaN/NaT/NA) como células vazias."""
+    valores = bloco.astype(object)
+    return valores.where(bloco.notna(), None).itertuples(index=False, name=None)
+
+
+def escrever_xlsx(df, caminho, tamanho_bloco=TAMANHO_BLOCO_RELATORIO):
+    """Grava o xlsx em modo streaming; acima do limite do Excel, continua em novas planilhas."""
+    from openpyxl import Workbook
+
+    livro = Workbook(write_only=True)
+    cabecalho = [str(c) for c in df.columns]
+    for numero, inicio in enumerate(range(0, max(len(df), 1), MAX_LINHAS_PLANILHA), start=1):
+        planilha = livro.create_sheet(f"dados_{numero}" if numero > 1 else "dados")
+        planilha.append(cabecalho)
+        fim = min(inicio + MAX_LINHAS_PLANILHA, len(df))
+        for i in range(inicio, fim, tamanho_bloco):
+            for linha in _linhas(df.iloc[i:min(i + tamanho_bloco, fim)]):
+                planilha.append(linha)
+    livro.save(caminho)
+
+
+def escrever_csv_gz(df, caminho, tamanho_bloco=TAMANHO_BLOCO_RELATORIO):
+    # Nível 1 de compressão: arquivo pouco maior, gravação várias vezes mais rápida.
+    df.to_csv(caminho, sep=SEPARADOR_CSV, encoding=ENCODING_CSV, index=False, chunksize=tamanho_bloco,
+              compression={'method': 'gzip', 'compresslevel': 1}, errors='replace')
+
+
+def escrever_parquet(df, caminho, tamanho_bloco=TAMANHO_BLOCO_RELATORIO):
+    df.to_parquet(caminho, engine='pyarrow', index=False, row_group_size=tamanho_bloco)
+
+
+ESCRITORES_RELATORIO = {
+    'parquet': escrever_parquet,
+    'csv.gz': escrever_csv_gz,
+    'xlsx': escrever_xlsx,
+}
+
+
+def caminho_relatorio(caminho_base, formato):
+    return f"{caminho_base}.{formato}"
+
+
+def gerar_relatorios(df, caminho_base, formatos=None, tamanho_bloco=TAMANHO_BLOCO_RELATORIO):
+    """Grava `df` em cada formato pedido (padrão: FORMATOS_RELATORIO_PADRAO); retorna {formato: caminho}.
+
+    Cada arquivo é gravado num temporário e renomeado, para que um leitor
+    nunca encontre um relatório pela metade. Parquet é ignorado sem pyarrow
+    e xlsx sem openpyxl.
+    """
+    formatos = FORMATOS_RELATORIO_PADRAO if formatos is None else formatos
+    gerados = {}
+    for formato in formatos:
+        if formato not in ESCRITORES_RELATORIO:
+            raise ValueError(f"Formato inválido: {formato}. Use um de {FORMATOS_RELATORIO}.")
+        if formato == 'parquet' and not parquet_disponivel():
+            print("⚠️ pyarrow não instalado; relatório Parquet não gerado.")
+            continue
+        if formato == 'xlsx' and not xlsx_disponivel():
+            print("⚠️ openpyxl não instalado; relatório xlsx não gerado.")
+            continue
+        caminho = caminho_relatorio(caminho_base, formato)
+        # O temporário mantém a extensão, da qual o pandas deduz a compressão.
+        caminho_temporario = os.path.join(os.path.dirname(caminho), '.tmp_' + os.path.basename(caminho))
+        ESCRITORES_RELATORIO[formato](df, caminho_temporario, tamanho_bloco)
+        os.replace(caminho_temporario, caminho)
+        gerados[formato] = caminho
+    return gerados
+
+
+def _colunas_parquet(caminho, colunas):
+    """Nomes exatos do arquivo Parquet que correspondem a `colunas` (sem distinção de maiúsculas)."""
+    if colunas is None:
+        return None
+    import pyarrow.parquet as pq
+    desejadas = {str(c).upper().strip() for c in colunas}
+    return [c for c in pq.read_schema(caminho).names if str(c).upper().strip() in desejadas]
+
+
+def carregar_relatorio(caminho_base, formatos=None, colunas=None):
+    """Lê o relatório no formato mais rápido disponível; retorna None se nenhum existir.
+
+    `colunas` restringe a leitura, como em `ler_csv`.
+    """
+    for formato in FORMATOS_RELATORIO if formatos is None else formatos:
+        caminho = caminho_relatorio(caminho_base, formato)
+        if not os.path.exists(caminho):
+            continue
+        if formato == 'parquet':
+            if not parquet_disponivel():
+                continue
+            return aplicar_esquema(pd.read_parquet(caminho, columns=_colunas_parquet(caminho, colunas)))
+        if formato == 'csv.gz':
+            return ler_csv(caminho, colunas=colunas)
+        if not xlsx_disponivel():
+            continue
+        # Sem dtype, o read_excel converte identificadores em número e perde os zeros à esquerda.
+        texto = {c: str for c in colunas_do_tipo('texto')}
+        projetar = None if colunas is None else (lambda c: str(c).upper().strip() in {str(n).upper() for n in colunas})
+        return aplicar_esquema(pd.read_excel(caminho, engine='openpyxl', dtype=texto, usecols=projetar))
+    return None
@@ -2,48 +2,78 @@
 let sidebarVisible = window.innerWidth > 768;
 let filterFormVisible = false;
 
-async function carregarOpcoesFiltragem() {
-    try {
-        const response = await fetch('/api/filtros');
-        const data = await response.json();
-
-        
-        const selectUFs = document.getElementById('filter-ufs');
-        if (selectUFs) {
-            data.ufs.forEach(uf => {
-                const option = document.createElement('option');
-                option.value = uf;
-                option.textContent = uf;
-                selectUFs.appendChild(option);
-            });
+const SELECTS_FILTRO = {
+    'ufs': 'filter-ufs',
+    'tipos_evento': 'filter-tipos',
+    'anos': 'filter-anos'
+};
+
+let temporizadorFacetas = null;
+
+function selecaoAtual() {
+    const selecao = {};
+    Object.entries(SELECTS_FILTRO).forEach(([nome, id]) => {
+        const select = document.getElementById(id);
+        if (select) {
+            selecao[nome] = Array.from(select.selectedOptions).map(o => o.value);
         }
+    });
+    return selecao;
+}
 
-        const selectTipos = document.getElementById('filter-tipos');
-        if (selectTipos) {
-            data.tipos_evento.forEach(tipo => {
-                const option = document.createElement('option');
-                option.value = tipo;
-                option.textContent = tipo;
-                selectTipos.appendChild(option);
-            });
-        }
+function parametrosFacetas(selecao) {
+    // Mantém os filtros da URL que não estão no formulário (datas, busca).
+    const params = new URLSearchParams(window.location.search);
+    Object.entries(selecao).forEach(([nome, valores]) => {
+        params.delete(nome);
+        if (valores.length > 0) params.append(nome, valores.join(','));
+    });
+    return params;
+}
 
-        
-        const selectAnos = document.getElementById('filter-anos');
-        if (selectAnos) {
-            data.anos.forEach(ano => {
-                const option = document.createElement('option');
-                option.value = ano;
-                option.textContent = ano;
-                selectAnos.appendChild(option);
-            });
+function atualizarOpcoes(select, opcoes, contagens) {
+    const selecionadas = new Set(Array.from(select.selectedOptions).map(o => o.value));
+    const existentes = new Map(Array.from(select.options).map(o => [o.value, o]));
+
+    opcoes.forEach(valor => {
+        valor = String(valor);
+        let option = existentes.get(valor);
+        if (!option) {
+            option = document.createElement('option');
+            option.value = valor;
+            select.appendChild(option);
         }
+        const quantidade = contagens ? (contagens[valor] || 0) : null;
+        option.textContent = quantidade === null ? valor : `${valor} (${formatarNumero(quantidade)})`;
+        // Opção sem resultados com os outros filtros: desabilitada, a menos que já esteja marcada.
+        option.disabled = quantidade === 0 && !selecionadas.has(valor);
+    });
+}
+
+async function carregarOpcoesFiltragem(selecao = null) {
+    try {
+        const params = parametrosFacetas(selecao || {});
+        const response = await fetch('/api/filtros' + (params.toString() ? '?' + params.toString() : ''));
+        const data = await response.json();
+        const contagens = data.contagens || {};
+
+        Object.entries(SELECTS_FILTRO).forEach(([nome, id]) => {
+            const select = document.getElementById(id);
+            if (select && data[nome]) {
+                atualizarOpcoes(select, data[nome], contagens[nome]);
+            }
+        });
     } catch (error) {
         console.error('Erro ao carregar opções de filtros:', error);
         mostrarNotificacao('Erro ao carregar filtros', 'danger');
     }
 }
 
+function agendarAtualizacaoFacetas() {
+    clearTimeout(temporizadorFacetas);
+    temporizadorFacetas = setTimeout(() => carregarOpcoesFiltragem(selecaoAtual()), 250);
+}
+
 function aplicarFiltros(event) {
     event.preventDefault();
 
@@ -66,6 +96,7 @@ function limparFiltros() {
     document.getElementById('filter-ufs').selectedIndex = 0;
     document.getElementById('filter-tipos').selectedIndex = 0;
     document.getElementById('filter-anos').selectedIndex = 0;
+    agendarAtualizacaoFacetas();
 }
 
 function alternarSidebar() {
@@ -211,14 +242,160 @@ function otimizarGraficosMobile() {
     }
 }
 
+// Figuras do painel já recebidas; cada aba é desenhada na primeira vez que aparece.
+const figurasPainel = {};
+let painelExato = false;
+
+// Gráficos das páginas que podem chegar provisórios (aproximado=1) -> div do Plotly.
+const DIVS_GRAFICOS = {
+    'timeline': 'timeline-chart',
+    'uf': 'uf-chart',
+    'tipo': 'tipo-chart'
+};
+
+function formatarMetrica(nome, valor) {
+    return nome === 'perc_anomalias' ? valor.toFixed(2) + '%' : formatarNumero(Math.round(valor));
+}
+
+function exibirMetricas(metricas) {
+    document.querySelectorAll('[data-metrica]').forEach(el => {
+        const valor = metricas[el.dataset.metrica];
+        if (valor !== undefined && valor !== null) el.textContent = formatarMetrica(el.dataset.metrica, valor);
+    });
+    document.querySelectorAll('[data-intervalo]').forEach(el => {
+        const intervalo = metricas.aproximado && metricas.intervalos ? metricas.intervalos[el.dataset.intervalo] : null;
+        el.classList.toggle('d-none', !intervalo);
+        if (intervalo) {
+            const nome = el.dataset.intervalo;
+            el.textContent = `IC ${Math.round(metricas.confianca * 100)}%: ${formatarMetrica(nome, intervalo[0])} – ${formatarMetrica(nome, intervalo[1])}`;
+        }
+    });
+    document.querySelectorAll('.badge-provisorio').forEach(el => el.classList.toggle('d-none', !metricas.aproximado));
+}
+
+function desenharGraficoPainel(nome) {
+    const container = document.getElementById('painel-' + nome);
+    if (!container || !(nome in figurasPainel) || container.dataset.desenhado) return;
+    const figura = figurasPainel[nome];
+    container.dataset.desenhado = '1';
+    if (!figura) {
+        container.innerHTML = '<div class="alert alert-info mb-0"><i class="fas fa-info-circle me-2"></i> Nenhum dado disponível para o período selecionado.</div>';
+        return;
+    }
+    if (!container.data) container.innerHTML = '';
+    Plotly.react(container, figura.data, figura.layout, {responsive: true});
+}
+
+function aplicarPainel(data) {
+    exibirMetricas(data.metricas);
+    Object.entries(data.graficos).forEach(([nome, figura]) => {
+        figurasPainel[nome] = figura;
+        const container = document.getElementById('painel-' + nome);
+        if (container) delete container.dataset.desenhado;
+    });
+    const painel = document.getElementById('painel');
+    const ativa = painel.querySelector('.tab-pane.active .grafico-painel');
+    if (ativa) desenharGraficoPainel(ativa.id.replace('painel-', ''));
+}
+
+async function buscarPainel(params) {
+    const response = await fetch('/api/painel?' + params.toString());
+    const data = await response.json();
+    if (!response.ok) throw new Error(data.erro || response.statusText);
+    return data;
+}
+
+async function carregarPainel() {
+    const painel = document.getElementById('painel');
+    if (!painel) return;
+
+    painel.querySelectorAll('[data-bs-toggle="tab"]').forEach(aba => {
+        aba.addEventListener('shown.bs.tab', event => {
+            const nome = event.target.dataset.bsTarget.replace('#aba-', '');
+            desenharGraficoPainel(nome);
+            const container = document.getElementById('painel-' + nome);
+            if (container && container.data) Plotly.Plots.resize(container);
+        });
+    });
+
+    if (painel.dataset.estatico) {
+        // Exportação estática: o JSON exato do painel já está gravado ao lado.
+        try {
+            const response = await fetch(painel.dataset.estatico);
+            if (!response.ok) throw new Error(response.statusText);
+            painelExato = true;
+            aplicarPainel(await response.json());
+        } catch (error) {
+            console.error('Erro ao carregar o painel:', error);
+            mostrarNotificacao('Erro ao carregar o painel', 'danger');
+        }
+        return;
+    }
+
+    // Uma requisição traz todas as abas; trocar de aba não volta ao servidor. Em paralelo,
+    // a versão aproximada (amostra) aparece primeiro como provisória, até a exata chegar.
+    const params = new URLSearchParams(window.location.search);
+    params.delete('aproximado');
+    const paramsAproximados = new URLSearchParams(params);
+    paramsAproximados.set('aproximado', '1');
+    paramsAproximados.set('graficos', painel.dataset.aproximados);
+    params.set('graficos', painel.dataset.graficos);
+
+    buscarPainel(paramsAproximados)
+        .then(data => { if (!painelExato) aplicarPainel(data); })
+        .catch(error => console.error('Erro ao carregar a estimativa do painel:', error));
+    try {
+        const data = await buscarPainel(params);
+        painelExato = true;
+        aplicarPainel(data);
+    } catch (error) {
+        console.error('Erro ao carregar o painel:', error);
+        mostrarNotificacao('Erro ao carregar o painel', 'danger');
+    }
+}
+
+async function substituirProvisorios() {
+    // Páginas abertas com aproximado=1: troca as estimativas pelos valores exatos.
+    const container = document.querySelector('[data-provisorio]');
+    if (!container) return;
+    const params = new URLSearchParams(window.location.search);
+    params.delete('aproximado');
+    params.set('graficos', container.dataset.provisorio);
+    try {
+        const data = await buscarPainel(params);
+        Object.entries(data.graficos).forEach(([nome, figura]) => {
+            const div = document.getElementById(DIVS_GRAFICOS[nome]);
+            if (div && figura) Plotly.react(div, figura.data, figura.layout);
+        });
+        if (document.querySelector('[data-metrica]')) {
+            exibirMetricas(data.metricas);
+        } else {
+            document.querySelectorAll('.badge-provisorio').forEach(el => el.classList.add('d-none'));
+        }
+        delete container.dataset.provisorio;
+    } catch (error) {
+        console.error('Erro ao obter os valores exatos:', error);
+    }
+}
+
 document.addEventListener('DOMContentLoaded', function () {
     
-    carregarOpcoesFiltragem();
+    // As opções precisam existir antes de restaurar a seleção da URL.
+    carregarOpcoesFiltragem().then(restaurarFiltrosURL);
 
-    restaurarFiltrosURL();
+    Object.values(SELECTS_FILTRO).forEach(id => {
+        const select = document.getElementById(id);
+        if (select) {
+            select.addEventListener('change', agendarAtualizacaoFacetas);
+        }
+    });
 
     carregarStatus();
 
+    carregarPainel();
+
+    substituirProvisorios();
+
     const filterForm = document.getElementById('filter-form');
     if (filterForm) {
         filterForm.addEventListener('submit', aplicarFiltros);
@@ -0,0 +1,27 @@
+import re
+
+import pandas as pd
+
+from anonimizacao_hemovigilancia import PADROES_PII, anonimizar_dataframe, detectar_pii_dataframe
+
+
+def telefones(texto):
+    return re.findall(PADROES_PII['TELEFONE'], texto)
+
+
+def test_telefone_reconhece_celular_e_fixo_com_ddd():
+    assert telefones('ligar para (11) 98765-4321') == ['(11) 98765-4321']
+    assert telefones('contato 98765-4321') == ['98765-4321']
+    assert telefones('fixo (21)3456-7890 ou 61 2345-6789') == ['(21)3456-7890', '61 2345-6789']
+
+
+def test_telefone_ignora_intervalos_de_anos():
+    assert telefones('surto em 2019-2020 e 2021-2022') == []
+    assert telefones('reação em 2019-2020, com recidiva em 2023-2024') == []
+
+
+def test_intervalo_de_anos_nao_e_anonimizado():
+    df = pd.DataFrame({'DS_ESPECIFICACAO_EVENTO': ['surto em 2019-2020 e 2021-2022', 'tel (11) 98765-4321']})
+    anonimizado, auditoria = anonimizar_dataframe(df)
+    assert anonimizado['DS_ESPECIFICACAO_EVENTO'].tolist() == ['surto em 2019-2020 e 2021-2022', 'tel <TELEFONE>']
+    assert detectar_pii_dataframe(df)['celulas_anonimizadas'] == 1
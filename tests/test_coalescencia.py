@@ -0,0 +1,81 @@
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pytest
+
+import app_hemovigilancia
+import dataset_hemovigilancia
+from dataset_hemovigilancia import definir_carregador, montar_snapshot
+
+N_REQUISICOES = 8
+
+
+def df_minimo():
+    datas = pd.to_datetime(['2022-01-10', '2022-03-05', '2023-02-20', '2023-07-01'])
+    return pd.DataFrame({
+        'UF_NOTIFICACAO': pd.Categorical(['SP', 'RJ', 'SP', 'MG']),
+        'TIPO_REACAO_TRANSFUSIONAL': pd.Categorical(['Febril', 'Alérgica', 'Febril', 'Febril']),
+        'DATA_OCORRENCIA_EVENTO': datas,
+        'DATA_NOTIFICACAO_EVENTO': datas + pd.Timedelta(days=3),
+        'TEMPO_NOTIFICACAO_DIAS': [3.0, 3.0, 3.0, 3.0],
+        'ANOMALIAS': [0, 1, 0, 0],
+    })
+
+
+@pytest.fixture
+def snapshot_de_teste():
+    # Versão única por teste: o cache de respostas não pode ter a página pronta.
+    versao = f"teste:{uuid.uuid4()}"
+    definir_carregador(lambda fontes: montar_snapshot(df_minimo(), versao, 'teste'))
+    yield versao
+    definir_carregador(None)
+
+
+def test_requisicoes_simultaneas_executam_a_view_uma_vez(snapshot_de_teste, monkeypatch):
+    execucoes = []
+    original = app_hemovigilancia.gerar_grafico_metricas
+
+    def metricas_lentas(*args, **kwargs):
+        execucoes.append(threading.current_thread().name)
+        # Mantém a execução em andamento enquanto as demais requisições chegam.
+        time.sleep(0.5)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(app_hemovigilancia, 'gerar_grafico_metricas', metricas_lentas)
+    largada = threading.Barrier(N_REQUISICOES)
+    respostas = [None] * N_REQUISICOES
+
+    def requisitar(i):
+        cliente = app_hemovigilancia.app.test_client()
+        largada.wait()
+        respostas[i] = cliente.get('/visao-geral?ufs=SP,RJ')
+
+    threads = [threading.Thread(target=requisitar, args=(i,)) for i in range(N_REQUISICOES)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    assert len(execucoes) == 1
+    assert all(r is not None and r.status_code == 200 for r in respostas)
+    assert len({r.get_data() for r in respostas}) == 1
+    assert dataset_hemovigilancia.obter_snapshot()['versao'] == snapshot_de_teste
+
+
+def test_parametro_repetido_usa_o_primeiro_valor_como_as_views(snapshot_de_teste, monkeypatch):
+    limiares = []
+    original = app_hemovigilancia.gerar_grafico_metricas
+
+    def metricas_registradas(df, limiar=None):
+        limiares.append(limiar)
+        return original(df, limiar)
+
+    monkeypatch.setattr(app_hemovigilancia, 'gerar_grafico_metricas', metricas_registradas)
+    cliente = app_hemovigilancia.app.test_client()
+    assert cliente.get('/visao-geral?limiar=0.9&limiar=0.1').status_code == 200
+    assert cliente.get('/visao-geral?limiar=0.1&limiar=0.9').status_code == 200
+    # Mesmo primeiro valor: servido do cache, sem executar a view de novo.
+    assert cliente.get('/visao-geral?limiar=0.9&limiar=0.5').status_code == 200
+    assert limiares == [0.9, 0.1]
@@ -0,0 +1,47 @@
+import pandas as pd
+
+from esquema_hemovigilancia import converter_datas, resolver_formato_data
+
+MES_PRIMEIRO = ['01/05/2019 10:00:00', '12/25/2019 10:00:00', '03/31/2020 08:00:00']
+DIA_PRIMEIRO = ['01/05/2019 10:00:00', '25/12/2019 10:00:00', '31/03/2020 08:00:00']
+
+
+def test_formato_mes_primeiro():
+    assert resolver_formato_data(MES_PRIMEIRO) == '%m/%d/%Y %H:%M:%S'
+
+
+def test_formato_dia_primeiro():
+    assert resolver_formato_data(DIA_PRIMEIRO) == '%d/%m/%Y %H:%M:%S'
+
+
+def test_datas_mes_primeiro_nao_viram_nat():
+    df = converter_datas(pd.DataFrame({'DATA_OCORRENCIA_EVENTO': MES_PRIMEIRO}))
+    assert df['DATA_OCORRENCIA_EVENTO'].tolist() == [
+        pd.Timestamp('2019-01-05 10:00'), pd.Timestamp('2019-12-25 10:00'), pd.Timestamp('2020-03-31 08:00'),
+    ]
+
+
+def test_formato_iso_inferido():
+    assert resolver_formato_data(['2020-03-31', '2021-12-01']) == '%Y-%m-%d'
+
+
+def test_amostra_sem_formato_unico_avisa(capsys):
+    assert resolver_formato_data(MES_PRIMEIRO + ['31/03/2020 08:00:00']) == '%m/%d/%Y %H:%M:%S'
+    assert '1 de 4' in capsys.readouterr().out
+
+
+def test_leitura_pelo_esquema_mantem_coluna_do_modelo_de_risco(tmp_path):
+    from esquema_hemovigilancia import ESQUEMA_COLUNAS, ler_csv
+    from features_hemovigilancia import COLUNAS_CATEGORICAS_RISCO
+
+    caminho = tmp_path / 'dados.csv'
+    pd.DataFrame({
+        'NU_NOTIFICACAO': ['0012'],
+        'DATA_OCORRENCIA_EVENTO': [MES_PRIMEIRO[1]],
+        'ETAPA_CICLO_SANGUE': ['Transfusão'],
+        'FORA_DO_ESQUEMA': ['x'],
+    }).to_csv(caminho, sep=';', index=False, encoding='ISO-8859-1')
+    df = ler_csv(caminho, colunas=list(ESQUEMA_COLUNAS))
+    assert set(COLUNAS_CATEGORICAS_RISCO) <= set(ESQUEMA_COLUNAS)
+    assert list(df.columns) == ['NU_NOTIFICACAO', 'DATA_OCORRENCIA_EVENTO', 'ETAPA_CICLO_SANGUE']
+    assert df.loc[0, 'NU_NOTIFICACAO'] == '0012'
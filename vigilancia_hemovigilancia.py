@@ -0,0 +1,293 @@
+"""
+Vigilância incremental de picos nas notificações por UF e por tipo de reação.
+
+Para cada série (UF ou tipo de reação) e cada métrica mensal (número de
+notificações e taxa de anomalias) o estado guarda só a média e a variância
+EWMA e o acumulador CUSUM. Os meses são contados pela data de notificação:
+o mês mais recente dos dados fica "aberto" (ainda recebe notificações) e é
+recontado a cada atualização; quando aparecem notificações de um mês
+posterior, ele é fechado, entra no EWMA/CUSUM e não é mais revisitado.
+
+O estado guarda também uma marca d'água: quantas linhas da fonte já foram
+incorporadas (e o identificador da última delas). A fonte só cresce por
+acréscimo no fim, então cada atualização só converte as datas e conta as
+linhas depois da marca, somando-as ao mês aberto: o custo não cresce com o
+tamanho do histórico. Se a fonte mudar de origem, encolher ou tiver a
+última linha incorporada trocada, o estado é refeito do zero. O estado é
+salvo em disco e compartilhado entre o app Flask e o dashboard.
+"""
+
+import os
+import threading
+
+import joblib
+import numpy as np
+import pandas as pd
+
+CAMINHO_ESTADO_VIGILANCIA = 'data/estado_vigilancia.joblib'
+# Série -> coluna de agrupamento.
+DIMENSOES_VIGILANCIA = {
+    'UF': 'UF_NOTIFICACAO',
+    'TIPO': 'TIPO_REACAO_TRANSFUSIONAL',
+}
+METRICAS_VIGILANCIA = ('notificacoes', 'taxa_anomalias')
+LAMBDA_EWMA = 0.3
+MESES_AQUECIMENTO = 6
+LIMIAR_Z = 3.0
+# CUSUM unilateral (só altas), em desvios-padrão.
+FOLGA_CUSUM = 0.5
+LIMIAR_CUSUM = 5.0
+MAX_ALERTAS = 500
+# Coluna que identifica a última linha incorporada, para conferir a marca d'água.
+COLUNA_IDENTIFICADOR = 'NU_NOTIFICACAO'
+
+_estado_por_versao = {}
+_trava_vigilancia = threading.Lock()
+
+
+def mes_notificacao(df):
+    """Mês de notificação (ano*12 + mês-1) de cada linha, como float (NaN se ausente).
+
+    Os dados processados não trazem DATA_NOTIFICACAO_EVENTO; a data é
+    reconstruída a partir da ocorrência e de TEMPO_NOTIFICACAO_DIAS.
+    """
+    if 'DATA_NOTIFICACAO_EVENTO' in df.columns:
+        datas = df['DATA_NOTIFICACAO_EVENTO']
+    else:
+        datas = df['DATA_OCORRENCIA_EVENTO']
+        if 'TEMPO_NOTIFICACAO_DIAS' in df.columns:
+            datas = datas + pd.to_timedelta(df['TEMPO_NOTIFICACAO_DIAS'].fillna(0), unit='D')
+    if not pd.api.types.is_datetime64_any_dtype(datas):
+        datas = pd.to_datetime(datas, errors='coerce', dayfirst=True)
+    return (datas.dt.year * 12 + datas.dt.month - 1).to_numpy(dtype=float)
+
+
+def _rotulo_mes(indice):
+    return f"{indice // 12:04d}-{indice % 12 + 1:02d}"
+
+
+def estado_inicial():
+    return {
+        'versao': None,
+        'origem': None,
+        'linhas_processadas': 0,
+        'ultima_linha': None,
+        'series': [],
+        'indice': {},
+        'mes_aberto': None,
+        'aberto': {'n': np.zeros(0), 'anomalias': np.zeros(0)},
+        'meses': {m: np.zeros(0, dtype=np.int64) for m in METRICAS_VIGILANCIA},
+        'media': {m: np.zeros(0) for m in METRICAS_VIGILANCIA},
+        'variancia': {m: np.zeros(0) for m in METRICAS_VIGILANCIA},
+        'cusum': {m: np.zeros(0) for m in METRICAS_VIGILANCIA},
+        'ultimo': {m: np.full(0, np.nan) for m in METRICAS_VIGILANCIA},
+        'alertas': [],
+    }
+
+
+def _registrar_series(estado, chaves):
+    """Acrescenta séries novas ao estado (com histórico vazio); retorna os índices das chaves."""
+    novas = [c for c in dict.fromkeys(chaves) if c not in estado['indice']]
+    if novas:
+        for chave in novas:
+            estado['indice'][chave] = len(estado['series'])
+            estado['series'].append(chave)
+        extra = len(novas)
+        for nome in ('n', 'anomalias'):
+            estado['aberto'][nome] = np.concatenate([estado['aberto'][nome], np.zeros(extra)])
+        for m in METRICAS_VIGILANCIA:
+            estado['meses'][m] = np.concatenate([estado['meses'][m], np.zeros(extra, dtype=np.int64)])
+            estado['media'][m] = np.concatenate([estado['media'][m], np.zeros(extra)])
+            estado['variancia'][m] = np.concatenate([estado['variancia'][m], np.zeros(extra)])
+            estado['cusum'][m] = np.concatenate([estado['cusum'][m], np.zeros(extra)])
+            estado['ultimo'][m] = np.concatenate([estado['ultimo'][m], np.full(extra, np.nan)])
+    return np.array([estado['indice'][c] for c in chaves], dtype=np.int64)
+
+
+def _contar(estado, df, mes, mes_inicial):
+    """Contagens e anomalias por série x mês, para os meses a partir de `mes_inicial`."""
+    selecionadas = ~np.isnan(mes) & (mes >= mes_inicial)
+    recorte = df.loc[selecionadas]
+    mes = mes[selecionadas].astype(np.int64) - mes_inicial
+    n_meses = int(mes.max()) + 1 if len(mes) else 0
+    anomalias = recorte['anomalias'].to_numpy(dtype=float) if 'anomalias' in recorte.columns else np.zeros(len(recorte))
+
+    partes = []
+    for dimensao, coluna in DIMENSOES_VIGILANCIA.items():
+        if coluna not in recorte.columns:
+            continue
+        codigos, valores = pd.factorize(recorte[coluna])
+        validas = codigos >= 0
+        linhas = _registrar_series(estado, [(dimensao, str(v)) for v in valores])[codigos[validas]]
+        partes.append((linhas, mes[validas], anomalias[validas]))
+
+    contagens = np.zeros((len(estado['series']), n_meses))
+    soma_anomalias = np.zeros((len(estado['series']), n_meses))
+    for linhas, meses, anomalias_linhas in partes:
+        np.add.at(contagens, (linhas, meses), 1)
+        np.add.at(soma_anomalias, (linhas, meses), anomalias_linhas)
+    return contagens, soma_anomalias
+
+
+def _desvio(metrica, media, variancia, n):
+    """Desvio-padrão EWMA com piso de Poisson (contagens) ou binomial (taxas)."""
+    if metrica == 'notificacoes':
+        piso = np.sqrt(np.maximum(media, 1.0))
+    else:
+        piso = np.sqrt(np.clip(media * (1 - media), 1e-4, None) / np.maximum(n, 1))
+    return np.maximum(np.sqrt(variancia), piso)
+
+
+def _fechar_mes(estado, mes, contagens, soma_anomalias):
+    """Incorpora um mês fechado ao EWMA/CUSUM de todas as séries e registra os alertas."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        valores = {
+            'notificacoes': contagens,
+            'taxa_anomalias': np.where(contagens > 0, soma_anomalias / contagens, np.nan),
+        }
+    for metrica, x in valores.items():
+        media, variancia = estado['media'][metrica], estado['variancia'][metrica]
+        cusum, meses = estado['cusum'][metrica], estado['meses'][metrica]
+        validos = ~np.isnan(x)
+        aquecidas = validos & (meses >= MESES_AQUECIMENTO)
+
+        desvio = _desvio(metrica, media, variancia, contagens)
+        z = np.where(aquecidas, (np.nan_to_num(x) - media) / desvio, 0.0)
+        cusum[aquecidas] = np.maximum(0.0, cusum[aquecidas] + z[aquecidas] - FOLGA_CUSUM)
+        alarme_ewma = aquecidas & (z > LIMIAR_Z)
+        alarme_cusum = aquecidas & (cusum > LIMIAR_CUSUM)
+        for i in np.flatnonzero(alarme_ewma | alarme_cusum):
+            dimensao, serie = estado['series'][i]
+            estado['alertas'].append({
+                'mes': _rotulo_mes(mes),
+                'dimensao': dimensao,
+                'serie': serie,
+                'metrica': metrica,
+                'valor': round(float(x[i]), 4),
+                'esperado': round(float(media[i]), 4),
+                'z': round(float(z[i]), 2),
+                'cusum': round(float(cusum[i]), 2),
+                'detector': 'EWMA' if alarme_ewma[i] else 'CUSUM',
+            })
+        # Depois do alarme o CUSUM recomeça.
+        cusum[alarme_cusum] = 0.0
+
+        primeiros = validos & (meses == 0)
+        media[primeiros] = x[primeiros]
+        seguintes = validos & (meses > 0)
+        diferenca = x[seguintes] - media[seguintes]
+        media[seguintes] += LAMBDA_EWMA * diferenca
+        variancia[seguintes] = (1 - LAMBDA_EWMA) * (variancia[seguintes] + LAMBDA_EWMA * diferenca ** 2)
+        meses[validos] += 1
+        estado['ultimo'][metrica][validos] = x[validos]
+    del estado['alertas'][:-MAX_ALERTAS]
+
+
+def _identificador(df, posicao):
+    if posicao < 1 or COLUNA_IDENTIFICADOR not in df.columns:
+        return None
+    valor = df[COLUNA_IDENTIFICADOR].iat[posicao - 1]
+    return None if pd.isna(valor) else str(valor)
+
+
+def _marca_valida(estado, df, origem):
+    """Se as linhas já incorporadas ao estado continuam no início de `df`."""
+    if 'linhas_processadas' not in estado or estado['origem'] != origem:
+        return False
+    processadas = estado['linhas_processadas']
+    return processadas <= len(df) and _identificador(df, processadas) == estado['ultima_linha']
+
+
+def atualizar_vigilancia(estado, df, versao=None, origem=None):
+    """Incorpora ao estado as linhas de `df` depois da marca d'água; retorna o estado.
+
+    As contagens das linhas novas são somadas às do mês aberto; os meses
+    anteriores ao mais recente são fechados em ordem e o mais recente fica
+    aberto. Reprocessar os mesmos dados não altera o estado.
+    """
+    if estado is None or not _marca_valida(estado, df, origem):
+        estado = estado_inicial()
+    novas = df.iloc[estado['linhas_processadas']:]
+    estado.update({'versao': versao, 'origem': origem, 'linhas_processadas': len(df),
+                   'ultima_linha': _identificador(df, len(df))})
+    mes = mes_notificacao(novas)
+    if np.isnan(mes).all():
+        return estado
+
+    mes_inicial = int(np.nanmin(mes)) if estado['mes_aberto'] is None else estado['mes_aberto']
+    contagens, soma_anomalias = _contar(estado, novas, mes, mes_inicial)
+    # Nada a partir do mês aberto: mantém o que já havia.
+    if contagens.shape[1]:
+        if estado['mes_aberto'] is not None:
+            contagens[:, 0] += estado['aberto']['n']
+            soma_anomalias[:, 0] += estado['aberto']['anomalias']
+        for deslocamento in range(contagens.shape[1] - 1):
+            _fechar_mes(estado, mes_inicial + deslocamento,
+                        contagens[:, deslocamento], soma_anomalias[:, deslocamento])
+        estado['mes_aberto'] = mes_inicial + contagens.shape[1] - 1
+        estado['aberto'] = {'n': contagens[:, -1], 'anomalias': soma_anomalias[:, -1]}
+    return estado
+
+
+def rotulo_mes_aberto(estado):
+    """Mês ainda aberto (AAAA-MM), cujas contagens são parciais; None sem dados."""
+    return None if estado['mes_aberto'] is None else _rotulo_mes(estado['mes_aberto'])
+
+
+def resumo_series(estado):
+    """Situação atual de cada série: último mês fechado, média EWMA, CUSUM e mês aberto."""
+    linhas = []
+    for i, (dimensao, serie) in enumerate(estado['series']):
+        linha = {'dimensao': dimensao, 'serie': serie, 'mes_aberto_parcial': int(estado['aberto']['n'][i])}
+        for m in METRICAS_VIGILANCIA:
+            linha[f'{m}_ultimo'] = None if np.isnan(estado['ultimo'][m][i]) else round(float(estado['ultimo'][m][i]), 4)
+            linha[f'{m}_ewma'] = round(float(estado['media'][m][i]), 4)
+            linha[f'{m}_cusum'] = round(float(estado['cusum'][m][i]), 2)
+        linhas.append(linha)
+    return linhas
+
+
+def filtrar_alertas(estado, dimensoes=None, series=None, metricas=None, limite=None):
+    """Alertas do estado, do mais recente para o mais antigo, opcionalmente filtrados."""
+    alertas = [
+        a for a in reversed(estado['alertas'])
+        if (not dimensoes or a['dimensao'] in dimensoes)
+        and (not series or a['serie'] in series)
+        and (not metricas or a['metrica'] in metricas)
+    ]
+    return alertas[:limite] if limite else alertas
+
+
+def salvar_vigilancia(estado, caminho=CAMINHO_ESTADO_VIGILANCIA):
+    caminho_temporario = caminho + '.tmp'
+    joblib.dump(estado, caminho_temporario)
+    os.replace(caminho_temporario, caminho)
+
+
+def carregar_vigilancia(caminho=CAMINHO_ESTADO_VIGILANCIA):
+    """Estado salvo, ou None se não existir ou não puder ser lido."""
+    if not os.path.exists(caminho):
+        return None
+    try:
+        return joblib.load(caminho)
+    except Exception as e:
+        print(f"⚠️ Não foi possível carregar o estado da vigilância: {e}")
+        return None
+
+
+def obter_vigilancia(snapshot, caminho=CAMINHO_ESTADO_VIGILANCIA):
+    """Estado da vigilância atualizado com o snapshot (só se a versão dos dados mudou)."""
+    versao = snapshot['versao']
+    with _trava_vigilancia:
+        estado = _estado_por_versao.get(versao)
+        if estado is None:
+            estado = carregar_vigilancia(caminho)
+            if estado is None or estado['versao'] != versao:
+                estado = atualizar_vigilancia(estado, snapshot['df'], versao, snapshot.get('origem'))
+                try:
+                    salvar_vigilancia(estado, caminho)
+                except OSError as e:
+                    print(f"⚠️ Não foi possível salvar o estado da vigilância: {e}")
+            _estado_por_versao.clear()
+            _estado_por_versao[versao] = estado
+    return estado